@@ -8,6 +8,7 @@ from quamash import QEventLoop, QtWidgets, QtCore
 
 from artiq.protocols.sync_struct import Subscriber, process_mod
 from artiq.protocols import pyon
+from artiq.protocols.shared_memory import decode_segments
 from artiq.protocols.pipe_ipc import AsyncioChildComm
 
 
@@ -50,8 +51,17 @@ class AppletIPCClient(AsyncioChildComm):
                 if action == "terminate":
                     self.close_cb()
                     return
-                elif action == "mod":
-                    mod = obj["mod"]
+                elif action in {"mod", "mod_shm"}:
+                    if action == "mod_shm":
+                        segments = obj["segments"]
+                        try:
+                            mod = decode_segments(obj["mod"], segments)
+                        finally:
+                            self.write_pyon({
+                                "action": "release",
+                                "segments": [path for path, _ in segments]})
+                    else:
+                        mod = obj["mod"]
                     if mod["action"] == "init":
                         data = self.init_cb(mod["struct"])
                     else:
@@ -64,9 +74,10 @@ class AppletIPCClient(AsyncioChildComm):
                              exc_info=True)
                 self.close_cb()
 
-    def subscribe(self, datasets, init_cb, mod_cb):
+    def subscribe(self, datasets, init_cb, mod_cb, shared_memory=False):
         self.write_pyon({"action": "subscribe",
-                         "datasets": datasets})
+                         "datasets": datasets,
+                         "shared_memory": shared_memory})
         self.init_cb = init_cb
         self.mod_cb = mod_cb
         asyncio.ensure_future(self.listen())
@@ -83,6 +94,10 @@ class SimpleApplet:
             "--update-delay", type=float, default=default_update_delay,
             help="time to wait after a mod (buffering other mods) "
                  "before updating (default: %(default).2f)")
+        self.argparser.add_argument(
+            "--shared-memory", default=False, action="store_true",
+            help="in embedded mode, receive large arrays through "
+                 "shared memory instead of the pipe")
 
         group = self.argparser.add_argument_group("standalone mode (default)")
         group.add_argument(
@@ -204,7 +219,8 @@ class SimpleApplet:
             self.loop.run_until_complete(self.subscriber.connect(
                 self.args.server, self.args.port))
         else:
-            self.ipc.subscribe(self.datasets, self.sub_init, self.sub_mod)
+            self.ipc.subscribe(self.datasets, self.sub_init, self.sub_mod,
+                               self.args.shared_memory)
 
     def unsubscribe(self):
         if self.embed is None:
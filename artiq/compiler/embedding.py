@@ -666,26 +666,135 @@ class StitchingInferencer(Inferencer):
                                     loc=node.loc,
                                     self_loc=node.self_loc)
 
-class TypedtreeHasher(algorithm.Visitor):
-    def generic_visit(self, node):
-        def freeze(obj):
-            if isinstance(obj, ast.AST):
-                return self.visit(obj)
-            elif isinstance(obj, types.Type):
-                return hash(obj.find())
-            else:
-                # We don't care; only types change during inference.
-                pass
+class TypedtreeDependencies(algorithm.Visitor):
+    """
+    Collects what the result of inference for a typedtree depends on:
+    the type variables it refers to, and the attributes it accesses that
+    are not known yet. As long as all of those are unchanged, inferring
+    the typedtree again will not change it.
+    """
+
+    def __init__(self):
+        self.tvars = []
+        self.attributes = []
+        self.visited = set()
+
+    def settled(self):
+        return all(tvar.parent is tvar for tvar in self.tvars) and \
+            all(attr not in attributes for attributes, attr in self.attributes)
+
+    def visit_type(self, typ):
+        typ = typ.find()
+        if id(typ) in self.visited:
+            return
+        self.visited.add(id(typ))
+
+        if isinstance(typ, types.TVar):
+            self.tvars.append(typ)
+        elif isinstance(typ, types.TMono):
+            for param in typ.params.values():
+                self.visit_type(param)
+        elif isinstance(typ, types.TTuple):
+            for elt in typ.elts:
+                self.visit_type(elt)
+        elif isinstance(typ, types.TFunction):
+            for arg in list(typ.args.values()) + list(typ.optargs.values()):
+                self.visit_type(arg)
+            self.visit_type(typ.ret)
+            self.visit_type(typ.delay)
+        elif isinstance(typ, types.TRPC):
+            self.visit_type(typ.ret)
+        elif isinstance(typ, types.TConstructor):
+            self.visit_type(typ.instance)
 
+    def generic_visit(self, node):
         fields = node._fields
         if hasattr(node, '_types'):
             fields = fields + node._types
-        return hash(tuple(freeze(getattr(node, field_name)) for field_name in fields))
+        for field_name in fields:
+            value = getattr(node, field_name)
+            if isinstance(value, types.Type):
+                self.visit_type(value)
+            else:
+                self.visit(value)
+
+    def visit_AttributeT(self, node):
+        self.generic_visit(node)
+
+        # The type of the attribute is determined by the attributes
+        # of the object type, which are shared between all accesses.
+        object_type = node.value.type.find()
+        if types.is_var(object_type):
+            pass
+        elif node.attr in object_type.attributes:
+            self.visit_type(object_type.attributes[node.attr])
+        elif types.is_instance(object_type) and \
+                node.attr in object_type.constructor.attributes:
+            self.visit_type(object_type.constructor.attributes[node.attr])
+        else:
+            self.attributes.append((object_type.attributes, node.attr))
+            if types.is_instance(object_type):
+                self.attributes.append((object_type.constructor.attributes, node.attr))
+
+def _copy_parsetree(node):
+    if isinstance(node, list):
+        return [_copy_parsetree(elt) for elt in node]
+    elif isinstance(node, ast.AST):
+        # Locations and other non-node fields are immutable and can be shared.
+        copy = node.__class__.__new__(node.__class__)
+        copy.__dict__.update(node.__dict__)
+        for field_name in node._fields:
+            setattr(copy, field_name, _copy_parsetree(getattr(node, field_name)))
+        return copy
+    else:
+        return node
+
+class ParseCache:
+    """
+    A cache of the parse trees of embedded functions, which can be shared
+    by several :class:`Stitcher` instances so that the source of every
+    function is only extracted and parsed once.
+
+    Parse trees are keyed by code object, which determines the source
+    of the function; closures and methods created from the same definition
+    share one entry. Since typing a parse tree rewrites it in place,
+    every lookup returns a copy.
+
+    :param max_entries: maximum number of parse trees kept.
+
+    :var hits: number of lookups that were answered from the cache.
+    :var misses: number of lookups that were not.
+    """
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, code, parse):
+        """Return a copy of the parse tree of ``code``, calling ``parse``
+        to create it if it is not in the cache."""
+        if code in self.entries:
+            self.entries.move_to_end(code)
+            self.hits += 1
+            node = self.entries[code]
+        else:
+            self.misses += 1
+            node = parse()
+            if self.max_entries > 0:
+                self.entries[code] = node
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+        return _copy_parsetree(node)
+
+    def clear(self):
+        self.entries.clear()
 
 class Stitcher:
-    def __init__(self, core, dmgr, engine=None):
+    def __init__(self, core, dmgr, engine=None, parse_cache=None):
         self.core = core
         self.dmgr = dmgr
+        self.parse_cache = parse_cache
         if engine is None:
             self.engine = diagnostic.Engine(all_errors_are_fatal=True)
         else:
@@ -719,17 +828,27 @@ class Stitcher:
         inferencer = StitchingInferencer(engine=self.engine,
                                          value_map=self.value_map,
                                          quote=self._quote)
-        hasher = TypedtreeHasher()
 
-        # Iterate inference to fixed point.
-        old_typedtree_hash = None
+        # Iterate inference to fixed point. A top-level node is only inferred
+        # again if anything its types depend on changed since it was last
+        # inferred, or if new host values (whose attributes have to be checked)
+        # were quoted in the meantime.
+        dependencies = {}
+        old_value_count = None
         while True:
-            inferencer.visit(self.typedtree)
-            typedtree_hash = hasher.visit(self.typedtree)
-
-            if old_typedtree_hash == typedtree_hash:
+            value_count = sum(map(len, self.value_map.values()))
+            worklist = [node for node in self.typedtree
+                        if value_count != old_value_count or
+                            id(node) not in dependencies or
+                            not dependencies[id(node)].settled()]
+            if not worklist:
                 break
-            old_typedtree_hash = typedtree_hash
+            old_value_count = value_count
+
+            for node in worklist:
+                inferencer.visit(node)
+                dependencies[id(node)] = TypedtreeDependencies()
+                dependencies[id(node)].visit(node)
 
         # When we have an excess of type information, sometimes we can infer every type
         # in the AST without discovering every referenced attribute of host objects, so
@@ -789,12 +908,8 @@ class Stitcher:
         if not hasattr(host_function, "artiq_embedded"):
             raise ValueError("{} is not an embedded function".format(repr(host_function)))
 
-        # Extract function source.
         embedded_function = host_function.artiq_embedded.function
-        source_code = inspect.getsource(embedded_function)
-        filename = embedded_function.__code__.co_filename
         module_name = embedded_function.__globals__['__name__']
-        first_line = embedded_function.__code__.co_firstlineno
 
         # Extract function environment.
         host_environment = dict()
@@ -803,20 +918,12 @@ class Stitcher:
         cell_names = embedded_function.__code__.co_freevars
         host_environment.update({var: cells[index] for index, var in enumerate(cell_names)})
 
-        # Find out how indented we are.
-        initial_whitespace = re.search(r"^\s*", source_code).group(0)
-        initial_indent = len(initial_whitespace.expandtabs())
-
         # Parse.
-        source_buffer = source.Buffer(source_code, filename, first_line)
-        lexer = source_lexer.Lexer(source_buffer, version=sys.version_info[0:2],
-                                   diagnostic_engine=self.engine)
-        lexer.indent = [(initial_indent,
-                         source.Range(source_buffer, 0, len(initial_whitespace)),
-                         initial_whitespace)]
-        parser = source_parser.Parser(lexer, version=sys.version_info[0:2],
-                                      diagnostic_engine=self.engine)
-        function_node = parser.file_input().body[0]
+        if self.parse_cache is None:
+            function_node = self._parse_function(embedded_function)
+        else:
+            function_node = self.parse_cache.get(embedded_function.__code__,
+                lambda: self._parse_function(embedded_function))
 
         # Mangle the name, since we put everything into a single module.
         full_function_name = "{}.{}".format(module_name, host_function.__qualname__)
@@ -851,6 +958,27 @@ class Stitcher:
 
         return function_node
 
+    def _parse_function(self, function):
+        # Extract function source.
+        source_code = inspect.getsource(function)
+        filename = function.__code__.co_filename
+        first_line = function.__code__.co_firstlineno
+
+        # Find out how indented we are.
+        initial_whitespace = re.search(r"^\s*", source_code).group(0)
+        initial_indent = len(initial_whitespace.expandtabs())
+
+        # Parse.
+        source_buffer = source.Buffer(source_code, filename, first_line)
+        lexer = source_lexer.Lexer(source_buffer, version=sys.version_info[0:2],
+                                   diagnostic_engine=self.engine)
+        lexer.indent = [(initial_indent,
+                         source.Range(source_buffer, 0, len(initial_whitespace)),
+                         initial_whitespace)]
+        parser = source_parser.Parser(lexer, version=sys.version_info[0:2],
+                                      diagnostic_engine=self.engine)
+        return parser.file_input().body[0]
+
     def _function_loc(self, function):
         filename = function.__code__.co_filename
         line     = function.__code__.co_firstlineno
@@ -0,0 +1,174 @@
+"""
+The :class:`LibraryCache` class is a content-addressed store for the
+binary artifacts (linked and stripped shared libraries) produced by
+:class:`artiq.compiler.targets.Target`.
+
+Since the values of host objects are embedded into the generated LLVM IR,
+the textual LLVM IR together with the target description fully determines
+the resulting library; it is therefore used as the cache key, which allows
+to skip LLVM optimization, code generation, linking and stripping when
+the same kernel is compiled again.
+"""
+
+import os
+import hashlib
+import tempfile
+import logging
+from collections import OrderedDict
+
+from artiq import __version__ as artiq_version
+
+
+__all__ = ["LibraryCache"]
+
+
+logger = logging.getLogger(__name__)
+
+
+class LibraryCache:
+    """An in-memory LRU cache of compiled libraries, optionally backed
+    by a directory on disk.
+
+    :param directory: directory where cache entries are persisted.
+        If ``None``, the cache only lives in memory.
+    :param max_entries: maximum number of entries kept in memory.
+    :param max_size: maximum total size (in bytes) of the entries kept in
+        memory. The on-disk cache is capped to the same size.
+
+    :var hits: number of lookups that were answered from the cache.
+    :var misses: number of lookups that were not.
+    :var evictions: number of entries evicted from memory or from disk.
+    """
+    def __init__(self, directory=None, max_entries=64, max_size=64*1024*1024):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_size = max_size
+
+        self.entries = OrderedDict()
+        self.size = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def key(self, *parts):
+        """Compute the cache key of an artifact derived from ``parts``,
+        which are strings or bytes."""
+        digest = hashlib.sha256()
+        digest.update(artiq_version.encode())
+        for part in parts:
+            if isinstance(part, str):
+                part = part.encode()
+            digest.update(len(part).to_bytes(8, "little"))
+            digest.update(part)
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key[2:])
+
+    def get(self, key):
+        """Return the artifact stored under ``key``, or ``None``."""
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+
+        if self.directory is not None:
+            path = self._path(key)
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+            except FileNotFoundError:
+                pass
+            else:
+                try:
+                    os.utime(path)
+                except OSError:
+                    pass
+                self._insert(key, data)
+                self.hits += 1
+                return data
+
+        self.misses += 1
+        return None
+
+    def put(self, key, data):
+        """Store the artifact ``data`` under ``key``."""
+        self._insert(key, data)
+        if self.directory is not None:
+            try:
+                self._write(key, data)
+                self._trim_directory()
+            except OSError:
+                logger.warning("failed to write compilation cache entry %s",
+                               key, exc_info=True)
+
+    def _insert(self, key, data):
+        if key in self.entries:
+            self.size -= len(self.entries.pop(key))
+        if len(data) > self.max_size or self.max_entries <= 0:
+            return
+        self.entries[key] = data
+        self.size += len(data)
+        while len(self.entries) > self.max_entries or self.size > self.max_size:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= len(evicted)
+            self.evictions += 1
+
+    def _write(self, key, data):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with open(fd, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except:
+            os.unlink(temp_path)
+            raise
+
+    def _trim_directory(self):
+        files = []
+        total_size = 0
+        for dirpath, _, filenames in os.walk(self.directory):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files.append((st.st_mtime, st.st_size, path))
+                total_size += st.st_size
+
+        files.sort()
+        for _, size, path in files:
+            if total_size <= self.max_size:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
+            self.evictions += 1
+
+    def clear(self):
+        """Remove all entries from memory and from disk."""
+        self.entries.clear()
+        self.size = 0
+        if self.directory is not None:
+            for dirpath, _, filenames in os.walk(self.directory):
+                for filename in filenames:
+                    os.unlink(os.path.join(dirpath, filename))
+
+    def stats(self):
+        """Return a dictionary with the cache counters and occupancy."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self.entries),
+            "size": self.size
+        }
@@ -11,6 +11,7 @@ string and infers types for it using a trivial :module:`prelude`.
 import os
 from pythonparser import source, diagnostic, parse_buffer
 from . import prelude, types, transforms, analyses, validators
+from .profiler import NullProfiler
 
 class Source:
     def __init__(self, source_buffer, engine=None):
@@ -40,7 +41,8 @@ class Source:
             return cls(source.Buffer(f.read(), filename, 1), engine=engine)
 
 class Module:
-    def __init__(self, src, ref_period=1e-6, attribute_writeback=True, remarks=False):
+    def __init__(self, src, ref_period=1e-6, attribute_writeback=True, remarks=False,
+                 profiler=None):
         self.attribute_writeback = attribute_writeback
         self.engine = src.engine
         self.embedding_map = src.embedding_map
@@ -64,21 +66,38 @@ class Module:
         interleaver = transforms.Interleaver(engine=self.engine)
         invariant_detection = analyses.InvariantDetection(engine=self.engine)
 
-        cast_monomorphizer.visit(src.typedtree)
-        int_monomorphizer.visit(src.typedtree)
-        inferencer.visit(src.typedtree)
-        monomorphism_validator.visit(src.typedtree)
-        escape_validator.visit(src.typedtree)
-        iodelay_estimator.visit_fixpoint(src.typedtree)
-        constness.visit(src.typedtree)
-        devirtualization.visit(src.typedtree)
-        self.artiq_ir = artiq_ir_generator.visit(src.typedtree)
-        artiq_ir_generator.annotate_calls(devirtualization)
-        dead_code_eliminator.process(self.artiq_ir)
-        interleaver.process(self.artiq_ir)
-        local_access_validator.process(self.artiq_ir)
+        if profiler is None:
+            profiler = NullProfiler()
+        typedtree = src.typedtree
+
+        with profiler.measure("CastMonomorphizer", typedtree):
+            cast_monomorphizer.visit(typedtree)
+        with profiler.measure("IntMonomorphizer", typedtree):
+            int_monomorphizer.visit(typedtree)
+        with profiler.measure("Inferencer", typedtree):
+            inferencer.visit(typedtree)
+        with profiler.measure("MonomorphismValidator", typedtree):
+            monomorphism_validator.visit(typedtree)
+        with profiler.measure("EscapeValidator", typedtree):
+            escape_validator.visit(typedtree)
+        with profiler.measure("IODelayEstimator", typedtree):
+            iodelay_estimator.visit_fixpoint(typedtree)
+        with profiler.measure("Constness", typedtree):
+            constness.visit(typedtree)
+        with profiler.measure("Devirtualization", typedtree):
+            devirtualization.visit(typedtree)
+        with profiler.measure("ARTIQIRGenerator", lambda: self.artiq_ir):
+            self.artiq_ir = artiq_ir_generator.visit(typedtree)
+            artiq_ir_generator.annotate_calls(devirtualization)
+        profiler.process_functions("DeadCodeEliminator",
+                                   dead_code_eliminator, self.artiq_ir)
+        profiler.process_functions("Interleaver",
+                                   interleaver, self.artiq_ir)
+        profiler.process_functions("LocalAccessValidator",
+                                   local_access_validator, self.artiq_ir)
         if remarks:
-            invariant_detection.process(self.artiq_ir)
+            with profiler.measure("InvariantDetection", self.artiq_ir):
+                invariant_detection.process(self.artiq_ir)
 
     def build_llvm_ir(self, target):
         """Compile the module to LLVM IR for the specified target."""
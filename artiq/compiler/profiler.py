@@ -0,0 +1,196 @@
+"""
+The :class:`Profiler` class records the wall time, memory allocations
+and size of the intermediate representation of every compiler pass,
+broken down by function where possible.
+
+Profiling is opt-in: a :class:`Profiler` is passed to
+:class:`artiq.compiler.module.Module` (and used by the core device
+driver when the ``ARTIQ_PROFILE_COMPILER`` environment variable is set).
+The results can be written as JSON, or in the folded stack format that
+is accepted by flame graph tools such as ``flamegraph.pl`` and speedscope.
+"""
+
+import time
+import json
+import tracemalloc
+
+from pythonparser import ast
+from . import ir
+
+
+def _count_nodes(node):
+    count = 0
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, list):
+            stack.extend(node)
+        elif isinstance(node, ast.AST):
+            count += 1
+            stack.extend(getattr(node, field_name) for field_name in node._fields)
+    return count
+
+def _tree_sizes(tree):
+    """Return a dict mapping the function names to the number of AST nodes
+    (for a typed AST) or ARTIQ IR instructions (for a list of functions)."""
+    sizes = {}
+    if isinstance(tree, list):
+        for func in tree:
+            if isinstance(func, ir.Function):
+                sizes[func.name] = sum(len(block.instructions)
+                                       for block in func.basic_blocks)
+    elif isinstance(tree, ast.Module):
+        for stmt in tree.body:
+            if isinstance(stmt, ast.FunctionDef):
+                name = stmt.name
+            else:
+                name = "<module>"
+            sizes[name] = sizes.get(name, 0) + _count_nodes(stmt)
+    return sizes
+
+
+class _Measurement:
+    def __init__(self, profiler, record, tree):
+        self.profiler = profiler
+        self.record = record
+        self.tree = tree
+
+    def __enter__(self):
+        self.started_tracing = False
+        if self.profiler.allocations:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self.started_tracing = True
+            self.memory = tracemalloc.get_traced_memory()[0]
+        self.start = time.perf_counter()
+        return self.record
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.record["time"] = time.perf_counter() - self.start
+        if self.profiler.allocations:
+            self.record["allocated"] = tracemalloc.get_traced_memory()[0] - self.memory
+            if self.started_tracing:
+                tracemalloc.stop()
+        if exc_type is None and self.tree is not None:
+            tree = self.tree() if callable(self.tree) else self.tree
+            functions = self.record["functions"]
+            for name, size in _tree_sizes(tree).items():
+                functions.setdefault(name, {})["size"] = size
+        self.profiler.records.append(self.record)
+
+
+class _Context:
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.profiler.contexts.append(self.name)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.profiler.contexts.pop()
+
+
+class _NullMeasurement:
+    def __enter__(self):
+        return None
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+class Profiler:
+    """
+    Compiler pass profiler.
+
+    Every measured pass produces a record, which is a dict with the keys:
+
+    * ``stack``: the list of the enclosing contexts (see :meth:`context`)
+      followed by the pass name;
+    * ``time``: the wall time taken by the pass, in seconds;
+    * ``allocated``: the net amount of memory allocated by the pass, in bytes,
+      if allocation tracing is enabled;
+    * ``functions``: a dict mapping function names to a dict with
+      the size of the function after the pass (``size``, in AST nodes or
+      ARTIQ IR instructions) and, for passes that process the functions
+      one by one, the time spent in each function (``time``).
+
+    :param allocations: if true, trace memory allocations with
+        :mod:`tracemalloc`. This slows down compilation considerably.
+    """
+    def __init__(self, allocations=False):
+        self.allocations = allocations
+        self.records = []
+        self.contexts = []
+
+    def context(self, name):
+        """Return a context manager that prefixes the stacks of the passes
+        measured inside it with ``name`` (e.g. the name of the kernel)."""
+        return _Context(self, name)
+
+    def measure(self, name, tree=None):
+        """
+        Return a context manager that measures the pass ``name``.
+
+        :param tree: the typed AST or the list of ARTIQ IR functions
+            that the pass works on, or a function returning it;
+            its size is recorded after the pass.
+        """
+        record = {
+            "stack": self.contexts + [name],
+            "time": None,
+            "allocated": None,
+            "functions": {},
+        }
+        return _Measurement(self, record, tree)
+
+    def process_functions(self, name, pass_, functions):
+        """Run the ARTIQ IR pass ``pass_`` by calling its ``process_function``
+        method on each of ``functions``, measuring every call."""
+        with self.measure(name, functions) as record:
+            for func in functions:
+                start = time.perf_counter()
+                pass_.process_function(func)
+                record["functions"].setdefault(func.name, {})["time"] = \
+                    time.perf_counter() - start
+
+    def clear(self):
+        del self.records[:]
+
+    def to_json(self):
+        return json.dumps({"passes": self.records}, indent=2, sort_keys=True)
+
+    def to_folded(self):
+        """Return the records in the folded stack format, with one line
+        per stack and the time in microseconds."""
+        lines = []
+        for record in self.records:
+            stack = ";".join(record["stack"])
+            self_time = record["time"]
+            for function_name, function in sorted(record["functions"].items()):
+                if "time" in function:
+                    self_time -= function["time"]
+                    lines.append("{};{} {}".format(stack, function_name,
+                                                   round(function["time"] * 1e6)))
+            lines.append("{} {}".format(stack, round(max(self_time, 0) * 1e6)))
+        return "".join(line + "\n" for line in lines)
+
+    def write(self, prefix):
+        """Write the records to ``prefix.json`` and ``prefix.folded``."""
+        with open(prefix + ".json", "w") as f:
+            f.write(self.to_json())
+        with open(prefix + ".folded", "w") as f:
+            f.write(self.to_folded())
+
+
+class NullProfiler:
+    """A profiler that does not measure anything, used when profiling
+    is disabled."""
+    def context(self, name):
+        return _NullMeasurement()
+
+    def measure(self, name, tree=None):
+        return _NullMeasurement()
+
+    def process_functions(self, name, pass_, functions):
+        pass_.process(functions)
@@ -1,4 +1,5 @@
 import os, sys, tempfile, subprocess
+from collections import OrderedDict
 from artiq.compiler import types
 from llvmlite_artiq import ir as ll, binding as llvm
 
@@ -6,6 +7,25 @@ llvm.initialize()
 llvm.initialize_all_targets()
 llvm.initialize_all_asmprinters()
 
+# LLVM target machines and pass managers are expensive to create and do not
+# depend on the module being compiled, so they are shared by all instances
+# of Target.
+_target_machines = {}
+_pass_managers = {}
+
+# Backtraces and demangled names are memoized, since experiments often raise
+# the same exceptions from the same kernels repeatedly, and addr2line and
+# c++filt are slow to start. Libraries are compared by content, which is
+# fast for the library objects returned by the compilation cache.
+_symbolized_libraries = OrderedDict() # library -> {address: [backtrace entry]}
+_symbolized_libraries_max = 16
+_demangled_names = {}
+_demangled_names_max = 65536
+
+def _compile_object(target, llir):
+    # Runs in the worker processes of Target.compile_and_link.
+    return target.assemble(target.compile_llvm_ir(llir))
+
 class RunTool:
     def __init__(self, pattern, **tempdata):
         self.files = []
@@ -81,15 +101,34 @@ class Target:
     def __init__(self):
         self.llcontext = ll.Context()
 
-    def target_machine(self):
-        lltarget = llvm.Target.from_triple(self.triple)
-        llmachine = lltarget.create_target_machine(
-                        features=",".join(["+{}".format(f) for f in self.features]),
-                        reloc="pic", codemodel="default")
-        llmachine.set_asm_verbosity(True)
-        return llmachine
+    def __getstate__(self):
+        # Targets are sent to worker processes to compile LLVM IR, which
+        # does not involve the llvmlite.ir context.
+        state = self.__dict__.copy()
+        del state["llcontext"]
+        return state
 
-    def optimize(self, llmodule):
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.llcontext = ll.Context()
+
+    def target_machine(self):
+        key = self.triple, tuple(self.features)
+        if key not in _target_machines:
+            lltarget = llvm.Target.from_triple(self.triple)
+            llmachine = lltarget.create_target_machine(
+                            features=",".join(["+{}".format(f) for f in self.features]),
+                            reloc="pic", codemodel="default")
+            llmachine.set_asm_verbosity(True)
+            _target_machines[key] = llmachine
+        return _target_machines[key]
+
+    def pass_manager(self):
+        if type(self) not in _pass_managers:
+            _pass_managers[type(self)] = self.create_pass_manager()
+        return _pass_managers[type(self)]
+
+    def create_pass_manager(self):
         llpassmgr = llvm.create_module_pass_manager()
 
         # Register our alias analysis passes.
@@ -118,10 +157,13 @@ class Target:
         llpassmgr.add_dead_arg_elimination_pass()
         llpassmgr.add_global_dce_pass()
 
-        llpassmgr.run(llmodule)
+        return llpassmgr
 
-    def compile(self, module):
-        """Compile the module to a relocatable object for this target."""
+    def optimize(self, llmodule):
+        self.pass_manager().run(llmodule)
+
+    def build_llvm_ir(self, module):
+        """Generate the textual LLVM IR of the module for this target."""
 
         if os.getenv("ARTIQ_DUMP_SIG"):
             print("====== MODULE_SIGNATURE DUMP ======", file=sys.stderr)
@@ -131,13 +173,16 @@ class Target:
         _dump(os.getenv("ARTIQ_DUMP_IR"), "ARTIQ IR", ".txt",
               lambda: "\n".join(fn.as_entity(type_printer) for fn in module.artiq_ir))
 
-        llmod = module.build_llvm_ir(self)
+        return str(module.build_llvm_ir(self))
+
+    def compile_llvm_ir(self, llir):
+        """Parse, verify and optimize the textual LLVM IR."""
 
         try:
-            llparsedmod = llvm.parse_assembly(str(llmod))
+            llparsedmod = llvm.parse_assembly(llir)
             llparsedmod.verify()
         except RuntimeError:
-            _dump("", "LLVM IR (broken)", ".ll", lambda: str(llmod))
+            _dump("", "LLVM IR (broken)", ".ll", lambda: llir)
             raise
 
         _dump(os.getenv("ARTIQ_DUMP_UNOPT_LLVM"), "LLVM IR (generated)", "_unopt.ll",
@@ -150,6 +195,10 @@ class Target:
 
         return llparsedmod
 
+    def compile(self, module):
+        """Compile the module to a relocatable object for this target."""
+        return self.compile_llvm_ir(self.build_llvm_ir(module))
+
     def assemble(self, llmodule):
         llmachine = self.target_machine()
 
@@ -173,16 +222,74 @@ class Target:
 
             return library
 
-    def compile_and_link(self, modules):
-        return self.link([self.assemble(self.compile(module)) for module in modules])
+    def compile_objects(self, llirs, executor=None):
+        """Optimize and assemble the textual LLVM IR of several modules into
+        relocatable objects, in the same order.
+
+        If ``executor`` (a :class:`concurrent.futures.Executor`, usually a
+        process pool) is specified, the modules are compiled in parallel.
+        This only helps callers that compile several modules at once, such
+        as ``artiq.compiler.testbench.perf_parallel``; the core device
+        driver compiles each kernel as a single module."""
+        if executor is None or len(llirs) < 2:
+            return [self.assemble(self.compile_llvm_ir(llir)) for llir in llirs]
+        return list(executor.map(_compile_object, [self] * len(llirs), llirs))
+
+    def compile_and_link(self, modules, cache=None, executor=None):
+        """Compile and link the modules into a shared library for this target.
+
+        If ``cache`` (a :class:`artiq.compiler.library_cache.LibraryCache`)
+        is specified, the library is looked up by its LLVM IR first.
+        See :meth:`compile_objects` for ``executor``."""
+        llirs = [self.build_llvm_ir(module) for module in modules]
+        if cache is None:
+            return self.link(self.compile_objects(llirs, executor))
+
+        key = cache.key("link", self.triple, self.data_layout, ",".join(self.features), *llirs)
+        library = cache.get(key)
+        if library is None:
+            library = self.link(self.compile_objects(llirs, executor))
+            cache.put(key, library)
+        else:
+            _dump(os.getenv("ARTIQ_DUMP_ELF"), "Shared library", ".elf",
+                  lambda: library)
+        return library
+
+    def strip(self, library, cache=None):
+        if cache is not None:
+            key = cache.key("strip", self.triple, library)
+            stripped_library = cache.get(key)
+            if stripped_library is not None:
+                return stripped_library
 
-    def strip(self, library):
         with RunTool([self.triple + "-strip", "--strip-debug", "{library}", "-o", "{output}"],
                      library=library, output=b"") \
                 as results:
-            return results["output"].read()
+            stripped_library = results["output"].read()
+
+        if cache is not None:
+            cache.put(key, stripped_library)
+        return stripped_library
 
     def symbolize(self, library, addresses):
+        if library in _symbolized_libraries:
+            _symbolized_libraries.move_to_end(library)
+            symbolized = _symbolized_libraries[library]
+        else:
+            symbolized = _symbolized_libraries[library] = {}
+            if len(_symbolized_libraries) > _symbolized_libraries_max:
+                _symbolized_libraries.popitem(last=False)
+
+        missing = sorted(set(addresses) - symbolized.keys())
+        if missing:
+            for address in missing:
+                symbolized[address] = []
+            for entry in self._symbolize(library, missing):
+                symbolized[entry[4]].append(entry)
+
+        return [entry for address in addresses for entry in symbolized[address]]
+
+    def _symbolize(self, library, addresses):
         if addresses == []:
             return []
 
@@ -206,7 +313,7 @@ class Target:
                     address  = int(address_or_function[2:], 16) + 1 # remove offset
                     function = next(lines)
                 else:
-                    address  = backtrace[-1][4] # inlined
+                    # inlined, same address as the previous entry
                     function = address_or_function
                 location = next(lines)
 
@@ -218,8 +325,14 @@ class Target:
             return backtrace
 
     def demangle(self, names):
-        with RunTool([self.triple + "-c++filt"] + names) as results:
-            return results["__stdout__"].rstrip().split("\n")
+        missing = sorted(set(names) - _demangled_names.keys())
+        if missing:
+            if len(_demangled_names) + len(missing) > _demangled_names_max:
+                _demangled_names.clear()
+            with RunTool([self.triple + "-c++filt"] + missing) as results:
+                demangled = results["__stdout__"].rstrip().split("\n")
+            _demangled_names.update(zip(missing, demangled))
+        return [_demangled_names[name] for name in names]
 
 class NativeTarget(Target):
     def __init__(self):
@@ -30,8 +30,29 @@ def main():
     benchmark(lambda: Module(source),
               "ARTIQ transforms and validators")
 
+    target = OR1KTarget()
+    llvm_ir = target.build_llvm_ir(module)
+    llvm_module = target.compile_llvm_ir(llvm_ir)
+    elf_obj = target.assemble(llvm_module)
+    elf_shlib = target.link([elf_obj])
+
+    benchmark(lambda: OR1KTarget().build_llvm_ir(module),
+              "LLVM IR generation")
+
+    benchmark(lambda: target.compile_llvm_ir(llvm_ir),
+              "LLVM IR parsing and optimization")
+
+    benchmark(lambda: target.assemble(llvm_module),
+              "LLVM machine code emission")
+
+    benchmark(lambda: target.link([elf_obj]),
+              "Linking")
+
+    benchmark(lambda: target.strip(elf_shlib),
+              "Stripping debug information")
+
     benchmark(lambda: OR1KTarget().compile_and_link([module]),
-              "LLVM optimization and linking")
+              "LLVM optimization and linking (total)")
 
 if __name__ == "__main__":
     main()
@@ -5,6 +5,7 @@ from ...master.databases import DeviceDB, DatasetDB
 from ...master.worker_db import DeviceManager, DatasetManager
 from ..module import Module
 from ..embedding import Stitcher
+from ..transforms import Inferencer, IODelayEstimator
 from ..targets import OR1KTarget
 from . import benchmark
 
@@ -52,6 +53,14 @@ def main():
     benchmark(lambda: embed(),
               "ARTIQ embedding")
 
+    benchmark(lambda: Inferencer(engine=engine).visit(stitcher.typedtree),
+              "ARTIQ type inference (one pass)")
+
+    ref_period = stitcher.core.ref_period
+    benchmark(lambda: IODelayEstimator(engine=engine, ref_period=ref_period)
+                          .visit_fixpoint(stitcher.typedtree),
+              "ARTIQ I/O delay estimation")
+
     benchmark(lambda: Module(stitcher),
               "ARTIQ transforms and validators")
 
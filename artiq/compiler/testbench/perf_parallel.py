@@ -0,0 +1,68 @@
+import sys, os
+from concurrent.futures import ProcessPoolExecutor
+from pythonparser import diagnostic
+from ..module import Module, Source
+from ..targets import OR1KTarget
+from . import benchmark
+
+# A synthetic kernel module; many of them make up the experiment.
+_kernel_template = """
+def kernel_{index}_fib(n):
+    if n < 2:
+        return n
+    return kernel_{index}_fib(n - 1) + kernel_{index}_fib(n - 2)
+
+def kernel_{index}_sum(n):
+    acc = 0
+    for i in range(n):
+        if i % 3 == {index} % 3:
+            acc += i * {index}
+        else:
+            acc -= kernel_{index}_fib(i % 10)
+    return acc
+
+def kernel_{index}_list(n):
+    values = [0 for _ in range(n)]
+    for i in range(n):
+        values[i] = kernel_{index}_sum(i) + {index}
+    return values[n - 1]
+
+kernel_{index}_list(100)
+"""
+
+def main():
+    if len(sys.argv) > 3:
+        print("Usage: perf_parallel [modules [workers]]", file=sys.stderr)
+        exit(1)
+    module_count = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count()
+
+    def process_diagnostic(diag):
+        print("\n".join(diag.render()), file=sys.stderr)
+        if diag.level in ("fatal", "error"):
+            exit(1)
+
+    engine = diagnostic.Engine()
+    engine.process = process_diagnostic
+
+    modules = []
+    for index in range(module_count):
+        source = Source.from_string(_kernel_template.format(index=index),
+                                    "kernel_{}.py".format(index), engine=engine)
+        modules.append(Module(source))
+
+    with ProcessPoolExecutor(workers) as executor:
+        serial = OR1KTarget().compile_and_link(modules)
+        parallel = OR1KTarget().compile_and_link(modules, executor=executor)
+        if serial != parallel:
+            print("Parallel compilation is not deterministic", file=sys.stderr)
+            exit(1)
+
+        benchmark(lambda: OR1KTarget().compile_and_link(modules),
+                  "{} modules, serial".format(module_count))
+
+        benchmark(lambda: OR1KTarget().compile_and_link(modules, executor=executor),
+                  "{} modules, {} workers".format(module_count, workers))
+
+if __name__ == "__main__":
+    main()
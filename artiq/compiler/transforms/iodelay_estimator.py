@@ -23,6 +23,7 @@ class IODelayEstimator(algorithm.Visitor):
         self.current_args   = None
         self.current_goto   = None
         self.current_return = None
+        self.worklist       = None
 
     def evaluate(self, node, abort, context):
         if isinstance(node, asttyped.NumT):
@@ -78,21 +79,32 @@ class IODelayEstimator(algorithm.Visitor):
         raise _IndeterminateDelay(diag)
 
     def visit_fixpoint(self, node):
+        self.worklist = None
         while True:
             self.changed = False
             self.visit(node)
-            if not self.changed:
+            if not self.changed or not self.worklist:
                 return
 
     def visit_ModuleT(self, node):
+        # A statement that was analyzed without encountering a function
+        # of unknown delay will not change when analyzed again, so only
+        # the remaining ones are kept in the worklist for the next iteration.
+        if self.worklist is None:
+            stmts = node.body
+        else:
+            stmts = self.worklist
+        self.worklist = []
+
         try:
-            for stmt in node.body:
+            for index, stmt in enumerate(stmts):
                 try:
                     self.visit(stmt)
                 except _UnknownDelay:
-                    pass # more luck next time?
+                    self.worklist.append(stmt) # more luck next time?
         except _IndeterminateDelay:
-            pass # we don't care; module-level code is never interleaved
+            # we don't care; module-level code is never interleaved
+            self.worklist += stmts[index:]
 
     def visit_function(self, args, body, typ, loc):
         old_args, self.current_args = self.current_args, args
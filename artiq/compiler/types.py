@@ -50,20 +50,26 @@ class TVar(Type):
     A type variable.
 
     In effect, the classic union-find data structure is intrusively
-    folded into this class.
+    folded into this class. Unification of two type variables is done
+    by rank, and :meth:`find` compresses the paths it traverses, so that
+    both take near-constant amortized time.
     """
 
     def __init__(self):
         self.parent = self
+        self.rank = 0
 
     def find(self):
-        if self.parent is self:
+        parent = self.parent
+        if parent is self:
             return self
+        elif parent.__class__ != TVar or parent.parent is parent:
+            return parent
         else:
             # The recursive find() invocation is turned into a loop
             # because paths resulting from unification of large arrays
             # can easily cause a stack overflow.
-            root = self
+            root = parent
             while root.__class__ == TVar:
                 if root is root.parent:
                     break
@@ -81,12 +87,22 @@ class TVar(Type):
             return root
 
     def unify(self, other):
+        root  = self.find()
         other = other.find()
 
-        if self.parent is self:
-            self.parent = other
+        if root.__class__ != TVar:
+            root.unify(other)
+        elif root is other:
+            pass
+        elif other.__class__ != TVar:
+            root.parent = other
+        elif root.rank < other.rank:
+            root.parent = other
+        elif root.rank > other.rank:
+            other.parent = root
         else:
-            self.find().unify(other)
+            root.parent = other
+            other.rank += 1
 
     def fold(self, accum, fn):
         if self.parent is self:
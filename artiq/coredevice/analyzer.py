@@ -1,9 +1,12 @@
 from operator import itemgetter
-from collections import namedtuple
+from collections import namedtuple, deque
 from itertools import count
 import struct
+import time
 import logging
 
+import numpy
+
 from artiq.protocols.analyzer import MessageType, ExceptionType
 
 
@@ -47,20 +50,207 @@ def decode_message(data):
         raise ValueError
 
 
+_message_dtype = numpy.dtype([
+    ("data", ">u8"),
+    ("address", ">u4"),
+    ("rtio_counter", ">u8"),
+    ("timestamp", ">u8"),
+    ("type_channel", ">u4")
+])
+assert _message_dtype.itemsize == 32
+
+
+class _RawColumn:
+    # Non-data descriptor: the column is decoded from the raw messages on
+    # first access and then cached in the instance dictionary.
+    def __init__(self, decode):
+        self.decode = decode
+        self.name = decode.__name__
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        value = self.decode(instance._raw)
+        instance.__dict__[self.name] = value
+        return value
+
+
+class DecodedMessages:
+    """Columnar representation of analyzer messages.
+
+    The fields of all messages are stored in the Numpy arrays ``channel``,
+    ``type``, ``timestamp``, ``rtio_counter``, ``address`` and ``data``.
+    Fields that do not apply to a message type (e.g. the timestamp of an
+    exception) are undefined. When created from a buffer, the columns are
+    decoded on first access, so that slices of a large dump can be processed
+    without decoding all of it.
+
+    Indexing with an integer returns the corresponding
+    :class:`OutputMessage`, :class:`InputMessage`, :class:`ExceptionMessage`
+    or :class:`StoppedMessage`, created on demand. Indexing with a slice or
+    an array of indices returns another :class:`DecodedMessages`.
+    """
+    def __init__(self, channel, type, timestamp, rtio_counter, address, data):
+        self._raw = None
+        self.channel = channel
+        self.type = type
+        self.timestamp = timestamp
+        self.rtio_counter = rtio_counter
+        self.address = address
+        self.data = data
+
+    @classmethod
+    def from_raw(cls, raw):
+        """Create from an array of the structured dtype of the messages
+        in an analyzer dump."""
+        self = cls.__new__(cls)
+        self._raw = raw
+        return self
+
+    @classmethod
+    def from_buffer(cls, data, offset=0, count=-1):
+        return cls.from_raw(numpy.frombuffer(data, dtype=_message_dtype,
+                                             offset=offset, count=count))
+
+    @_RawColumn
+    def channel(raw):
+        return raw["type_channel"].astype(numpy.uint32) >> 2
+
+    @_RawColumn
+    def type(raw):
+        return (raw["type_channel"] & 0b11).astype(numpy.uint8)
+
+    @_RawColumn
+    def timestamp(raw):
+        return raw["timestamp"].astype(numpy.int64)
+
+    @_RawColumn
+    def rtio_counter(raw):
+        return raw["rtio_counter"].astype(numpy.int64)
+
+    @_RawColumn
+    def address(raw):
+        return raw["address"].astype(numpy.uint32)
+
+    @_RawColumn
+    def data(raw):
+        return raw["data"].astype(numpy.uint64)
+
+    @classmethod
+    def from_messages(cls, messages):
+        columns = {field: [] for field in ("channel", "type", "timestamp",
+                                           "rtio_counter", "address", "data")}
+        for message in messages:
+            if isinstance(message, OutputMessage):
+                message_type = MessageType.output
+            elif isinstance(message, InputMessage):
+                message_type = MessageType.input
+            elif isinstance(message, ExceptionMessage):
+                message_type = MessageType.exception
+            elif isinstance(message, StoppedMessage):
+                message_type = MessageType.stopped
+            else:
+                raise TypeError
+            columns["type"].append(message_type.value)
+            columns["channel"].append(getattr(message, "channel", 0))
+            columns["timestamp"].append(getattr(message, "timestamp", 0))
+            columns["rtio_counter"].append(message.rtio_counter)
+            if isinstance(message, ExceptionMessage):
+                columns["address"].append(message.exception_type.value)
+            else:
+                columns["address"].append(getattr(message, "address", 0))
+            columns["data"].append(getattr(message, "data", 0))
+        return cls(
+            channel=numpy.array(columns["channel"], dtype=numpy.uint32),
+            type=numpy.array(columns["type"], dtype=numpy.uint8),
+            timestamp=numpy.array(columns["timestamp"], dtype=numpy.int64),
+            rtio_counter=numpy.array(columns["rtio_counter"], dtype=numpy.int64),
+            address=numpy.array(columns["address"], dtype=numpy.uint32),
+            data=numpy.array(columns["data"], dtype=numpy.uint64))
+
+    def to_raw(self):
+        """Return the messages as an array of the structured dtype of the
+        messages in an analyzer dump."""
+        if self._raw is not None:
+            return self._raw
+        raw = numpy.empty(len(self), dtype=_message_dtype)
+        raw["type_channel"] = (self.channel.astype(numpy.uint32) << 2) | self.type
+        raw["timestamp"] = self.timestamp
+        raw["rtio_counter"] = self.rtio_counter
+        raw["address"] = self.address
+        raw["data"] = self.data
+        return raw
+
+    def time(self):
+        """Return the time of each message: its timestamp for output and
+        input messages, and its RTIO counter value otherwise."""
+        has_timestamp = self.type <= MessageType.input.value
+        return numpy.where(has_timestamp, self.timestamp, self.rtio_counter)
+
+    def __len__(self):
+        if self._raw is not None:
+            return len(self._raw)
+        return len(self.type)
+
+    def _messages(self):
+        output_type = MessageType.output.value
+        input_type = MessageType.input.value
+        exception_type = MessageType.exception.value
+        columns = zip(self.channel.tolist(), self.type.tolist(),
+                      self.timestamp.tolist(), self.rtio_counter.tolist(),
+                      self.address.tolist(), self.data.tolist())
+        for channel, message_type, timestamp, rtio_counter, address, data \
+                in columns:
+            if message_type == output_type:
+                yield OutputMessage(channel, timestamp, rtio_counter,
+                                    address, data)
+            elif message_type == input_type:
+                yield InputMessage(channel, timestamp, rtio_counter, data)
+            elif message_type == exception_type:
+                yield ExceptionMessage(channel, rtio_counter,
+                                       ExceptionType(address & 0xff))
+            else:
+                yield StoppedMessage(rtio_counter)
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, numpy.integer)):
+            if index < 0:
+                index += len(self)
+            if not 0 <= index < len(self):
+                raise IndexError("message index out of range")
+            return next(self[index:index+1]._messages())
+        elif self._raw is not None:
+            return DecodedMessages.from_raw(self._raw[index])
+        else:
+            return DecodedMessages(self.channel[index], self.type[index],
+                                   self.timestamp[index],
+                                   self.rtio_counter[index],
+                                   self.address[index], self.data[index])
+
+    def __iter__(self):
+        for start in range(0, len(self), 4096):
+            yield from self[start:start+4096]._messages()
+
+
 DecodedDump = namedtuple(
     "DecodedDump", "log_channel dds_onehot_sel messages")
 
 
-def decode_dump(data):
-    parts = struct.unpack(">IQbbb", data[:15])
+_dump_header = struct.Struct(">IQbbb")
+
+
+def _decode_dump_at(data, offset):
+    if len(data) - offset < _dump_header.size:
+        raise ValueError("analyzer dump is truncated")
     (sent_bytes, total_byte_count,
-     overflow_occured, log_channel, dds_onehot_sel) = parts
+     overflow_occured, log_channel, dds_onehot_sel) = \
+        _dump_header.unpack_from(data, offset)
 
-    expected_len = sent_bytes + 15
-    if expected_len != len(data):
+    end = offset + _dump_header.size + sent_bytes
+    if end > len(data):
         raise ValueError("analyzer dump has incorrect length "
                          "(got {}, expected {})".format(
-                            len(data), expected_len))
+                            len(data) - offset, end - offset))
     if overflow_occured:
         logger.warning("analyzer FIFO overflow occured, "
                        "some messages have been lost")
@@ -68,12 +258,30 @@ def decode_dump(data):
         logger.info("analyzer ring buffer has wrapped %d times",
                     total_byte_count//sent_bytes)
 
-    position = 15
-    messages = []
-    for _ in range(sent_bytes//32):
-        messages.append(decode_message(data[position:position+32]))
-        position += 32
-    return DecodedDump(log_channel, bool(dds_onehot_sel), messages)
+    messages = DecodedMessages.from_buffer(
+        data, offset=offset + _dump_header.size, count=sent_bytes//32)
+    return DecodedDump(log_channel, bool(dds_onehot_sel), messages), end
+
+
+def decode_dump(data):
+    dump, end = _decode_dump_at(data, 0)
+    if end != len(data):
+        raise ValueError("analyzer dump has incorrect length "
+                         "(got {}, expected {})".format(len(data), end))
+    return dump
+
+
+def decode_dumps(data):
+    """Decode a sequence of concatenated analyzer dumps.
+
+    The messages are not copied: ``data`` may e.g. be a memory-mapped
+    file, of which only the parts being processed are read."""
+    dumps = []
+    offset = 0
+    while offset < len(data):
+        dump, offset = _decode_dump_at(data, offset)
+        dumps.append(dump)
+    return dumps
 
 
 def vcd_codes():
@@ -87,6 +295,17 @@ def vcd_codes():
         yield code
 
 
+_double = struct.Struct(">d")
+_uint64 = struct.Struct(">Q")
+
+
+def _double_bits(x):
+    # Vectorized "{:064b}".format() of the IEEE 754 representation of x.
+    bits = numpy.unpackbits(
+        numpy.asarray(x, dtype=">f8").view(numpy.uint8)) + ord("0")
+    return bits.view("S64").astype("U64").tolist()
+
+
 class VCDChannel:
     def __init__(self, out, code):
         self.out = out
@@ -99,28 +318,48 @@ class VCDChannel:
             self.out.write(value + self.code + "\n")
 
     def set_value_double(self, x):
-        integer_cast = struct.unpack(">Q", struct.pack(">d", x))[0]
+        integer_cast = _uint64.unpack(_double.pack(x))[0]
         self.set_value("{:064b}".format(integer_cast))
 
 
 class VCDManager:
-    def __init__(self, fileobj):
+    """Writes VCD data to ``fileobj``.
+
+    Output is accumulated in memory until :meth:`flush` is called.
+    If ``flush_interval`` is not ``None``, :meth:`flush` also flushes
+    ``fileobj`` when at least that many seconds have elapsed since it last
+    did, so that the file can be watched while it is being written.
+    """
+    def __init__(self, fileobj, flush_interval=None):
         self.out = fileobj
+        self.flush_interval = flush_interval
+        self.last_flush = time.monotonic()
+        self.buffer = []
+        self.write = self.buffer.append
         self.codes = vcd_codes()
         self.current_time = None
 
+    def flush(self):
+        self.out.write("".join(self.buffer))
+        del self.buffer[:]
+        if self.flush_interval is not None:
+            now = time.monotonic()
+            if now - self.last_flush >= self.flush_interval:
+                self.out.flush()
+                self.last_flush = now
+
     def set_timescale_ps(self, timescale):
-        self.out.write("$timescale {}ps $end\n".format(round(timescale)))
+        self.write("$timescale {}ps $end\n".format(round(timescale)))
 
     def get_channel(self, name, width):
         code = next(self.codes)
-        self.out.write("$var wire {width} {code} {name} $end\n"
-                       .format(name=name, code=code, width=width))
-        return VCDChannel(self.out, code)
+        self.write("$var wire {width} {code} {name} $end\n"
+                   .format(name=name, code=code, width=width))
+        return VCDChannel(self, code)
 
     def set_time(self, time):
         if time != self.current_time:
-            self.out.write("#{}\n".format(time))
+            self.write("#{}\n".format(time))
             self.current_time = time
 
 
@@ -266,19 +505,19 @@ class LogHandler:
 def get_vcd_log_channels(log_channel, messages):
     vcd_log_channels = dict()
     log_entry = ""
-    for message in messages:
-        if (isinstance(message, OutputMessage)
-                and message.channel == log_channel):
-            log_entry += _extract_log_chars(message.data)
-            if len(log_entry) > 1 and log_entry[-1] == "\x1D":
-                channel_name, log_message = log_entry[:-1].split("\x1E", maxsplit=1)
-                l = len(log_message)
-                if channel_name in vcd_log_channels:
-                    if vcd_log_channels[channel_name] < l:
-                        vcd_log_channels[channel_name] = l
-                else:
+    log_messages = messages[(messages.channel == log_channel)
+                            & (messages.type == MessageType.output.value)]
+    for data in log_messages.data.tolist():
+        log_entry += _extract_log_chars(data)
+        if len(log_entry) > 1 and log_entry[-1] == "\x1D":
+            channel_name, log_message = log_entry[:-1].split("\x1E", maxsplit=1)
+            l = len(log_message)
+            if channel_name in vcd_log_channels:
+                if vcd_log_channels[channel_name] < l:
                     vcd_log_channels[channel_name] = l
-                log_entry = ""
+            else:
+                vcd_log_channels[channel_name] = l
+            log_entry = ""
     return vcd_log_channels
 
 
@@ -338,8 +577,164 @@ def get_message_time(message):
     return getattr(message, "timestamp", message.rtio_counter)
 
 
-def decoded_dump_to_vcd(fileobj, devices, dump):
-    vcd_manager = VCDManager(fileobj)
+def _stream_keys(raw):
+    # Output and input messages of each channel form a stream ordered by
+    # timestamp, exceptions and stops a stream ordered by RTIO counter.
+    type_channel = raw["type_channel"].astype(numpy.int64)
+    timed = (type_channel & 0b11) <= MessageType.input.value
+    keys = numpy.where(timed, type_channel, -1)
+    times = numpy.where(timed, raw["timestamp"].astype(numpy.int64),
+                        raw["rtio_counter"].astype(numpy.int64))
+    return keys, times
+
+
+def _scan_dump(raw, log_key, chunk_size):
+    # Returns the keys of the streams in the dump, whether all of them are
+    # in order, and the messages of the log channel.
+    last_times = dict()
+    in_order = True
+    log_messages = [raw[:0]]
+    for start in range(0, len(raw), chunk_size):
+        chunk = raw[start:start+chunk_size]
+        keys, times = _stream_keys(chunk)
+        log_messages.append(chunk[keys == log_key])
+
+        order = numpy.argsort(keys, kind="mergesort")
+        keys = keys[order]
+        times = times[order]
+        same_stream = keys[1:] == keys[:-1]
+        if numpy.any(same_stream & (times[1:] < times[:-1])):
+            in_order = False
+        firsts = numpy.flatnonzero(numpy.concatenate(([True], ~same_stream)))
+        lasts = numpy.concatenate((firsts[1:], [len(keys)])) - 1
+        for key, first, last in zip(keys[firsts].tolist(),
+                                    times[firsts].tolist(),
+                                    times[lasts].tolist()):
+            if last_times.get(key, first) > first:
+                in_order = False
+            last_times[key] = last
+    return sorted(last_times.keys()), in_order, numpy.concatenate(log_messages)
+
+
+class _StreamSplitter:
+    # Reads a dump chunk by chunk and sends the messages of each chunk to
+    # the queues of their streams, so that the dump is read only once for
+    # all the streams.
+    def __init__(self, raw, base, keys, chunk_size):
+        self.raw = raw
+        self.base = base
+        self.chunk_size = chunk_size
+        self.position = 0
+        self.queues = {key: deque() for key in keys}
+
+    def read_chunk(self):
+        start = self.position
+        if start >= len(self.raw):
+            return False
+        chunk = self.raw[start:start+self.chunk_size]
+        self.position += len(chunk)
+        keys, times = _stream_keys(chunk)
+        # the sort is stable, so each stream keeps the order of the dump
+        order = numpy.argsort(keys, kind="mergesort")
+        keys = keys[order]
+        firsts = numpy.flatnonzero(
+            numpy.concatenate(([True], keys[1:] != keys[:-1])))
+        ends = numpy.concatenate((firsts[1:], [len(keys)]))
+        for key, first, end in zip(keys[firsts].tolist(),
+                                   firsts.tolist(), ends.tolist()):
+            selected = order[first:end]
+            self.queues[key].append((chunk[selected], times[selected],
+                                     selected + (self.base + start)))
+        return True
+
+    def stream(self, key):
+        queue = self.queues[key]
+        while True:
+            while not queue:
+                if not self.read_chunk():
+                    return
+            yield queue.popleft()
+
+
+def _sorted_chunks(raw, base, chunk_size):
+    _, times = _stream_keys(raw)
+    order = numpy.argsort(times, kind="mergesort")
+    times = times[order]
+    for start in range(0, len(order), chunk_size):
+        selected = order[start:start+chunk_size]
+        yield raw[selected], times[start:start+chunk_size], selected + base
+
+
+class _StreamBuffer:
+    def __init__(self, chunks, min_size):
+        self.chunks = chunks
+        self.min_size = min_size
+        self.raw = None
+        self.times = numpy.empty(0, dtype=numpy.int64)
+        self.indices = numpy.empty(0, dtype=numpy.int64)
+
+    def fill(self):
+        while len(self.times) < self.min_size:
+            try:
+                raw, times, indices = next(self.chunks)
+            except StopIteration:
+                break
+            if self.raw is None:
+                self.raw = raw
+            else:
+                self.raw = numpy.concatenate((self.raw, raw))
+            self.times = numpy.concatenate((self.times, times))
+            self.indices = numpy.concatenate((self.indices, indices))
+        return len(self.times) > 0
+
+    def last(self):
+        return int(self.times[-1]), int(self.indices[-1])
+
+    def take(self, limit):
+        limit_time, limit_index = limit
+        first = numpy.searchsorted(self.times, limit_time, side="left")
+        end = numpy.searchsorted(self.times, limit_time, side="right")
+        n = first + numpy.searchsorted(self.indices[first:end], limit_index,
+                                       side="right")
+        r = self.raw[:n], self.times[:n], self.indices[:n]
+        self.raw = self.raw[n:]
+        self.times = self.times[n:]
+        self.indices = self.indices[n:]
+        return r
+
+
+def _merge_streams(streams, chunk_size):
+    # k-way merge of streams of (raw messages, times, indices) chunks,
+    # each ordered by (time, index). Yields ordered chunks.
+    # At each step, all messages up to the last buffered message of the
+    # stream that ends earliest can be emitted.
+    pending = []
+    for stream in streams:
+        buffer = _StreamBuffer(stream, chunk_size)
+        if buffer.fill():
+            pending.append(buffer)
+    while pending:
+        limit = min(buffer.last() for buffer in pending)
+        parts = [buffer.take(limit) for buffer in pending]
+        pending = [buffer for buffer in pending if buffer.fill()]
+        raw, times, indices = (numpy.concatenate(part) for part in zip(*parts))
+        order = numpy.lexsort((indices, times))
+        yield raw[order], times[order]
+
+
+def decoded_dumps_to_vcd(fileobj, devices, dumps,
+                         flush_interval=None, chunk_size=65536):
+    """Convert a sequence of decoded analyzer dumps into a VCD file.
+
+    The messages of each channel are usually in order, in which case they
+    are merged and written ``chunk_size`` at a time, and memory usage does
+    not depend on the size of the dumps. Otherwise, the messages of the
+    affected dump are sorted first.
+
+    :param flush_interval: if not ``None``, flush ``fileobj`` after at most
+        that many seconds.
+    """
+    vcd_manager = VCDManager(fileobj, flush_interval)
     ref_period = get_ref_period(devices)
     if ref_period is not None:
         vcd_manager.set_timescale_ps(ref_period*1e12)
@@ -351,29 +746,73 @@ def decoded_dump_to_vcd(fileobj, devices, dump):
         logger.warning("unable to determine DDS sysclk")
         dds_sysclk = 3e9  # guess
 
-    if isinstance(dump.messages[-1], StoppedMessage):
-        messages = dump.messages[:-1]
-    else:
-        logger.warning("StoppedMessage missing")
+    if len({(dump.log_channel, dump.dds_onehot_sel) for dump in dumps}) > 1:
+        raise ValueError("All dumps must have the same log channel "
+                         "and DDS selection mode")
+    log_channel = dumps[0].log_channel if dumps else 0
+    dds_onehot_sel = dumps[0].dds_onehot_sel if dumps else False
+    log_key = (log_channel << 2) | MessageType.output.value
+
+    streams = []
+    log_messages = []
+    base = 0
+    for dump in dumps:
         messages = dump.messages
-    messages = sorted(messages, key=get_message_time)
+        if not isinstance(messages, DecodedMessages):
+            messages = DecodedMessages.from_messages(messages)
+        raw = messages.to_raw()
+        if (len(raw) and (raw["type_channel"][-1] & 0b11)
+                == MessageType.stopped.value):
+            raw = raw[:-1]
+        else:
+            logger.warning("StoppedMessage missing")
+        keys, in_order, log_raw = _scan_dump(raw, log_key, chunk_size)
+        if in_order:
+            splitter = _StreamSplitter(raw, base, keys, chunk_size)
+            streams += [splitter.stream(key) for key in keys]
+        else:
+            logger.debug("messages out of order, sorting dump")
+            streams.append(_sorted_chunks(raw, base, chunk_size))
+        log_messages.append(log_raw)
+        base += len(raw)
 
     channel_handlers = create_channel_handlers(
         vcd_manager, devices, ref_period,
-        dds_sysclk, dump.dds_onehot_sel)
-    vcd_log_channels = get_vcd_log_channels(dump.log_channel, messages)
-    channel_handlers[dump.log_channel] = LogHandler(
+        dds_sysclk, dds_onehot_sel)
+    vcd_log_channels = dict()
+    for log_raw in log_messages:
+        for name, length in get_vcd_log_channels(
+                log_channel, DecodedMessages.from_raw(log_raw)).items():
+            vcd_log_channels[name] = max(length,
+                                         vcd_log_channels.get(name, 0))
+    channel_handlers[log_channel] = LogHandler(
         vcd_manager, vcd_log_channels)
     slack = vcd_manager.get_channel("rtio_slack", 64)
+    handled_channels = list(channel_handlers.keys())
 
     vcd_manager.set_time(0)
-    if messages:
-        start_time = get_message_time(messages[0])
-        for message in messages:
-            if message.channel in channel_handlers:
-                vcd_manager.set_time(
-                    get_message_time(message) - start_time)
+    start_time = None
+    for raw, times in _merge_streams(streams, chunk_size):
+        if start_time is None:
+            start_time = int(times[0])
+        for start in range(0, len(raw), chunk_size):
+            messages = DecodedMessages.from_raw(raw[start:start+chunk_size])
+            chunk_times = times[start:start+chunk_size]
+            handled = (numpy.isin(messages.channel, handled_channels)
+                       & (messages.type != MessageType.stopped.value))
+            messages = messages[handled]
+            chunk_times = chunk_times[handled] - start_time
+            slacks = _double_bits(
+                (messages.timestamp - messages.rtio_counter)*ref_period)
+            for message, message_time, message_slack in zip(
+                    messages._messages(), chunk_times.tolist(), slacks):
+                vcd_manager.set_time(message_time)
                 channel_handlers[message.channel].process_message(message)
                 if isinstance(message, OutputMessage):
-                    slack.set_value_double(
-                        (message.timestamp - message.rtio_counter)*ref_period)
+                    slack.set_value(message_slack)
+            vcd_manager.flush()
+    vcd_manager.flush()
+
+
+def decoded_dump_to_vcd(fileobj, devices, dump, **kwargs):
+    decoded_dumps_to_vcd(fileobj, devices, [dump], **kwargs)
@@ -66,6 +66,53 @@ class RPCReturnValueError(ValueError):
 RPCKeyword = namedtuple('RPCKeyword', ['name', 'value'])
 
 
+# Wire and host representations of the RPC value tags
+# that are transferred in bulk in lists and arrays.
+_rpc_element_dtypes = {
+    "b": (">u1", numpy.bool_),
+    "i": (">i4", numpy.int32),
+    "I": (">i8", numpy.int64),
+    "f": (">f8", numpy.float64),
+}
+
+
+# Python types of the elements accepted by _send_rpc_value for each tag.
+_rpc_element_types = {
+    "b": {bool},
+    "i": {bool, int, numpy.int32},
+    "I": {bool, int, numpy.int32, numpy.int64},
+    "f": {float, numpy.float64},
+}
+
+_rpc_element_kinds = {
+    "b": "b",
+    "i": "bi",
+    "I": "bi",
+    "f": "f",
+}
+
+
+def _pack_rpc_elements(tag, value):
+    # Returns the wire representation of the elements of value, or None
+    # if they have to be checked (and rejected) one by one.
+    wire_dtype, _ = _rpc_element_dtypes[tag]
+    if isinstance(value, numpy.ndarray):
+        if value.dtype.kind not in _rpc_element_kinds[tag]:
+            return None
+    elif not set(map(type, value)) <= _rpc_element_types[tag]:
+        return None
+    if tag == "i" or tag == "I":
+        try:
+            value = numpy.asarray(value, dtype=numpy.int64)
+        except OverflowError:
+            return None
+        bits = 32 if tag == "i" else 64
+        if len(value) and not (-2**(bits-1) < value.min() and
+                               value.max() < 2**(bits-1)-1):
+            return None
+    return numpy.asarray(value, dtype=wire_dtype).tobytes()
+
+
 class CommGeneric:
     def __init__(self):
         self._read_type = None
@@ -276,6 +323,9 @@ class CommGeneric:
     # See session.c:{send,receive}_rpc_value and llvm_ir_generator.py:_rpc_tag.
     def _receive_rpc_value(self, embedding_map):
         tag = chr(self._read_int8())
+        return self._receive_rpc_tagged_value(tag, embedding_map)
+
+    def _receive_rpc_tagged_value(self, tag, embedding_map):
         if tag == "\x00":
             return self._rpc_sentinel
         elif tag == "t":
@@ -299,10 +349,16 @@ class CommGeneric:
             return self._read_string()
         elif tag == "l":
             length = self._read_int32()
-            return [self._receive_rpc_value(embedding_map) for _ in range(length)]
+            elements = self._receive_rpc_elements(length, embedding_map)
+            if isinstance(elements, numpy.ndarray):
+                if elements.dtype.kind in "bf":
+                    return elements.tolist()
+                else:
+                    return list(elements)
+            return elements
         elif tag == "a":
             length = self._read_int32()
-            return numpy.array([self._receive_rpc_value(embedding_map) for _ in range(length)])
+            return numpy.asarray(self._receive_rpc_elements(length, embedding_map))
         elif tag == "r":
             start = self._receive_rpc_value(embedding_map)
             stop  = self._receive_rpc_value(embedding_map)
@@ -317,6 +373,28 @@ class CommGeneric:
         else:
             raise IOError("Unknown RPC value tag: {}".format(repr(tag)))
 
+    def _receive_rpc_elements(self, length, embedding_map):
+        # Returns a list, or for elements of scalar types, an array read
+        # and converted at once.
+        if length == 0:
+            return []
+        tag = chr(self._read_int8())
+        if tag not in _rpc_element_dtypes:
+            return [self._receive_rpc_tagged_value(tag, embedding_map)] + \
+                   [self._receive_rpc_value(embedding_map)
+                    for _ in range(length - 1)]
+
+        # Each element is preceded by its tag.
+        wire_dtype, dtype = _rpc_element_dtypes[tag]
+        wire_dtype = numpy.dtype([("tag", "u1"), ("value", wire_dtype)])
+        data = bytes([ord(tag)]) + \
+               self._read_chunk(wire_dtype.itemsize*length - 1)
+        elements = numpy.frombuffer(data, dtype=wire_dtype)
+        if numpy.any(elements["tag"] != ord(tag)):
+            raise IOError("Inhomogeneous RPC list with element tag {}"
+                          .format(repr(tag)))
+        return elements["value"].astype(dtype)
+
     def _receive_rpc_args(self, embedding_map):
         args, kwargs = [], {}
         while True:
@@ -329,12 +407,12 @@ class CommGeneric:
                 args.append(value)
 
     def _skip_rpc_value(self, tags):
-        tag = tags.pop(0)
+        tag = chr(tags.pop(0))
         if tag == "t":
             length = tags.pop(0)
             for _ in range(length):
                 self._skip_rpc_value(tags)
-        elif tag == "l":
+        elif tag == "l" or tag == "a":
             self._skip_rpc_value(tags)
         elif tag == "r":
             self._skip_rpc_value(tags)
@@ -392,11 +470,12 @@ class CommGeneric:
         elif tag == "l":
             check(isinstance(value, list),
                   lambda: "list")
-            self._write_int32(len(value))
-            for elt in value:
-                tags_copy = bytearray(tags)
-                self._send_rpc_value(tags_copy, elt, root, function)
-            self._skip_rpc_value(tags)
+            self._send_rpc_elements(tags, value, root, function)
+        elif tag == "a":
+            check(isinstance(value, list) or
+                    (isinstance(value, numpy.ndarray) and value.ndim == 1),
+                  lambda: "array")
+            self._send_rpc_elements(tags, value, root, function)
         elif tag == "r":
             check(isinstance(value, range),
                   lambda: "range")
@@ -410,6 +489,20 @@ class CommGeneric:
         else:
             raise IOError("Unknown RPC value tag: {}".format(repr(tag)))
 
+    def _send_rpc_elements(self, tags, value, root, function):
+        self._write_int32(len(value))
+        elt_tag = chr(tags[0])
+        if elt_tag in _rpc_element_dtypes:
+            data = _pack_rpc_elements(elt_tag, value)
+            if data is not None:
+                self._write_chunk(data)
+                self._skip_rpc_value(tags)
+                return
+        for elt in value:
+            tags_copy = bytearray(tags)
+            self._send_rpc_value(tags_copy, elt, root, function)
+        self._skip_rpc_value(tags)
+
     def _serve_rpc(self, embedding_map):
         async        = self._read_bool()
         service_id   = self._read_int32()
@@ -10,8 +10,10 @@ from artiq.language.types import *
 from artiq.language.units import *
 
 from artiq.compiler.module import Module
-from artiq.compiler.embedding import Stitcher
+from artiq.compiler.embedding import Stitcher, ParseCache
 from artiq.compiler.targets import OR1KTarget
+from artiq.compiler.library_cache import LibraryCache
+from artiq.compiler.profiler import Profiler, NullProfiler
 
 # Import for side effects (creating the exception classes).
 from artiq.coredevice import exceptions
@@ -62,6 +64,12 @@ class Core:
         and the RTIO coarse timestamp frequency (e.g. SERDES multiplication
         factor).
     :param comm_device: name of the device used for communications.
+    :param compile_cache_size: maximum number of compiled kernel libraries
+        kept in memory and reused when the same kernel is compiled again.
+        Setting it to 0 disables the compilation cache.
+    :param compile_cache_dir: directory where compiled kernel libraries are
+        additionally cached across processes. If ``None``, compiled
+        libraries are only cached in memory.
     """
 
     kernel_invariants = {
@@ -70,13 +78,28 @@ class Core:
     }
 
     def __init__(self, dmgr, ref_period, external_clock=False,
-                 ref_multiplier=8, comm_device="comm"):
+                 ref_multiplier=8, comm_device="comm",
+                 compile_cache_size=64, compile_cache_dir=None):
         self.ref_period = ref_period
         self.external_clock = external_clock
         self.ref_multiplier = ref_multiplier
         self.coarse_ref_period = ref_period*ref_multiplier
         self.comm = dmgr.get(comm_device)
 
+        if compile_cache_size or compile_cache_dir is not None:
+            self.compile_cache = LibraryCache(compile_cache_dir,
+                                              max_entries=compile_cache_size)
+        else:
+            self.compile_cache = None
+        self.parse_cache = ParseCache()
+
+        self.profile_prefix = os.getenv("ARTIQ_PROFILE_COMPILER")
+        if self.profile_prefix:
+            self.profiler = Profiler(
+                allocations=bool(os.getenv("ARTIQ_PROFILE_COMPILER_ALLOCATIONS")))
+        else:
+            self.profiler = NullProfiler()
+
         self.first_run = True
         self.dmgr = dmgr
         self.core = self
@@ -86,17 +109,24 @@ class Core:
         try:
             engine = _DiagnosticEngine(all_errors_are_fatal=True)
 
-            stitcher = Stitcher(engine=engine, core=self, dmgr=self.dmgr)
-            stitcher.stitch_call(function, args, kwargs, set_result)
-            stitcher.finalize()
-
-            module = Module(stitcher,
-                ref_period=self.ref_period,
-                attribute_writeback=attribute_writeback)
-            target = OR1KTarget()
-
-            library = target.compile_and_link([module])
-            stripped_library = target.strip(library)
+            with self.profiler.context(function.__qualname__):
+                with self.profiler.measure("Stitcher", lambda: stitcher.typedtree):
+                    stitcher = Stitcher(engine=engine, core=self, dmgr=self.dmgr,
+                                        parse_cache=self.parse_cache)
+                    stitcher.stitch_call(function, args, kwargs, set_result)
+                    stitcher.finalize()
+
+                module = Module(stitcher,
+                    ref_period=self.ref_period,
+                    attribute_writeback=attribute_writeback,
+                    profiler=self.profiler)
+                target = OR1KTarget()
+
+                with self.profiler.measure("OR1KTarget"):
+                    library = target.compile_and_link([module], cache=self.compile_cache)
+                    stripped_library = target.strip(library, cache=self.compile_cache)
+            if self.profile_prefix:
+                self.profiler.write(self.profile_prefix)
 
             return stitcher.embedding_map, stripped_library, \
                    lambda addresses: target.symbolize(library, addresses), \
@@ -1,17 +1,26 @@
 # Copyright (C) 2012-2015 Robert Jordens <jordens@gmail.com>
 
 from math import log, sqrt
+import hashlib
 import logging
 import struct
 
+import numpy as np
 import serial
 
 from artiq.wavesynth.coefficients import discrete_compensate
+from artiq.protocols import pyon
 
 
 logger = logging.getLogger(__name__)
 
 
+def program_digest(program, channels=None):
+    """Digest identifying a wavesynth program, see
+    :meth:`Pdq2.get_program_digest`."""
+    return hashlib.sha1(pyon.encode([program, channels]).encode()).hexdigest()
+
+
 class Segment:
     """Serialize the lines for a single Segment.
 
@@ -22,7 +31,7 @@ class Segment:
         out_scale (float): Steps per Volt.
         cordic_gain (float): CORDIC amplitude gain.
         addr (int): Address assigned to this segment.
-        data (bytes): Serialized segment data.
+        data (bytearray): Serialized segment data.
     """
     max_time = 1 << 16  # uint16 timer
     max_val = 1 << 15  # int16 DAC
@@ -33,7 +42,7 @@ class Segment:
         cordic_gain *= sqrt(1 + 2**(-2*i))
 
     def __init__(self):
-        self.data = b""
+        self.data = bytearray()
         self.addr = None
 
     def line(self, typ, duration, data, trigger=False, silence=False,
@@ -95,6 +104,129 @@ class Segment:
                          values, widths, ud, fmt, e)
             raise e
 
+    @staticmethod
+    def pack_array(widths, values):
+        """Pack the spline data of many lines (columnar :meth:`pack`).
+
+        Args:
+            widths (list[int]): Widths of values in multiples of 16 bits.
+            values (array): Values to pack, one line per row, with at most
+                ``len(widths)`` columns.
+
+        Returns:
+            words (array): Packed data as 16 bit words, one line per row.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        words = []
+        for width, value in zip(widths, values.T):
+            value = np.rint(value * (1 << 16*width))
+            limit = 1 << (16*(width + 1) - 1)
+            if np.any(value < -limit) or np.any(value >= limit):
+                logger.error("can not pack %s as %s", value, width)
+                raise struct.error("value out of range")
+            value = value.astype(np.int64)
+            for i in range(width + 1):
+                words.append(value & 0xffff)
+                value >>= 16
+        return np.array(words, dtype=np.uint16).reshape(
+            -1, values.shape[0]).T
+
+    def lines(self, typ, duration, data, length=None, trigger=False,
+              silence=False, aux=False, shift=0, jump=False, clear=False,
+              wait=False):
+        """Append many lines to this segment (columnar :meth:`line`).
+
+        Args:
+            typ (int): Output module to target with these lines.
+            duration (array[int]): Durations of the lines.
+            data (array): Opaque data for the output module as 16 bit words,
+                one line per row (see :meth:`pack_array`).
+            length (array[int]): Number of data words of each line. If not
+                specified, all words are used.
+            **kwargs: See :meth:`line`. Either a single value for all lines
+                or an array with one value per line.
+        """
+        duration = np.asarray(duration)
+        data = np.asarray(data, dtype=np.uint16)
+        if data.size:
+            data = data.reshape(len(duration), -1)
+        else:
+            data = data.reshape(len(duration), 0)
+        if length is None:
+            length = data.shape[1]
+        length = np.broadcast_to(length, duration.shape)
+        assert np.all(length <= 14)
+        if np.any(duration < 0) or np.any(duration >= self.max_time):
+            raise struct.error("duration out of range")
+
+        def flag(value, bit):
+            return np.asarray(value, dtype=np.uint16) << bit
+        header = (
+            1 + length | flag(typ, 4) | flag(trigger, 6) | flag(silence, 7) |
+            flag(aux, 8) | flag(shift, 9) | flag(jump, 13) | flag(clear, 14) |
+            flag(wait, 15)
+        )
+        words = np.empty((len(duration), 2 + data.shape[1]), dtype="<u2")
+        words[:, 0] = header
+        words[:, 1] = duration
+        words[:, 2:] = data
+        used = np.arange(words.shape[1]) < 2 + length[:, None]
+        self.data += words[used].tobytes()
+
+    @staticmethod
+    def _data_length(widths, values, compress):
+        # Number of data words of each line, keeping only the values up
+        # to the last non-zero one if compress is True.
+        count = np.full(len(values), values.shape[1])
+        if compress:
+            nonzero = values != 0
+            last = values.shape[1] - np.argmax(nonzero[:, ::-1], axis=1)
+            count = np.where(nonzero.any(axis=1), last, 1)
+        words = np.r_[0, np.cumsum([width + 1 for width in widths])]
+        return words[count]
+
+    def bias_lines(self, duration, amplitude, compress=True, **kwargs):
+        """Append many bias lines to this segment (columnar :meth:`bias`).
+
+        Args:
+            duration (array[int]): Durations of the lines.
+            amplitude (array): Amplitude coefficients (see :meth:`bias`),
+                one line per row with up to four columns.
+            compress (bool): Omit the zero high order coefficients of each
+                line.
+            **kwargs: Passed to :meth:`lines`.
+        """
+        widths = [0, 1, 2, 2]
+        coef = self.out_scale*np.array(amplitude, dtype=np.float64, ndmin=2)
+        length = self._data_length(widths, coef, compress)
+        _discrete_compensate_array(coef)
+        self.lines(typ=0, duration=duration, length=length,
+                   data=self.pack_array(widths, coef), **kwargs)
+
+    def dds_lines(self, duration, amplitude, phase=None, **kwargs):
+        """Append many DDS lines to this segment (columnar :meth:`dds`).
+
+        Args:
+            duration (array[int]): Durations of the lines.
+            amplitude (array): Amplitude coefficients (see :meth:`dds`),
+                one line per row with four columns (or up to four columns
+                if there is no phase).
+            phase (array): Phase coefficients (see :meth:`dds`), one line
+                per row with up to three columns.
+            **kwargs: Passed to :meth:`lines`.
+        """
+        scale = self.out_scale/self.cordic_gain
+        coef = scale*np.array(amplitude, dtype=np.float64, ndmin=2)
+        _discrete_compensate_array(coef)
+        widths = [0, 1, 2, 2]
+        if phase is not None:
+            assert coef.shape[1] == 4
+            phase = np.array(phase, dtype=np.float64, ndmin=2)
+            coef = np.c_[coef, phase*self.max_val*2]
+            widths += [0, 1, 1]
+        self.lines(typ=1, duration=duration,
+                   data=self.pack_array(widths, coef), **kwargs)
+
     def bias(self, amplitude=[], **kwargs):
         """Append a bias line to this segment.
 
@@ -133,6 +265,18 @@ class Segment:
         self.line(typ=1, data=data, **kwargs)
 
 
+def _discrete_compensate_array(c):
+    # discrete_compensate() applied to each row of c
+    l = c.shape[1]
+    if l > 2:
+        c[:, 1] += c[:, 2]/2.
+    if l > 3:
+        c[:, 1] += c[:, 3]/6.
+        c[:, 2] += c[:, 3]
+    if l > 4:
+        raise ValueError("only third-order splines supported")
+
+
 class Channel:
     """PDQ2 Channel.
 
@@ -238,9 +382,15 @@ class Pdq2:
         num_channels (int): Number of channels in this stack.
         num_boards (int): Number of boards in this stack.
         channels (list[Channel]): List of :class:`Channel` in this stack.
+        memory (list[bytearray]): Known contents of the memory of each
+            channel, from its start, as last written by this object.
+            ``None`` if unknown.
+        merge_gap (int): Changed memory ranges closer than this number of
+            words are rewritten with a single memory write.
     """
     num_dacs = 3
     freq = 50e6
+    merge_gap = 4
 
     _escape = b"\xa5"
     _commands = "RESET TRIGGER ARM DCM START".split()
@@ -252,6 +402,8 @@ class Pdq2:
         self.num_boards = num_boards
         self.num_channels = self.num_dacs * self.num_boards
         self.channels = [Channel() for i in range(self.num_channels)]
+        self.memory = [None]*self.num_channels
+        self.program_digest = None
 
     def get_num_boards(self):
         return self.num_boards
@@ -266,7 +418,11 @@ class Pdq2:
         self.freq = float(freq)
 
     def close(self):
-        """Close the USB device handle."""
+        """Close the USB device handle.
+
+        The known contents of the memories are forgotten, since the device
+        may be reset or power cycled before it is opened again."""
+        self.invalidate_memory()
         self.dev.close()
         del self.dev
 
@@ -290,11 +446,33 @@ class Pdq2:
             enable (bool): Enable (``True``) or disable (``False``) the
                 feature.
         """
+        if cmd == "RESET" and enable:
+            self.invalidate_memory()
         cmd = self._commands.index(cmd) << 1
         if not enable:
             cmd |= 1
         self.write(struct.pack("cb", self._escape, cmd))
 
+    def invalidate_memory(self):
+        """Forget the known contents of the channel memories.
+
+        The next :meth:`program` rewrites the memories completely.
+        This is needed if the device was reset or reprogrammed other than
+        through this object."""
+        self.memory = [None]*self.num_channels
+        self.program_digest = None
+
+    def get_program_digest(self):
+        """Return the :func:`program_digest` of the program last written by
+        :meth:`program`, or ``None`` if the memories may have been modified
+        since.
+
+        Only the changes made through this object are tracked. If the
+        device is reset or power cycled externally (e.g. with its reset
+        button), :meth:`invalidate_memory` must be called, otherwise the
+        digest and the next :meth:`program` rely on stale memory contents."""
+        return self.program_digest
+
     def write_mem(self, channel, data, start_addr=0):
         """Write to channel memory.
 
@@ -304,36 +482,121 @@ class Pdq2:
             data (bytes): Data to write to memory.
             start_addr (int): Start address to write data to.
         """
+        self.program_digest = None
+        # the memory is unknown if the write fails
+        memory = self.memory[channel]
+        self.memory[channel] = None
         board, dac = divmod(channel, self.num_dacs)
-        data = struct.pack("<HHH", (board << 4) | dac, start_addr,
-                           start_addr + len(data)//2 - 1) + data
-        data = data.replace(self._escape, self._escape + self._escape)
-        self.write(data)
+        frame = struct.pack("<HHH", (board << 4) | dac, start_addr,
+                            start_addr + len(data)//2 - 1) + data
+        frame = frame.replace(self._escape, self._escape + self._escape)
+        self.write(frame)
+        if memory is not None and 2*start_addr <= len(memory):
+            memory[2*start_addr:2*start_addr + len(data)] = data
+            self.memory[channel] = memory
+        elif start_addr == 0:
+            self.memory[channel] = bytearray(data)
+
+    def _changed_ranges(self, old, new):
+        # Word ranges of new that differ from old, merging ranges closer
+        # than merge_gap words.
+        n = min(len(old), len(new))//2
+        changed = np.r_[
+            np.flatnonzero(np.frombuffer(old, "<u2", n) !=
+                           np.frombuffer(new, "<u2", n)),
+            np.arange(n, len(new)//2)]
+        if not len(changed):
+            return []
+        breaks = np.flatnonzero(np.diff(changed) > self.merge_gap)
+        starts = changed[np.r_[0, breaks + 1]]
+        stops = changed[np.r_[breaks, len(changed) - 1]] + 1
+        return list(zip(starts.tolist(), stops.tolist()))
+
+    def write_mem_diff(self, channel, data):
+        """Write to channel memory, skipping the data that is known to be
+        already present.
+
+        Args:
+            channel (int): Channel index to write to.
+            data (bytes): Data to write to memory, from address 0.
+        """
+        memory = self.memory[channel]
+        if memory is None:
+            self.write_mem(channel, data)
+            return
+        for start, stop in self._changed_ranges(memory, data):
+            self.write_mem(channel, data[2*start:2*stop], start)
 
     def program_segments(self, segments, data):
         """Append the wavesynth lines to the given segments.
 
+        Successive lines of a segment that have the same target and the
+        same numbers of coefficients are packed together with
+        :meth:`Segment.bias_lines` or :meth:`Segment.dds_lines`.
+
         Args:
             segments (list[Segment]): List of :class:`Segment` to append the
                 lines to.
             data (list): List of wavesynth lines.
         """
-        for i, line in enumerate(data):
+        shifts = []
+        for line in data:
             dac_divider = line.get("dac_divider", 1)
             shift = int(log(dac_divider, 2))
             if 2**shift != dac_divider:
                 raise ValueError("only power-of-two dac_dividers supported")
-            duration = line["duration"]
-            trigger = line.get("trigger", False)
-            for segment, data in zip(segments, line["channel_data"]):
-                silence = data.pop("silence", False)
-                if len(data) != 1:
+            shifts.append(shift)
+        for i, segment in enumerate(segments):
+            run_key = None
+            run = []
+            for line, shift in zip(data, shifts):
+                if i >= len(line["channel_data"]):
+                    continue
+                channel_data = line["channel_data"][i]
+                targets = [target for target in channel_data
+                           if target != "silence"]
+                if len(targets) != 1:
                     raise ValueError("only one target per channel and line "
                                      "supported")
-                for target, target_data in data.items():
-                    getattr(segment, target)(
-                        shift=shift, duration=duration, trigger=trigger,
-                        silence=silence, **target_data)
+                target = targets[0]
+                target_data = channel_data[target]
+                key = (target, len(target_data.get("amplitude", [])),
+                       len(target_data.get("phase", [])),
+                       tuple(sorted(k for k in target_data
+                                    if k not in ("amplitude", "phase"))))
+                if key != run_key:
+                    self._program_run(segment, run_key, run)
+                    run_key = key
+                    run = []
+                run.append((line["duration"], line.get("trigger", False),
+                            channel_data.get("silence", False), shift,
+                            target_data))
+            self._program_run(segment, run_key, run)
+
+    @staticmethod
+    def _program_run(segment, key, run):
+        # Append lines that have the same target and coefficient counts.
+        if not run:
+            return
+        target, amplitude_count, phase_count, extra = key
+        duration, trigger, silence, shift, target_data = zip(*run)
+        kwargs = {k: [d[k] for d in target_data] for k in extra}
+        amplitude = np.array([d.get("amplitude", []) for d in target_data],
+                             dtype=np.float64).reshape(
+                                 len(run), amplitude_count)
+        if target == "bias":
+            segment.bias_lines(duration, amplitude, compress=False,
+                               trigger=trigger, silence=silence, shift=shift,
+                               **kwargs)
+        elif target == "dds":
+            if phase_count:
+                phase = [d["phase"] for d in target_data]
+            else:
+                phase = None
+            segment.dds_lines(duration, amplitude, phase, trigger=trigger,
+                              silence=silence, shift=shift, **kwargs)
+        else:
+            raise ValueError("unknown target {}".format(target))
 
     def program(self, program, channels=None):
         """Serialize a wavesynth program and write it to the channels
@@ -343,7 +606,8 @@ class Pdq2:
         wavesynth program is appended to a fresh set of :class:`Segment`
         of the channels. All segments are allocated, the frame address tale
         is generated, the channels are serialized and their memories are
-        written.
+        written. Only the parts of the memories that differ from what was
+        last written are written (see :meth:`write_mem_diff`).
 
         Short single-cycle lines are prepended and appended to each frame to
         allow proper write interlocking and to assure that the memory reader
@@ -355,6 +619,7 @@ class Pdq2:
             channels (list[int]): Channel indices to use. If unspecified, all
                 channels are used.
         """
+        digest = program_digest(program, channels)
         if channels is None:
             channels = range(self.num_channels)
         chs = [self.channels[i] for i in channels]
@@ -370,7 +635,8 @@ class Pdq2:
                 segment.line(typ=3, data=b"", trigger=True, duration=1, aux=1,
                              jump=True)
         for channel, ch in zip(channels, chs):
-            self.write_mem(channel, ch.serialize())
+            self.write_mem_diff(channel, ch.serialize())
+        self.program_digest = digest
 
     def flush(self):
         self.dev.flush()
@@ -1,4 +1,5 @@
 from artiq.language import *
+from artiq.devices.pdq2.driver import program_digest
 
 
 frame_setup = 20*ns
@@ -179,6 +180,15 @@ class CompoundPDQ2:
     def get_program(self):
         return [f._get_program() for f in self.frames]
 
+    def invalidate(self):
+        """Forget the programs known to be in the PDQ2 memories, so that the
+        next :meth:`arm` writes them completely.
+
+        Call this after the PDQ2 devices were reset or power cycled
+        other than through their controllers."""
+        for dev in self.pdq2s:
+            dev.invalidate_memory()
+
     def arm(self):
         if self.armed:
             raise ArmError()
@@ -201,7 +211,10 @@ class CompoundPDQ2:
                     }
                     frame_program.append(line)
                 program.append(frame_program)
-            pdq2.program(program)
+            # Avoid sending the program if the PDQ2 already has it. The
+            # driver itself only rewrites the memory that changed.
+            if pdq2.get_program_digest() != program_digest(program):
+                pdq2.program(program)
             n += dn
         for pdq2 in self.pdq2s:
             pdq2.unpark()
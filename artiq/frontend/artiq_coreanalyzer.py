@@ -1,12 +1,14 @@
 #!/usr/bin/env python3.5
 
 import argparse
+import mmap
+import os
 import sys
 
 from artiq.tools import verbosity_args, init_logger
 from artiq.master.databases import DeviceDB
 from artiq.master.worker_db import DeviceManager
-from artiq.coredevice.analyzer import decode_dump, decoded_dump_to_vcd
+from artiq.coredevice.analyzer import decode_dumps, decoded_dumps_to_vcd
 
 
 def get_argparser():
@@ -18,11 +20,15 @@ def get_argparser():
                        help="device database file (default: '%(default)s')")
 
     parser.add_argument("-r", "--read-dump", type=str, default=None,
-                        help="read raw dump file instead of accessing device")
+                        help="read raw dump file instead of accessing device "
+                             "(may contain several concatenated dumps)")
     parser.add_argument("-p", "--print-decoded", default=False, action="store_true",
                         help="print raw decoded messages")
     parser.add_argument("-w", "--write-vcd", type=str, default=None,
                         help="format and write contents to VCD file")
+    parser.add_argument("--vcd-flush-interval", type=float, default=None,
+                        help="flush the VCD file at least every that many "
+                             "seconds while writing it")
     parser.add_argument("-d", "--write-dump", type=str, default=None,
                         help="write raw dump file")
     return parser
@@ -41,20 +47,26 @@ def main():
     try:
         if args.read_dump:
             with open(args.read_dump, "rb") as f:
-                dump = f.read()
+                if not os.fstat(f.fileno()).st_size:
+                    # empty files cannot be mapped
+                    print("Dump file '{}' is empty".format(args.read_dump))
+                    sys.exit(1)
+                dump = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
         else:
             comm = device_mgr.get("comm")
             dump = comm.get_analyzer_dump()
-        decoded_dump = decode_dump(dump)
+        decoded_dumps = decode_dumps(dump)
         if args.print_decoded:
-            print("Log channel:", decoded_dump.log_channel)
-            print("DDS one-hot:", decoded_dump.dds_onehot_sel)
-            for message in decoded_dump.messages:
-                print(message)
+            for decoded_dump in decoded_dumps:
+                print("Log channel:", decoded_dump.log_channel)
+                print("DDS one-hot:", decoded_dump.dds_onehot_sel)
+                for message in decoded_dump.messages:
+                    print(message)
         if args.write_vcd:
             with open(args.write_vcd, "w") as f:
-                decoded_dump_to_vcd(f, device_mgr.get_device_db(),
-                                    decoded_dump)
+                decoded_dumps_to_vcd(f, device_mgr.get_device_db(),
+                                     decoded_dumps,
+                                     flush_interval=args.vcd_flush_interval)
         if args.write_dump:
             with open(args.write_dump, "wb") as f:
                 f.write(dump)
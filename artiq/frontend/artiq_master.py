@@ -38,6 +38,28 @@ def get_argparser():
     group.add_argument("--dataset-db", default="dataset_db.pyon",
                        help="dataset file (default: '%(default)s')")
 
+    group = parser.add_argument_group("notifications")
+    group.add_argument("--notify-coalesce-window", default=0.0, type=float,
+                       help="time in seconds during which successive "
+                            "modifications are merged before being sent to "
+                            "each client, 0 to send every modification "
+                            "(default: %(default)s)")
+    group.add_argument("--notify-max-backlog", default=64*1024*1024,
+                       type=int,
+                       help="maximum size in bytes of the modifications "
+                            "queued for a client before it is sent a fresh "
+                            "copy of the structure instead "
+                            "(default: %(default)d)")
+
+    group = parser.add_argument_group("workers")
+    group.add_argument("--worker-pool-size", default=0, type=int,
+                       help="number of worker processes kept started in "
+                            "advance for each pipeline, 0 to start a new "
+                            "process for each run (default: %(default)d)")
+    group.add_argument("--worker-max-runs", default=100, type=int,
+                       help="number of runs after which a pooled worker "
+                            "process is replaced (default: %(default)d)")
+
     group = parser.add_argument_group("repository")
     group.add_argument(
         "-g", "--git", default=False, action="store_true",
@@ -90,7 +112,8 @@ def main():
     experiment_db = ExperimentDB(repo_backend, worker_handlers)
     atexit.register(experiment_db.close)
 
-    scheduler = Scheduler(RIDCounter(), worker_handlers, experiment_db)
+    scheduler = Scheduler(RIDCounter(), worker_handlers, experiment_db,
+                          args.worker_pool_size, args.worker_max_runs)
     scheduler.start()
     atexit_register_coroutine(scheduler.stop)
 
@@ -124,7 +147,8 @@ def main():
         "datasets": dataset_db.data,
         "explist": experiment_db.explist,
         "explist_status": experiment_db.status
-    })
+    }, coalesce_window=args.notify_coalesce_window,
+       max_backlog=args.notify_max_backlog)
     loop.run_until_complete(server_notify.start(
         bind, args.port_notify))
     atexit_register_coroutine(server_notify.stop)
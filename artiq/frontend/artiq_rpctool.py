@@ -22,6 +22,10 @@ def get_argparser():
     parser_list_methods = subparsers.add_parser("list-methods",
                                                 help="list target's methods")
     parser_list_methods.add_argument("-t", "--target", help="target name")
+    parser_thread_metrics = subparsers.add_parser(
+        "thread-metrics", help="show the metrics of the methods executed "
+                               "in the server's thread pool")
+    parser_thread_metrics.add_argument("-t", "--target", help="target name")
     parser_call = subparsers.add_parser("call", help="call a target's method")
     parser_call.add_argument("-t", "--target", help="target name")
     parser_call.add_argument("method", metavar="METHOD", help="method name")
@@ -78,6 +82,18 @@ def list_methods(remote):
         print()
 
 
+def show_thread_metrics(remote):
+    metrics = remote.get_rpc_thread_metrics()
+    if not metrics:
+        print("No method executed in threads")
+    for name, m in sorted(metrics.items()):
+        print("{}: {} calls, {} running, {} queued, "
+              "wait {:.3g}/{:.3g} s, time {:.3g}/{:.3g} s (mean/max)"
+              .format(name, m["calls"], m["running"], m["queued"],
+                      m["mean_wait"], m["max_wait"],
+                      m["mean_time"], m["max_time"]))
+
+
 def call_method(remote, method_name, args):
     method = getattr(remote, method_name)
     ret = method(*[eval(arg) for arg in args])
@@ -135,6 +151,8 @@ def main():
         list_targets(targets, description)
     elif args.action == "list-methods":
         list_methods(remote)
+    elif args.action == "thread-metrics":
+        show_thread_metrics(remote)
     elif args.action == "call":
         call_method(remote, args.method, args.args)
     elif args.action == "interactive" or not args.action:
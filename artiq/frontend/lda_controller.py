@@ -36,7 +36,8 @@ def main():
         lda = Lda(args.device, args.product)
     try:
         simple_server_loop({"lda": lda},
-                           bind_address_from_args(args), args.port)
+                           bind_address_from_args(args), args.port,
+                           threaded_targets={"lda"})
     finally:
         lda.close()
 
@@ -47,7 +47,8 @@ def main():
         dev.cmd("ARM", True)
         dev.park()
         simple_server_loop({"pdq2": dev}, bind_address_from_args(args),
-                           args.port, description="device=" + str(args.device))
+                           args.port, description="device=" + str(args.device),
+                           threaded_targets={"pdq2"})
     finally:
         dev.close()
 
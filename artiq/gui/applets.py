@@ -13,6 +13,7 @@ from PyQt5 import QtCore, QtGui, QtWidgets
 from artiq.protocols.pipe_ipc import AsyncioParentComm
 from artiq.protocols.logging import LogParser
 from artiq.protocols import pyon
+from artiq.protocols.shared_memory import SegmentWriter
 from artiq.gui.tools import QDockWidgetCloseDetect, LayoutWidget
 
 
@@ -20,10 +21,12 @@ logger = logging.getLogger(__name__)
 
 
 class AppletIPCServer(AsyncioParentComm):
-    def __init__(self, datasets_sub):
+    def __init__(self, datasets_sub, segment_writer=None):
         AsyncioParentComm.__init__(self)
         self.datasets_sub = datasets_sub
+        self.segment_writer = segment_writer
         self.datasets = set()
+        self.shared_memory = False
 
     def write_pyon(self, obj):
         self.write(pyon.encode(obj).encode() + b"\n")
@@ -47,6 +50,17 @@ class AppletIPCServer(AsyncioParentComm):
             elif mod["action"] in {"setitem", "delitem"}:
                 if mod["key"] not in self.datasets:
                     return
+        self._write_mod(mod, share=mod["action"] != "init")
+
+    def _write_mod(self, mod, share=False):
+        if self.shared_memory:
+            # Mods other than init are the same for all applets, so their
+            # arrays are written to shared memory only once.
+            s, segments = self.segment_writer.encode(mod, self, share)
+            if segments:
+                self.write_pyon({"action": "mod_shm", "mod": s,
+                                 "segments": segments})
+                return
         self.write_pyon({"action": "mod", "mod": mod})
 
     async def serve(self, embed_cb, fix_initial_size_cb):
@@ -63,10 +77,15 @@ class AppletIPCServer(AsyncioParentComm):
                         fix_initial_size_cb()
                     elif action == "subscribe":
                         self.datasets = obj["datasets"]
+                        self.shared_memory = (
+                            obj.get("shared_memory", False) and
+                            self.segment_writer is not None)
                         if self.datasets_sub.model is not None:
                             mod = self._synthesize_init(
                                 self.datasets_sub.model.backing_store)
-                            self.write_pyon({"action": "mod", "mod": mod})
+                            self._write_mod(mod)
+                    elif action == "release":
+                        self.segment_writer.release(self, obj["segments"])
                     else:
                         raise ValueError("unknown action in applet message")
                 except:
@@ -80,6 +99,8 @@ class AppletIPCServer(AsyncioParentComm):
                          "server stopped", exc_info=True)
         finally:
             self.datasets_sub.notify_cbs.remove(self._on_mod)
+            if self.segment_writer is not None:
+                self.segment_writer.release_all(self)
 
     def start_server(self, embed_cb, fix_initial_size_cb):
         self.server_task = asyncio.ensure_future(
@@ -92,7 +113,7 @@ class AppletIPCServer(AsyncioParentComm):
 
 
 class _AppletDock(QDockWidgetCloseDetect):
-    def __init__(self, datasets_sub, uid, name, spec):
+    def __init__(self, datasets_sub, segment_writer, uid, name, spec):
         QDockWidgetCloseDetect.__init__(self, "Applet: " + name)
         self.setObjectName("applet" + str(uid))
 
@@ -101,6 +122,7 @@ class _AppletDock(QDockWidgetCloseDetect):
         self.resize(40*qfm.averageCharWidth(), 10*qfm.lineSpacing())
 
         self.datasets_sub = datasets_sub
+        self.segment_writer = segment_writer
         self.applet_name = name
         self.spec = spec
 
@@ -118,7 +140,7 @@ class _AppletDock(QDockWidgetCloseDetect):
             return
         self.starting_stopping = True
         try:
-            self.ipc = AppletIPCServer(self.datasets_sub)
+            self.ipc = AppletIPCServer(self.datasets_sub, self.segment_writer)
             env = os.environ.copy()
             env["PYTHONUNBUFFERED"] = "1"
             env["ARTIQ_APPLET_EMBED"] = self.ipc.get_address()
@@ -321,6 +343,7 @@ class AppletsDock(QtWidgets.QDockWidget):
 
         self.main_window = main_window
         self.datasets_sub = datasets_sub
+        self.segment_writer = SegmentWriter()
         self.dock_to_item = dict()
         self.applet_uids = set()
 
@@ -415,7 +438,8 @@ class AppletsDock(QtWidgets.QDockWidget):
             self.table.itemChanged.connect(self.item_changed)
 
     def create(self, uid, name, spec):
-        dock = _AppletDock(self.datasets_sub, uid, name, spec)
+        dock = _AppletDock(self.datasets_sub, self.segment_writer,
+                           uid, name, spec)
         self.main_window.addDockWidget(QtCore.Qt.RightDockWidgetArea, dock)
         dock.setFloating(True)
         asyncio.ensure_future(dock.start())
@@ -594,6 +618,7 @@ class AppletsDock(QtWidgets.QDockWidget):
                 else:
                     raise ValueError
         await walk(self.table.invisibleRootItem())
+        self.segment_writer.close()
 
     def save_state_item(self, wi):
         state = []
@@ -1,9 +1,10 @@
 import asyncio
 import logging
+from collections import Counter
 from enum import Enum
 from time import time
 
-from artiq.master.worker import Worker, log_worker_exception
+from artiq.master.worker import Worker, WorkerPool, log_worker_exception
 from artiq.tools import asyncio_wait_or_cancel, TaskObject, Condition
 from artiq.protocols.sync_struct import Notifier
 
@@ -43,6 +44,71 @@ def _mk_worker_method(name):
     return worker_method
 
 
+class _RunQueue:
+    """Priority queue of runs that supports removing any run.
+
+    The run with the largest ``key`` is at the top. Keys must not change
+    while the run is in the queue."""
+    def __init__(self, key):
+        self.key = key
+        self.heap = []  # (key, run)
+        self.positions = dict()  # rid -> index in heap
+
+    def __len__(self):
+        return len(self.heap)
+
+    def __contains__(self, run):
+        return run.rid in self.positions
+
+    def top(self):
+        if self.heap:
+            return self.heap[0][1]
+        else:
+            return None
+
+    def add(self, run):
+        self.heap.append((self.key(run), run))
+        self.positions[run.rid] = len(self.heap) - 1
+        self._sift_up(len(self.heap) - 1)
+
+    def remove(self, run):
+        i = self.positions.pop(run.rid)
+        last = self.heap.pop()
+        if i < len(self.heap):
+            self.heap[i] = last
+            self.positions[last[1].rid] = i
+            self._sift_down(self._sift_up(i))
+
+    def _swap(self, i, j):
+        heap = self.heap
+        heap[i], heap[j] = heap[j], heap[i]
+        self.positions[heap[i][1].rid] = i
+        self.positions[heap[j][1].rid] = j
+
+    def _sift_up(self, i):
+        heap = self.heap
+        while i > 0:
+            parent = (i - 1)//2
+            if heap[i][0] > heap[parent][0]:
+                self._swap(i, parent)
+                i = parent
+            else:
+                break
+        return i
+
+    def _sift_down(self, i):
+        heap = self.heap
+        while True:
+            largest = i
+            for child in 2*i + 1, 2*i + 2:
+                if child < len(heap) and heap[child][0] > heap[largest][0]:
+                    largest = child
+            if largest == i:
+                return i
+            self._swap(i, largest)
+            i = largest
+
+
 class Run:
     def __init__(self, rid, pipeline_name,
                  wd, expid, priority, due_date, flush,
@@ -56,7 +122,7 @@ class Run:
         self.due_date = due_date
         self.flush = flush
 
-        self.worker = Worker(pool.worker_handlers)
+        self.worker = Worker(pool.worker_handlers, pool=pool.worker_pool)
         self.termination_requested = False
 
         self._status = RunStatus.pending
@@ -73,6 +139,7 @@ class Run:
         self._notifier = pool.notifier
         self._notifier[self.rid] = notification
         self._state_changed = pool.state_changed
+        self._status_changed = pool.status_changed
 
     @property
     def status(self):
@@ -80,7 +147,9 @@ class Run:
 
     @status.setter
     def status(self, value):
+        old_status = self._status
         self._status = value
+        self._status_changed(self, old_status)
         if not self.worker.closed.is_set():
             self._notifier[self.rid]["status"] = self._status.name
         self._state_changed.notify()
@@ -117,12 +186,26 @@ class Run:
 
 
 class RunPool:
-    def __init__(self, ridc, worker_handlers, notifier, experiment_db):
+    def __init__(self, ridc, worker_handlers, notifier, experiment_db,
+                 worker_pool=None):
         self.runs = dict()
         self.state_changed = Condition()
 
+        # Indexes of the runs by status, so that the stages do not have to
+        # scan all runs. Pending runs whose due date has not passed are
+        # kept apart, ordered by due date.
+        self.status_counts = Counter()
+        self._pending = _RunQueue(lambda r: r.priority_key())
+        self._timed = _RunQueue(lambda r: (-r.due_date, -r.rid))
+        self._queues = {
+            RunStatus.pending: self._pending,
+            RunStatus.prepare_done: _RunQueue(lambda r: r.priority_key()),
+            RunStatus.run_done: _RunQueue(lambda r: r.priority_key())
+        }
+
         self.ridc = ridc
         self.worker_handlers = worker_handlers
+        self.worker_pool = worker_pool
         self.notifier = notifier
         self.experiment_db = experiment_db
 
@@ -140,9 +223,57 @@ class RunPool:
         run = Run(rid, pipeline_name, wd, expid, priority, due_date, flush,
                   self, repo_msg=repo_msg)
         self.runs[rid] = run
+        self._index(run)
         self.state_changed.notify()
         return rid
 
+    def _index(self, run):
+        self.status_counts[run.status] += 1
+        if run.status == RunStatus.pending:
+            if run.due_date is None or run.due_date < time():
+                self._pending.add(run)
+            else:
+                self._timed.add(run)
+        elif run.status in self._queues:
+            self._queues[run.status].add(run)
+
+    def _unindex(self, run, status):
+        self.status_counts[status] -= 1
+        if run in self._timed:
+            self._timed.remove(run)
+        elif status in self._queues:
+            self._queues[status].remove(run)
+
+    def status_changed(self, run, old_status):
+        # called by the status setter of the run
+        if self.runs.get(run.rid) is run:
+            self._unindex(run, old_status)
+            self._index(run)
+
+    def top(self, status, now=None):
+        """Returns the run with the given status and the highest
+        priority, or ``None``.
+
+        For pending runs, only those that are due at ``now`` are
+        considered."""
+        if status == RunStatus.pending:
+            if now is None:
+                now = time()
+            while self._timed and self._timed.top().due_date < now:
+                run = self._timed.top()
+                self._timed.remove(run)
+                self._pending.add(run)
+        return self._queues[status].top()
+
+    def next_due_date(self):
+        """Returns the earliest due date of the pending runs that are not
+        yet due, or ``None``."""
+        run = self._timed.top()
+        if run is None:
+            return None
+        else:
+            return run.due_date
+
     async def delete(self, rid):
         # called through deleter
         if rid not in self.runs:
@@ -151,6 +282,7 @@ class RunPool:
         await run.close()
         if "repo_rev" in run.expid:
             self.experiment_db.repo_backend.release_rev(run.expid["repo_rev"])
+        self._unindex(run, run.status)
         del self.runs[rid]
 
 
@@ -164,32 +296,30 @@ class PrepareStage(TaskObject):
         Otherwise, return a float representing the time before the next timed
         run becomes due, or None if there is no such run."""
         now = time()
-        pending_runs = filter(lambda r: r.status == RunStatus.pending,
-                              self.pool.runs.values())
-        try:
-            candidate = max(pending_runs, key=lambda r: r.priority_key(now))
-        except ValueError:
-            # pending_runs is an empty sequence
-            return None
-
-        prepared_runs = filter(lambda r: r.status == RunStatus.prepare_done,
-                               self.pool.runs.values())
-        try:
-            top_prepared_run = max(prepared_runs,
-                                   key=lambda r: r.priority_key())
-        except ValueError:
-            # there are no existing prepared runs - go ahead with <candidate>
-            pass
-        else:
-            # prepare <candidate> (as well) only if it has higher priority than
-            # the highest priority prepared run
-            if top_prepared_run.priority_key() >= candidate.priority_key():
+        candidate = self.pool.top(RunStatus.pending, now)
+        if candidate is None:
+            next_due_date = self.pool.next_due_date()
+            if next_due_date is None:
                 return None
+            else:
+                return max(next_due_date - now, 0.0)
 
-        if candidate.due_date is None or candidate.due_date < now:
-            return candidate
-        else:
-            return candidate.due_date - now
+        # prepare <candidate> (as well) only if it has higher priority than
+        # the highest priority prepared run
+        top_prepared_run = self.pool.top(RunStatus.prepare_done)
+        if (top_prepared_run is not None and
+                top_prepared_run.priority_key() >= candidate.priority_key()):
+            return None
+        return candidate
+
+    def _flushing(self, run):
+        # Returns True if runs other than <run> are past the pending stage.
+        idle = (RunStatus.pending, RunStatus.deleting)
+        active = sum(count for status, count in self.pool.status_counts.items()
+                     if status not in idle)
+        if run.status not in idle:
+            active -= 1
+        return active > 0
 
     async def _do(self):
         while True:
@@ -202,10 +332,7 @@ class PrepareStage(TaskObject):
             else:
                 if run.flush:
                     run.status = RunStatus.flushing
-                    while not all(r.status in (RunStatus.pending,
-                                               RunStatus.deleting)
-                                  or r is run
-                                  for r in self.pool.runs.values()):
+                    while self._flushing(run):
                         ev = [self.pool.state_changed.wait(),
                               run.worker.closed.wait()]
                         await asyncio_wait_or_cancel(
@@ -233,14 +360,7 @@ class RunStage(TaskObject):
         self.delete_cb = delete_cb
 
     def _get_run(self):
-        prepared_runs = filter(lambda r: r.status == RunStatus.prepare_done,
-                               self.pool.runs.values())
-        try:
-            r = max(prepared_runs, key=lambda r: r.priority_key())
-        except ValueError:
-            # prepared_runs is an empty sequence
-            r = None
-        return r
+        return self.pool.top(RunStatus.prepare_done)
 
     async def _do(self):
         stack = []
@@ -287,14 +407,7 @@ class AnalyzeStage(TaskObject):
         self.delete_cb = delete_cb
 
     def _get_run(self):
-        run_runs = filter(lambda r: r.status == RunStatus.run_done,
-                          self.pool.runs.values())
-        try:
-            r = max(run_runs, key=lambda r: r.priority_key())
-        except ValueError:
-            # run_runs is an empty sequence
-            r = None
-        return r
+        return self.pool.top(RunStatus.run_done)
 
     async def _do(self):
         while True:
@@ -316,8 +429,10 @@ class AnalyzeStage(TaskObject):
 
 
 class Pipeline:
-    def __init__(self, ridc, deleter, worker_handlers, notifier, experiment_db):
-        self.pool = RunPool(ridc, worker_handlers, notifier, experiment_db)
+    def __init__(self, ridc, deleter, worker_handlers, notifier, experiment_db,
+                 worker_pool=None):
+        self.pool = RunPool(ridc, worker_handlers, notifier, experiment_db,
+                            worker_pool)
         self._prepare = PrepareStage(self.pool, deleter.delete)
         self._run = RunStage(self.pool, deleter.delete)
         self._analyze = AnalyzeStage(self.pool, deleter.delete)
@@ -377,7 +492,16 @@ class Deleter(TaskObject):
 
 
 class Scheduler:
-    def __init__(self, ridc, worker_handlers, experiment_db):
+    """Schedules runs in pipelines.
+
+    :param worker_pool_size: number of worker processes kept ready for each
+        pipeline (see :class:`artiq.master.worker.WorkerPool`). If 0, a new
+        worker process is started for each run.
+    :param worker_max_runs: number of runs after which a pooled worker
+        process is replaced.
+    """
+    def __init__(self, ridc, worker_handlers, experiment_db,
+                 worker_pool_size=0, worker_max_runs=100):
         self.notifier = Notifier(dict())
 
         self._pipelines = dict()
@@ -385,6 +509,12 @@ class Scheduler:
         self._experiment_db = experiment_db
         self._terminated = False
 
+        # Worker pools outlive the pipelines, which are garbage-collected
+        # when they have no runs.
+        self._worker_pools = dict()
+        self._worker_pool_size = worker_pool_size
+        self._worker_max_runs = worker_max_runs
+
         self._ridc = ridc
         self._deleter = Deleter(self._pipelines)
 
@@ -401,6 +531,8 @@ class Scheduler:
         await self._deleter.stop()
         if self._pipelines:
             logger.warning("some pipelines were not garbage-collected")
+        for worker_pool in self._worker_pools.values():
+            await worker_pool.close()
 
     def submit(self, pipeline_name, expid, priority=0, due_date=None, flush=False):
         """Submits a new run.
@@ -417,11 +549,24 @@ class Scheduler:
             logger.debug("creating pipeline '%s'", pipeline_name)
             pipeline = Pipeline(self._ridc, self._deleter,
                                 self._worker_handlers, self.notifier,
-                                self._experiment_db)
+                                self._experiment_db,
+                                self._get_worker_pool(pipeline_name))
             self._pipelines[pipeline_name] = pipeline
             pipeline.start()
         return pipeline.pool.submit(expid, priority, due_date, flush, pipeline_name)
 
+    def _get_worker_pool(self, pipeline_name):
+        if self._worker_pool_size <= 0:
+            return None
+        try:
+            return self._worker_pools[pipeline_name]
+        except KeyError:
+            worker_pool = WorkerPool(self._worker_pool_size,
+                                     self._worker_max_runs)
+            worker_pool.start()
+            self._worker_pools[pipeline_name] = worker_pool
+            return worker_pool
+
     def delete(self, rid):
         """Kills the run with the specified RID."""
         self._deleter.delete(rid)
@@ -462,12 +607,8 @@ class Scheduler:
                 if run.termination_requested:
                     return True
 
-                prepared_runs = filter(lambda r: r.status == RunStatus.prepare_done,
-                                       pipeline.pool.runs.values())
-                try:
-                    r = max(prepared_runs, key=lambda r: r.priority_key())
-                except ValueError:
-                    # prepared_runs is an empty sequence
+                r = pipeline.pool.top(RunStatus.prepare_done)
+                if r is None:
                     return False
                 return r.priority_key() > run.priority_key()
         raise KeyError("RID not found")
@@ -41,13 +41,15 @@ def log_worker_exception():
 
 
 class Worker:
-    def __init__(self, handlers=dict(), send_timeout=10.0):
+    def __init__(self, handlers=dict(), send_timeout=10.0, pool=None):
         self.handlers = handlers
         self.send_timeout = send_timeout
+        self.pool = pool
 
         self.rid = None
         self.filename = None
         self.ipc = None
+        self.reusable = False
         self.watchdogs = dict()  # wid -> expiration (using time.monotonic)
 
         self.io_lock = asyncio.Lock()
@@ -82,20 +84,30 @@ class Worker:
         try:
             if self.closed.is_set():
                 raise WorkerError("Attempting to create process after close")
-            self.ipc = pipe_ipc.AsyncioParentComm()
+            if self.pool is not None:
+                ipc = self.pool.get()
+                if ipc is not None:
+                    self.ipc = ipc
+                    self.ipc.log_source = self._get_log_source
+                    return
+            ipc = pipe_ipc.AsyncioParentComm()
+            ipc.log_source = self._get_log_source
+            ipc.runs = 0
+            self.ipc = ipc
             env = os.environ.copy()
             env["PYTHONUNBUFFERED"] = "1"
-            await self.ipc.create_subprocess(
+            await ipc.create_subprocess(
                 sys.executable, "-m", "artiq.master.worker_impl",
-                self.ipc.get_address(), str(log_level),
+                ipc.get_address(), str(log_level),
                 stdout=subprocess.PIPE, stderr=subprocess.PIPE,
                 env=env, start_new_session=True)
+            # The process may be handed over to another Worker by the pool.
             asyncio.ensure_future(
-                LogParser(self._get_log_source).stream_task(
-                    self.ipc.process.stdout))
+                LogParser(lambda: ipc.log_source()).stream_task(
+                    ipc.process.stdout))
             asyncio.ensure_future(
-                LogParser(self._get_log_source).stream_task(
-                    self.ipc.process.stderr))
+                LogParser(lambda: ipc.log_source()).stream_task(
+                    ipc.process.stderr))
         finally:
             self.io_lock.release()
 
@@ -104,10 +116,22 @@ class Worker:
         worker process.
 
         This method should always be called by the user to clean up, even if
-        build() or examine() raises an exception."""
+        build() or examine() raises an exception.
+
+        If the worker has a pool and the last action completed normally,
+        the process is returned to the pool instead."""
         self.closed.set()
         await self.io_lock.acquire()
         try:
+            if (self.pool is not None and self.reusable
+                    and self.ipc is not None
+                    and self.ipc.process.returncode is None):
+                logger.debug("returning worker to pool (RID %s)", self.rid)
+                self.pool.release(self.ipc)
+                self.ipc = None
+                return
+            if self.pool is not None and self.ipc is not None:
+                self.pool.forget(self.ipc)
             if self.ipc is None:
                 # Note the %s - self.rid can be None or a user string
                 logger.debug("worker was not created (RID %s)", self.rid)
@@ -230,6 +254,7 @@ class Worker:
                 self.io_lock.release()
 
     async def _worker_action(self, obj, timeout=None):
+        self.reusable = False
         if timeout is not None:
             self.watchdogs[-1] = time.monotonic() + timeout
         try:
@@ -245,6 +270,8 @@ class Worker:
         finally:
             if timeout is not None:
                 del self.watchdogs[-1]
+        # A paused worker is in the middle of run() and cannot be reused.
+        self.reusable = completed
         return completed
 
     async def build(self, rid, pipeline_name, wd, expid, priority,
@@ -252,6 +279,7 @@ class Worker:
         self.rid = rid
         self.filename = os.path.basename(expid["file"])
         await self._create_process(expid["log_level"])
+        self.ipc.runs += 1
         await self._worker_action(
             {"action": "build",
              "rid": rid,
@@ -301,3 +329,121 @@ class Worker:
                                   timeout)
         del self.register_experiment
         return r
+
+
+class WorkerPool:
+    """Keeps worker processes started in advance, so that runs do not
+    have to wait for a new interpreter to start and import ARTIQ, Numpy and
+    the compiler.
+
+    Workers created with ``pool=`` take an idle process from the pool, if
+    there is one. When such a worker is closed after its last action
+    completed normally, its process is reset and becomes idle again;
+    otherwise (exception, timeout, deletion of a running experiment) it is
+    terminated and the pool starts a replacement.
+
+    :param size: number of processes owned by the pool.
+    :param max_runs: number of runs after which a process is terminated
+        and replaced with a fresh one, or ``None`` for no limit.
+    :param reset_timeout: time allowed for a process to clean up after
+        a run.
+    """
+    def __init__(self, size=1, max_runs=100, reset_timeout=10.0):
+        self.size = size
+        self.max_runs = max_runs
+        self.reset_timeout = reset_timeout
+
+        self._processes = set()  # IPC objects of the processes owned
+        self._spawning = 0
+        self._idle = []  # Worker objects holding an idle process
+        self._tasks = set()
+        self._closed = False
+
+    def _create_task(self, coro):
+        task = asyncio.ensure_future(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _replenish(self):
+        while (not self._closed
+                and len(self._processes) + self._spawning < self.size):
+            self._spawning += 1
+            self._create_task(self._spawn())
+
+    def _discard(self, holder):
+        self._processes.discard(holder.ipc)
+        self._create_task(holder.close())
+        self._replenish()
+
+    def _put(self, holder):
+        if self._closed:
+            self._discard(holder)
+        else:
+            self._idle.append(holder)
+
+    async def _spawn(self):
+        holder = Worker()
+        try:
+            await holder._create_process(logging.WARNING)
+        except:
+            logger.warning("failed to start pooled worker", exc_info=True)
+            await holder.close()
+            return
+        finally:
+            self._spawning -= 1
+        self._processes.add(holder.ipc)
+        self._put(holder)
+
+    async def _reset(self, holder):
+        try:
+            await holder._worker_action({"action": "reset"},
+                                        self.reset_timeout)
+        except:
+            logger.debug("failed to reset pooled worker", exc_info=True)
+            self._discard(holder)
+        else:
+            self._put(holder)
+
+    def start(self):
+        self._replenish()
+
+    def get(self):
+        """Returns the IPC object of an idle worker process, or ``None``."""
+        while self._idle:
+            holder = self._idle.pop(0)
+            if holder.ipc.process.returncode is None:
+                ipc, holder.ipc = holder.ipc, None
+                return ipc
+            self._discard(holder)
+        return None
+
+    def release(self, ipc):
+        """Takes back the process of a worker after a run."""
+        holder = Worker()
+        holder.ipc = ipc
+        ipc.log_source = holder._get_log_source
+        if ipc not in self._processes and \
+                len(self._processes) + self._spawning < self.size:
+            self._processes.add(ipc)
+        if (self._closed or ipc not in self._processes
+                or (self.max_runs is not None and ipc.runs >= self.max_runs)):
+            self._discard(holder)
+        else:
+            self._create_task(self._reset(holder))
+
+    def forget(self, ipc):
+        """Notifies the pool that the process of a worker is being
+        terminated instead of released."""
+        if ipc in self._processes:
+            self._processes.discard(ipc)
+            self._replenish()
+
+    async def close(self):
+        """Terminates all processes of the pool."""
+        self._closed = True
+        while self._tasks:
+            await asyncio.wait(list(self._tasks))
+        for holder in self._idle:
+            await holder.close()
+        self._idle.clear()
+        self._processes.clear()
@@ -5,6 +5,10 @@ import logging
 import os
 import tempfile
 import re
+import time
+
+import numpy
+import h5py
 
 from artiq.protocols.sync_struct import Notifier
 from artiq.protocols.pc_rpc import AutoTarget, Client, BestEffortClient
@@ -89,47 +93,123 @@ class DummyDevice:
     pass
 
 
-def _create_device(desc, device_mgr):
-    ty = desc["type"]
-    if ty == "local":
-        module = importlib.import_module(desc["module"])
-        device_class = getattr(module, desc["class"])
-        return device_class(device_mgr, **desc.get("arguments", {}))
-    elif ty == "controller":
-        if desc.get("best_effort", False):
-            cls = BestEffortClient
-        else:
-            cls = Client
+def _controller_client(desc, device_mgr):
+    """Returns the client class, host, port and target name to use for
+    a controller device."""
+    if desc["type"] == "controller":
+        best_effort = desc.get("best_effort", False)
+        host, port = desc["host"], desc["port"]
         # Automatic target can be specified either by the absence of
         # the target_name parameter, or a None value.
         target_name = desc.get("target_name", None)
         if target_name is None:
             target_name = AutoTarget
-        return cls(desc["host"], desc["port"], target_name)
-    elif ty == "controller_aux_target":
+    else:
         controller = device_mgr.get_desc(desc["controller"])
-        if desc.get("best_effort", controller.get("best_effort", False)):
-            cls = BestEffortClient
-        else:
-            cls = Client
-        return cls(controller["host"], controller["port"], desc["target_name"])
+        best_effort = desc.get("best_effort",
+                               controller.get("best_effort", False))
+        host, port = controller["host"], controller["port"]
+        target_name = desc["target_name"]
+    if best_effort:
+        cls = BestEffortClient
+    else:
+        cls = Client
+    return cls, host, port, target_name
+
+
+def _create_device(desc, device_mgr):
+    ty = desc["type"]
+    if ty == "local":
+        module = importlib.import_module(desc["module"])
+        device_class = getattr(module, desc["class"])
+        return device_class(device_mgr, **desc.get("arguments", {}))
+    elif ty in ("controller", "controller_aux_target"):
+        cls, host, port, target_name = _controller_client(desc, device_mgr)
+        return cls(host, port, target_name)
     elif ty == "dummy":
         return DummyDevice()
     else:
         raise ValueError("Unsupported type in device DB: " + ty)
 
 
+class ClientPool:
+    """Keeps the connections of controller RPC clients (``Client``) open
+    after :meth:`DeviceManager.close_devices`, so that later requests for
+    the same controller and target reuse them instead of connecting and
+    going through the pc_rpc handshake again.
+
+    A connection is checked before it is reused, and discarded if the
+    controller has closed it. Connections that have been idle for more than
+    ``max_idle`` seconds are closed when the pool is next used.
+    """
+    def __init__(self, max_idle=60.0):
+        self.max_idle = max_idle
+        self._idle = dict()
+
+    def get(self, key):
+        """Returns an open client for the key (host, port, target name),
+        or ``None``."""
+        self.evict()
+        idle = self._idle.get(key, [])
+        while idle:
+            _, client = idle.pop()
+            if client.check_rpc_connection():
+                logger.debug("reusing connection to %s:%d[%s]", *key)
+                return client
+            logger.debug("discarding closed connection to %s:%d[%s]", *key)
+            self._close(client)
+        return None
+
+    def put(self, key, client):
+        """Makes a client available for reuse."""
+        self._idle.setdefault(key, []).append((time.monotonic(), client))
+        self.evict()
+
+    def evict(self):
+        """Closes the connections that have been idle for too long."""
+        deadline = time.monotonic() - self.max_idle
+        for key in list(self._idle.keys()):
+            idle = self._idle[key]
+            for released, client in idle:
+                if released < deadline:
+                    self._close(client)
+            idle = [(released, client) for released, client in idle
+                    if released >= deadline]
+            if idle:
+                self._idle[key] = idle
+            else:
+                del self._idle[key]
+
+    def close(self):
+        """Closes all the connections."""
+        for idle in self._idle.values():
+            for _, client in idle:
+                self._close(client)
+        self._idle.clear()
+
+    def _close(self, client):
+        try:
+            client.close_rpc()
+        except Exception as e:
+            logger.warning("Exception %r when closing device %r", e, client)
+
+
 class DeviceError(Exception):
     pass
 
 
 class DeviceManager:
     """Handles creation and destruction of local device drivers and controller
-    RPC clients."""
-    def __init__(self, ddb, virtual_devices=dict()):
+    RPC clients.
+
+    If a :class:`ClientPool` is given, the controller clients are returned to
+    it when the devices are closed, and taken from it when possible."""
+    def __init__(self, ddb, virtual_devices=dict(), client_pool=None):
         self.ddb = ddb
         self.virtual_devices = virtual_devices
+        self.client_pool = client_pool
         self.active_devices = OrderedDict()
+        self._pool_keys = dict()
 
     def get_device_db(self):
         """Returns the full contents of the device database."""
@@ -156,7 +236,18 @@ class DeviceManager:
                 raise DeviceError("Failed to get description of device '{}'"
                                   .format(name)) from e
             try:
-                dev = _create_device(desc, self)
+                dev = None
+                if (self.client_pool is not None and
+                        desc["type"] in ("controller", "controller_aux_target")):
+                    cls, host, port, target_name = _controller_client(desc, self)
+                    if cls is Client:
+                        key = (host, port, target_name)
+                        dev = self.client_pool.get(key)
+                        if dev is None:
+                            dev = cls(host, port, target_name)
+                        self._pool_keys[name] = key
+                if dev is None:
+                    dev = _create_device(desc, self)
             except Exception as e:
                 raise DeviceError("Failed to create device '{}'"
                                   .format(name)) from e
@@ -166,15 +257,184 @@ class DeviceManager:
     def close_devices(self):
         """Closes all active devices, in the opposite order as they were
         requested."""
-        for dev in reversed(list(self.active_devices.values())):
+        for name, dev in reversed(list(self.active_devices.items())):
             try:
-                if isinstance(dev, (Client, BestEffortClient)):
+                if name in self._pool_keys:
+                    self.client_pool.put(self._pool_keys[name], dev)
+                elif isinstance(dev, (Client, BestEffortClient)):
                     dev.close_rpc()
                 elif hasattr(dev, "close"):
                     dev.close()
             except Exception as e:
                 logger.warning("Exception %r when closing device %r", e, dev)
         self.active_devices.clear()
+        self._pool_keys.clear()
+
+
+class HDF5DatasetWriter:
+    """Writes the datasets of a run into a HDF5 file as they are set,
+    mutated and appended to, instead of all at once at the end of the run.
+
+    Arrays and lists of numbers are stored as chunked datasets that are
+    resizable along their first axis, so that mutations are written in
+    place and appended elements extend the dataset. Appended elements are
+    buffered and the file is flushed at most every ``flush_interval``
+    seconds, or when ``max_pending`` elements are buffered. The results of
+    an interrupted run are therefore preserved up to the last flush.
+    When the run finishes, all the datasets are written again from their
+    final values, since experiments may also modify them in place without
+    calling ``mutate_dataset``.
+
+    This makes results durable, but does not bound memory usage: the
+    datasets are still kept in memory by :class:`DatasetManager` for the
+    whole run, and writing them at the end costs as much as before.
+
+    The file is created when the first dataset is written.
+
+    :param compression: compression filter of the chunked datasets
+        (e.g. ``"gzip"``), passed to h5py.
+    """
+    def __init__(self, filename, flush_interval=10.0, max_pending=65536,
+                 compression=None):
+        self.filename = filename
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.compression = compression
+
+        self.file = None
+        self.datasets = None
+        # key -> (dataset contents, elements appended since the last flush)
+        self.pending = dict()
+        self.pending_count = 0
+        self.last_flush = time.monotonic()
+
+    def open(self):
+        """Returns the HDF5 file, creating it if needed."""
+        if self.file is None:
+            self.file = h5py.File(self.filename, "w")
+            self.datasets = self.file.create_group("datasets")
+        return self.file
+
+    def _create(self, key, value):
+        self.pending.pop(key, None)
+        if key in self.datasets:
+            del self.datasets[key]
+        if isinstance(value, (list, numpy.ndarray)):
+            if isinstance(value, list) and not value:
+                # the type is not known until the first element is appended
+                self.pending[key] = value, []
+                return
+            data = numpy.asarray(value)
+            if data.ndim and data.dtype.kind in "biufc":
+                self.datasets.create_dataset(
+                    key, data=data, chunks=True,
+                    maxshape=(None,) + data.shape[1:],
+                    compression=self.compression)
+                return
+        self.datasets[key] = value
+
+    def set(self, key, value):
+        self.open()
+        self._create(key, value)
+        self._maybe_flush()
+
+    def delete(self, key):
+        if self.file is not None:
+            self.pending.pop(key, None)
+            if key in self.datasets:
+                del self.datasets[key]
+
+    def mutate(self, key, index, value, target):
+        """Writes the mutation of the dataset ``key``, whose new contents
+        are ``target``."""
+        self.open()
+        self._write_pending(key)
+        dataset = self.datasets.get(key)
+        try:
+            if dataset is None or dataset.chunks is None:
+                raise TypeError
+            if (not isinstance(target, numpy.ndarray) and
+                    numpy.result_type(dataset.dtype, value) != dataset.dtype):
+                # the element of the list changes type
+                raise TypeError
+            dataset[index] = value
+        except Exception:
+            # not supported in place by h5py, rewrite the whole dataset
+            self._create(key, target)
+        self._maybe_flush()
+
+    def append(self, key, value, target):
+        """Writes the element ``value`` appended to the dataset ``key``,
+        whose new contents are ``target``."""
+        self.open()
+        if key in self.pending:
+            self.pending[key][1].append(value)
+        else:
+            self.pending[key] = target, [value]
+        self.pending_count += 1
+        self._maybe_flush()
+
+    def _write_pending(self, key):
+        if key not in self.pending:
+            return
+        target, elements = self.pending.pop(key)
+        self.pending_count -= len(elements)
+        dataset = self.datasets.get(key)
+        if dataset is None:
+            self._create(key, target)
+            return
+        data = numpy.asarray(elements)
+        if (dataset.chunks is None or
+                dataset.maxshape[0] is not None or
+                data.shape[1:] != dataset.shape[1:] or
+                numpy.result_type(dataset.dtype, data) != dataset.dtype or
+                len(target) != len(dataset) + len(data)):
+            self._create(key, target)
+            return
+        start = len(dataset)
+        dataset.resize(start + len(data), axis=0)
+        dataset[start:] = data
+
+    def _maybe_flush(self):
+        if (self.pending_count >= self.max_pending or
+                time.monotonic() - self.last_flush >= self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        """Writes the buffered elements and flushes the file."""
+        if self.file is None:
+            return
+        for key in list(self.pending.keys()):
+            self._write_pending(key)
+        # empty lists that nothing was appended to
+        for key, (target, _) in self.pending.items():
+            self.datasets[key] = target
+        self.pending.clear()
+        self.pending_count = 0
+        self.file.flush()
+        self.last_flush = time.monotonic()
+
+    def finish(self, local, archive):
+        """Writes the final values of the datasets ``local`` and the
+        archived datasets, and returns the HDF5 file, which the caller
+        closes."""
+        f = self.open()
+        self.pending.clear()
+        self.pending_count = 0
+        for k, v in local.items():
+            self._create(k, v)
+        self.flush()
+        archive_group = f.create_group("archive")
+        for k, v in archive.items():
+            archive_group[k] = v
+        self.file = None
+        return f
+
+    def close(self):
+        if self.file is not None:
+            self.flush()
+            self.file.close()
+            self.file = None
 
 
 class DatasetManager:
@@ -182,6 +442,7 @@ class DatasetManager:
         self.broadcast = Notifier(dict())
         self.local = dict()
         self.archive = dict()
+        self.hdf5_writer = None
 
         self.ddb = ddb
         self.broadcast.publish = ddb.update
@@ -200,10 +461,14 @@ class DatasetManager:
             del self.broadcast[key]
         if save:
             self.local[key] = value
+            if self.hdf5_writer is not None:
+                self.hdf5_writer.set(key, value)
         elif key in self.local:
             del self.local[key]
+            if self.hdf5_writer is not None:
+                self.hdf5_writer.delete(key)
 
-    def mutate(self, key, index, value):
+    def _get_mutation_target(self, key):
         target = None
         if key in self.local:
             target = self.local[key]
@@ -213,13 +478,23 @@ class DatasetManager:
             target = self.broadcast[key][1]
         if target is None:
             raise KeyError("Cannot mutate non-existing dataset")
+        return target
 
+    def mutate(self, key, index, value):
+        target = self._get_mutation_target(key)
         if isinstance(index, tuple):
             if isinstance(index[0], tuple):
                 index = tuple(slice(*e) for e in index)
             else:
                 index = slice(*index)
         setitem(target, index, value)
+        if self.hdf5_writer is not None and key in self.local:
+            self.hdf5_writer.mutate(key, index, value, self.local[key])
+
+    def append_to(self, key, value):
+        self._get_mutation_target(key).append(value)
+        if self.hdf5_writer is not None and key in self.local:
+            self.hdf5_writer.append(key, value, self.local[key])
 
     def get(self, key, archive=False):
         if key in self.local:
@@ -3,15 +3,18 @@ import time
 import os
 import logging
 import traceback
+import importlib
+import site
+import sysconfig
 from collections import OrderedDict
 
-import h5py
-
 import artiq
 from artiq.protocols import pipe_ipc, pyon
 from artiq.protocols.packed_exceptions import raise_packed_exc
 from artiq.tools import multiline_log_config, file_import
-from artiq.master.worker_db import DeviceManager, DatasetManager, DummyDevice
+from artiq.master.worker_db import (DeviceManager, DatasetManager,
+                                    HDF5DatasetWriter, DummyDevice,
+                                    ClientPool)
 from artiq.language.environment import (is_experiment, TraceArgumentManager,
                                         ProcessArgumentManager)
 from artiq.language.core import set_watchdog_factory, TerminationRequested
@@ -133,6 +136,38 @@ def get_exp(file, class_name):
 register_experiment = make_parent_action("register_experiment")
 
 
+def _library_directories():
+    # Directories of the modules that are kept in a reused worker:
+    # the standard library, the installed packages and ARTIQ itself.
+    paths = sysconfig.get_paths()
+    directories = [paths[k] for k in ("stdlib", "platstdlib",
+                                      "purelib", "platlib")]
+    if hasattr(site, "getsitepackages"):
+        directories += site.getsitepackages()
+    if site.ENABLE_USER_SITE:
+        directories.append(site.getusersitepackages())
+    directories += artiq.__path__
+    return [os.path.realpath(d) + os.sep for d in directories]
+
+
+def purge_modules(initial_modules):
+    """Forget the modules imported since ``initial_modules``, except those
+    of the standard library, of the installed packages and of ARTIQ, so that
+    the next run in the same process imports their current version (e.g.
+    from another revision of the repository)."""
+    library_directories = _library_directories()
+    for name in set(sys.modules.keys()) - initial_modules:
+        filename = getattr(sys.modules[name], "__file__", None)
+        if name.startswith("artiq_worker_"):
+            del sys.modules[name]
+        elif filename is not None:
+            filename = os.path.realpath(filename)
+            if not any(filename.startswith(directory)
+                       for directory in library_directories):
+                del sys.modules[name]
+    importlib.invalidate_caches()
+
+
 class ExamineDeviceMgr:
     get_device_db = make_parent_action("get_device_db")
 
@@ -208,12 +243,18 @@ def main():
     expid = None
     exp = None
     exp_inst = None
+    experiment_file = None
     repository_path = None
 
+    # Controller connections are kept across the runs of a pooled worker.
+    client_pool = ClientPool()
     device_mgr = DeviceManager(ParentDeviceDB,
                                virtual_devices={"scheduler": Scheduler(),
-                                                "ccb": CCB()})
+                                                "ccb": CCB()},
+                               client_pool=client_pool)
     dataset_mgr = DatasetManager(ParentDatasetDB)
+    initial_cwd = os.getcwd()
+    initial_modules = set(sys.modules.keys())
 
     import_cache.install_hook()
 
@@ -225,6 +266,7 @@ def main():
                 start_time = time.localtime()
                 rid = obj["rid"]
                 expid = obj["expid"]
+                logging.getLogger().setLevel(expid["log_level"])
                 if obj["wd"] is not None:
                     # Using repository
                     experiment_file = os.path.join(obj["wd"], expid["file"])
@@ -241,22 +283,26 @@ def main():
                                        time.strftime("%H", start_time))
                 os.makedirs(dirname, exist_ok=True)
                 os.chdir(dirname)
+                dataset_mgr.hdf5_writer = HDF5DatasetWriter(
+                    "{:09}-{}.h5".format(rid, exp.__name__))
                 argument_mgr = ProcessArgumentManager(expid["arguments"])
                 exp_inst = exp((device_mgr, dataset_mgr, argument_mgr))
                 put_object({"action": "completed"})
             elif action == "prepare":
                 exp_inst.prepare()
+                dataset_mgr.hdf5_writer.flush()
                 put_object({"action": "completed"})
             elif action == "run":
                 exp_inst.run()
+                dataset_mgr.hdf5_writer.flush()
                 put_object({"action": "completed"})
             elif action == "analyze":
                 exp_inst.analyze()
+                dataset_mgr.hdf5_writer.flush()
                 put_object({"action": "completed"})
             elif action == "write_results":
-                filename = "{:09}-{}.h5".format(rid, exp.__name__)
-                with h5py.File(filename, "w") as f:
-                    dataset_mgr.write_hdf5(f)
+                with dataset_mgr.hdf5_writer.finish(
+                        dataset_mgr.local, dataset_mgr.archive) as f:
                     f["artiq_version"] = artiq_version
                     f["rid"] = rid
                     f["start_time"] = int(time.mktime(start_time))
@@ -265,6 +311,16 @@ def main():
             elif action == "examine":
                 examine(ExamineDeviceMgr, ExamineDatasetMgr, obj["file"])
                 put_object({"action": "completed"})
+            elif action == "reset":
+                # Prepare the process for another run (see WorkerPool).
+                device_mgr.close_devices()
+                if dataset_mgr.hdf5_writer is not None:
+                    dataset_mgr.hdf5_writer.close()
+                dataset_mgr = DatasetManager(ParentDatasetDB)
+                os.chdir(initial_cwd)
+                purge_modules(initial_modules)
+                rid = expid = exp = exp_inst = experiment_file = None
+                put_object({"action": "completed"})
             elif action == "terminate":
                 break
     except Exception as exc:
@@ -286,6 +342,10 @@ def main():
         put_object({"action": "exception"})
     finally:
         device_mgr.close_devices()
+        client_pool.close()
+        if dataset_mgr.hdf5_writer is not None:
+            # keep what was written of the results of the failed run
+            dataset_mgr.hdf5_writer.close()
         ipc.close()
 
 
@@ -9,15 +9,25 @@ and modifications to mutable types are not written back. For example, if the
 client passes a list as a parameter of an RPC method, and that method
 ``append()s`` an element to the list, the element is not appended to the
 client's list.
+
+Servers advertise the protocol extensions they support in their
+identification. With the ``request_ids`` extension, a client may tag its
+requests with an ``id`` that the server copies into the reply; the server
+then does not wait for the reply to be sent before reading the next request,
+so that several calls can be in flight on one connection and their replies
+can arrive out of order. With the ``batch`` extension, a client may send
+several calls in one request (see ``Client.batch_rpc``).
 """
 
 import socket
+import select
 import asyncio
 import threading
 import time
 import logging
 import inspect
 from operator import itemgetter
+from concurrent.futures import ThreadPoolExecutor
 
 from artiq.monkey_patches import *
 from artiq.protocols import pyon
@@ -41,6 +51,10 @@ class IncompatibleServer(Exception):
 
 
 _init_string = b"ARTIQ pc_rpc\n"
+_features = ["request_ids", "batch", "thread_metrics"]
+# Maximum number of requests with IDs processed at the same time for
+# one connection, after which the server stops reading requests.
+_max_pipelined = 256
 
 
 def _validate_target_name(target_name, target_names):
@@ -56,6 +70,40 @@ def _validate_target_name(target_name, target_names):
     return target_name
 
 
+class _Batch:
+    def __init__(self, valid_methods, execute):
+        self._valid_methods = valid_methods
+        self._execute = execute
+        self._calls = []
+        self.rpc_results = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.rpc_results = self._execute(self._calls)
+
+    def __getattr__(self, name):
+        if name not in self._valid_methods:
+            raise AttributeError
+        def proxy(*args, **kwargs):
+            self._calls.append({"name": name, "args": args, "kwargs": kwargs})
+        return proxy
+
+
+class _AsyncioBatch(_Batch):
+    def __enter__(self):
+        raise TypeError("use async with")
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.rpc_results = await self._execute(self._calls)
+
+
 class Client:
     """This class proxies the methods available on the server so that they
     can be used as if they were local methods.
@@ -103,6 +151,7 @@ class Client:
             server_identification = self.__recv()
             self.__target_names = server_identification["targets"]
             self.__description = server_identification["description"]
+            self.__features = server_identification.get("features", [])
             self.__selected_target = None
             self.__valid_methods = set()
             if target_name is not None:
@@ -140,6 +189,18 @@ class Client:
         """
         self.__socket.close()
 
+    def check_rpc_connection(self):
+        """Checks, without blocking, that the connection to the RPC server
+        can still be used for calls: returns ``False`` if the server has
+        closed it or sent unexpected data, ``True`` otherwise."""
+        try:
+            readable, _, _ = select.select([self.__socket], [], [], 0)
+        except (OSError, ValueError):
+            return False
+        # Between calls, the server never sends anything; the socket
+        # becomes readable when it is closed.
+        return not readable
+
     def __send(self, obj):
         line = pyon.encode(obj) + "\n"
         self.__socket.sendall(line.encode())
@@ -168,10 +229,44 @@ class Client:
         obj = {"action": "call", "name": name, "args": args, "kwargs": kwargs}
         return self.__do_action(obj)
 
+    def __do_batch(self, calls):
+        if not calls:
+            return []
+        if "batch" in self.__features:
+            return self.__do_action({"action": "batch", "calls": calls})
+        else:
+            return [self.__do_rpc(call["name"], call["args"], call["kwargs"])
+                    for call in calls]
+
+    def batch_rpc(self):
+        """Returns a context manager that collects the method calls made on
+        it and sends them to the server in a single request when the
+        ``with`` block exits. ::
+
+            with c.batch_rpc() as batch:
+                batch.set_frequency(0, 100e6)
+                batch.set_phase(0, 0.25)
+            frequency_result, phase_result = batch.rpc_results
+
+        The server executes the calls in order. Their return values are
+        available afterwards as the ``rpc_results`` list. If a call raises an
+        exception, the subsequent calls are not executed and the exception is
+        raised by the ``with`` statement.
+
+        With servers that do not support batches, the calls are sent one
+        by one when the block exits."""
+        return _Batch(self.__valid_methods, self.__do_batch)
+
     def get_rpc_method_list(self):
         obj = {"action": "get_rpc_method_list"}
         return self.__do_action(obj)
 
+    def get_rpc_thread_metrics(self):
+        """Returns the metrics of the methods that the server executes in
+        its thread pool. See ``Server.get_thread_metrics``."""
+        obj = {"action": "get_rpc_thread_metrics"}
+        return self.__do_action(obj)
+
     def __getattr__(self, name):
         if name not in self.__valid_methods:
             raise AttributeError
@@ -186,15 +281,29 @@ class AsyncioClient:
 
     All RPC methods are coroutines.
 
-    Concurrent access from different asyncio tasks is supported; all calls
-    use a single lock.
+    Concurrent access from different asyncio tasks is supported. By default,
+    all calls use a single lock and are sent one after the other.
+
+    :param pipelined: If the server supports it, send calls made concurrently
+        from different asyncio tasks without waiting for the replies to the
+        previous ones, and match replies to calls using request IDs.
+        Calls are then no longer serialized on the client side; the server
+        executes them in order unless it allows parallel calls (see
+        ``Server``).
     """
-    def __init__(self):
+    def __init__(self, pipelined=False):
         self.__lock = asyncio.Lock()
         self.__reader = None
         self.__writer = None
         self.__target_names = None
         self.__description = None
+        self.__pipelined = pipelined
+        self.__pipelining = False
+        self.__next_id = 0
+        self.__pending = dict()
+        self.__receive_task = None
+        self.__receive_closed = False
+        self.__receive_error = None
 
     async def connect_rpc(self, host, port, target_name):
         """Connects to the server. This cannot be done in __init__ because
@@ -207,6 +316,9 @@ class AsyncioClient:
             server_identification = await self.__recv()
             self.__target_names = server_identification["targets"]
             self.__description = server_identification["description"]
+            self.__features = server_identification.get("features", [])
+            self.__pipelining = (self.__pipelined and
+                                 "request_ids" in self.__features)
             self.__selected_target = None
             self.__valid_methods = set()
             if target_name is not None:
@@ -223,6 +335,8 @@ class AsyncioClient:
         self.__writer.write((target_name + "\n").encode())
         self.__selected_target = target_name
         self.__valid_methods = await self.__recv()
+        if self.__pipelining:
+            self.__receive_task = asyncio.ensure_future(self.__receive_cr())
 
     def get_selected_target(self):
         """Returns the selected target, or ``None`` if no target has been
@@ -243,6 +357,10 @@ class AsyncioClient:
 
         No further method calls should be done after this method is called.
         """
+        if self.__receive_task is not None:
+            self.__receive_task.cancel()
+            self.__receive_task = None
+        self.__fail_pending()
         self.__writer.close()
         self.__reader = None
         self.__writer = None
@@ -257,22 +375,98 @@ class AsyncioClient:
         line = await self.__reader.readline()
         return pyon.decode(line.decode())
 
-    async def __do_rpc(self, name, args, kwargs):
-        await self.__lock.acquire()
-        try:
-            obj = {"action": "call", "name": name,
-                   "args": args, "kwargs": kwargs}
-            self.__send(obj)
+    def __connection_closed(self):
+        exc = ConnectionError("connection to RPC server closed")
+        exc.__cause__ = self.__receive_error
+        return exc
 
-            obj = await self.__recv()
-            if obj["status"] == "ok":
-                return obj["ret"]
-            elif obj["status"] == "failed":
-                raise_packed_exc(obj["exception"])
-            else:
-                raise ValueError
+    def __fail_pending(self):
+        for future in self.__pending.values():
+            if not future.done():
+                future.set_exception(self.__connection_closed())
+        self.__pending.clear()
+
+    async def __receive_cr(self):
+        try:
+            while True:
+                line = await self.__reader.readline()
+                if not line:
+                    break
+                obj = pyon.decode(line.decode())
+                future = self.__pending.pop(obj["id"], None)
+                # The future is missing or cancelled if the call
+                # was cancelled while waiting for the reply.
+                if future is not None and not future.done():
+                    future.set_result(obj)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            self.__receive_error = e
         finally:
-            self.__lock.release()
+            # No reply can arrive anymore, so later calls fail immediately.
+            self.__receive_closed = True
+            self.__fail_pending()
+
+    async def __do_action(self, obj):
+        if self.__pipelining:
+            if self.__receive_closed:
+                raise self.__connection_closed()
+            request_id = self.__next_id
+            self.__next_id += 1
+            obj["id"] = request_id
+            future = asyncio.Future()
+            self.__pending[request_id] = future
+            try:
+                self.__send(obj)
+                obj = await future
+            finally:
+                self.__pending.pop(request_id, None)
+        else:
+            await self.__lock.acquire()
+            try:
+                self.__send(obj)
+                obj = await self.__recv()
+            finally:
+                self.__lock.release()
+
+        if obj["status"] == "ok":
+            return obj["ret"]
+        elif obj["status"] == "failed":
+            raise_packed_exc(obj["exception"])
+        else:
+            raise ValueError
+
+    async def __do_rpc(self, name, args, kwargs):
+        obj = {"action": "call", "name": name,
+               "args": args, "kwargs": kwargs}
+        return await self.__do_action(obj)
+
+    async def __do_batch(self, calls):
+        if not calls:
+            return []
+        if "batch" in self.__features:
+            return await self.__do_action({"action": "batch", "calls": calls})
+        else:
+            return [await self.__do_rpc(call["name"], call["args"],
+                                        call["kwargs"])
+                    for call in calls]
+
+    def batch_rpc(self):
+        """Returns an asynchronous context manager that collects method calls
+        and sends them in a single request. See ``Client.batch_rpc``. ::
+
+            async with c.batch_rpc() as batch:
+                batch.set_frequency(0, 100e6)
+                batch.set_phase(0, 0.25)
+
+        Calls on the batch object are not coroutines."""
+        return _AsyncioBatch(self.__valid_methods, self.__do_batch)
+
+    async def get_rpc_thread_metrics(self):
+        """Returns the metrics of the methods that the server executes in
+        its thread pool. See ``Server.get_thread_metrics``."""
+        obj = {"action": "get_rpc_thread_metrics"}
+        return await self.__do_action(obj)
 
     def __getattr__(self, name):
         if name not in self.__valid_methods:
@@ -306,6 +500,7 @@ class BestEffortClient:
         self.__conretry_terminate = False
         self.__socket = None
         self.__valid_methods = set()
+        self.__features = []
         try:
             self.__coninit(firstcon_timeout)
         except:
@@ -327,6 +522,7 @@ class BestEffortClient:
             self.__socket.settimeout(None)
         self.__socket.sendall(_init_string)
         server_identification = self.__recv()
+        self.__features = server_identification.get("features", [])
         target_name = _validate_target_name(self.__target_name,
                                             server_identification["targets"])
         self.__socket.sendall((target_name + "\n").encode())
@@ -381,11 +577,10 @@ class BestEffortClient:
             buf += more.decode()
         return pyon.decode(buf)
 
-    def __do_rpc(self, name, args, kwargs):
+    def __do_action(self, obj):
         if self.__conretry_thread is not None:
             return None
 
-        obj = {"action": "call", "name": name, "args": args, "kwargs": kwargs}
         try:
             self.__send(obj)
             obj = self.__recv()
@@ -404,6 +599,27 @@ class BestEffortClient:
             else:
                 raise ValueError
 
+    def __do_rpc(self, name, args, kwargs):
+        obj = {"action": "call", "name": name, "args": args, "kwargs": kwargs}
+        return self.__do_action(obj)
+
+    def __do_batch(self, calls):
+        if not calls:
+            return []
+        if "batch" in self.__features:
+            return self.__do_action({"action": "batch", "calls": calls})
+        else:
+            return [self.__do_rpc(call["name"], call["args"], call["kwargs"])
+                    for call in calls]
+
+    def batch_rpc(self):
+        """Returns a context manager that sends the calls made on it in
+        a single request. See ``Client.batch_rpc``.
+
+        If the batch failed because of a network error, ``rpc_results`` is
+        ``None``."""
+        return _Batch(self.__valid_methods, self.__do_batch)
+
     def __getattr__(self, name):
         if name not in self.__valid_methods:
             raise AttributeError
@@ -418,6 +634,83 @@ class BestEffortClient:
         raise NotImplementedError
 
 
+_not_threaded = object()
+
+
+def run_in_thread(lock="default"):
+    """Decorator for the synchronous methods of RPC targets that block
+    (e.g. on I/O). ``Server`` executes the decorated methods in its thread
+    pool instead of the event loop, so that they do not delay the calls
+    from other clients. ::
+
+        class Driver:
+            @run_in_thread()
+            def move(self, position):
+                ...
+
+    Such methods are not subject to the server-wide lock used when
+    ``allow_parallel`` is false. Instead, methods of a target that use the
+    same lock name are never executed concurrently.
+
+    :param lock: Name of the lock. By default, all the methods of a target
+        that run in threads share one lock. Use ``None`` for methods that
+        may be executed concurrently with any other method.
+    """
+    def decorator(method):
+        if inspect.iscoroutinefunction(method):
+            raise TypeError("coroutine methods cannot run in threads")
+        method._pc_rpc_thread_lock = lock
+        return method
+    return decorator
+
+
+class _ThreadMetrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.calls = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.total_time = 0.0
+        self.max_time = 0.0
+
+    def enqueue(self):
+        with self.lock:
+            self.queued += 1
+
+    def cancel(self):
+        with self.lock:
+            self.queued -= 1
+
+    def start(self, wait):
+        with self.lock:
+            self.queued -= 1
+            self.running += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+
+    def finish(self, time):
+        with self.lock:
+            self.running -= 1
+            self.calls += 1
+            self.total_time += time
+            self.max_time = max(self.max_time, time)
+
+    def get(self):
+        with self.lock:
+            calls = max(self.calls, 1)
+            return {
+                "queued": self.queued,
+                "running": self.running,
+                "calls": self.calls,
+                "mean_wait": self.total_wait/calls,
+                "max_wait": self.max_wait,
+                "mean_time": self.total_time/calls,
+                "max_time": self.max_time
+            }
+
+
 def _format_arguments(arguments):
     fmtargs = []
     for k, v in sorted(arguments.items(), key=itemgetter(0)):
@@ -455,10 +748,13 @@ class Server(_AsyncioServer):
     previous client failed to properly shut down its connection.
 
     If a target method is a coroutine, it is awaited and its return value
-    is sent to the RPC client. If ``allow_parallel`` is true, multiple
-    target coroutines may be executed in parallel (one per RPC client),
-    otherwise a lock ensures that the calls from several clients are executed
-    sequentially.
+    is sent to the RPC client. The calls of a batch (see
+    ``Client.batch_rpc``) are executed in order until one of them raises
+    an exception. If ``allow_parallel`` is true, multiple
+    target coroutines may be executed in parallel (one per RPC client, or
+    several per client for the requests a client pipelines using request
+    IDs), otherwise a lock ensures that the calls are executed sequentially,
+    in the order they are received.
 
     :param targets: A dictionary of objects providing the RPC methods to be
         exposed to the client. Keys are names identifying each object.
@@ -471,9 +767,15 @@ class Server(_AsyncioServer):
         requests from clients.
     :param allow_parallel: Allow concurrent asyncio calls to the target's
         methods.
+    :param threaded_targets: Names of the targets whose synchronous methods
+        are all executed in the thread pool, as if they were decorated with
+        ``run_in_thread()``.
+    :param max_threads: Size of the thread pool used for the methods
+        decorated with ``run_in_thread`` and the methods of
+        ``threaded_targets``.
     """
     def __init__(self, targets, description=None, builtin_terminate=False,
-                 allow_parallel=False):
+                 allow_parallel=False, threaded_targets=(), max_threads=4):
         _AsyncioServer.__init__(self)
         self.targets = targets
         self.description = description
@@ -484,10 +786,102 @@ class Server(_AsyncioServer):
             self._noparallel = None
         else:
             self._noparallel = asyncio.Lock()
+        self.threaded_targets = set(threaded_targets)
+        self.max_threads = max_threads
+        self._executor = None
+        self._thread_locks = dict()
+        self._thread_metrics = dict()
+
+    async def stop(self):
+        await _AsyncioServer.stop(self)
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def get_thread_metrics(self):
+        """Returns a dictionary giving, for each method that has been
+        executed in the thread pool (identified by its qualified name),
+        the number of calls waiting for their lock or a thread (``queued``),
+        the number of calls being executed (``running``), the number of
+        completed calls (``calls``), and the mean and maximum times
+        in seconds spent waiting (``mean_wait``, ``max_wait``) and executing
+        (``mean_time``, ``max_time``).
+
+        Clients obtain the same dictionary with ``get_rpc_thread_metrics``
+        (e.g. ``artiq_rpctool thread-metrics``)."""
+        return {name: metrics.get()
+                for name, metrics in self._thread_metrics.items()}
+
+    def _get_thread_lock(self, target, obj, threaded_target):
+        if obj["action"] != "call":
+            return _not_threaded
+        if self.builtin_terminate and obj["name"] == "terminate":
+            return _not_threaded
+        try:
+            method = getattr(target, obj["name"])
+        except:
+            # reported to the client when processing the call
+            return _not_threaded
+        lock = getattr(method, "_pc_rpc_thread_lock", _not_threaded)
+        if (lock is _not_threaded and threaded_target and
+                inspect.ismethod(method) and
+                not inspect.iscoroutinefunction(method)):
+            lock = "default"
+        return lock
+
+    async def _call_in_thread(self, target, method, lock_name, args, kwargs):
+        metrics = self._thread_metrics.get(method.__qualname__)
+        if metrics is None:
+            metrics = _ThreadMetrics()
+            self._thread_metrics[method.__qualname__] = metrics
+        metrics.enqueue()
+        queued_at = time.monotonic()
+
+        lock = None
+        if lock_name is not None:
+            key = (id(target), lock_name)
+            lock = self._thread_locks.get(key)
+            if lock is None:
+                lock = asyncio.Lock()
+                self._thread_locks[key] = lock
+            try:
+                await lock.acquire()
+            except:
+                metrics.cancel()
+                raise
 
-    async def _process_action(self, target, obj):
-        if self._noparallel is not None:
-            await self._noparallel.acquire()
+        def run():
+            started_at = time.monotonic()
+            metrics.start(started_at - queued_at)
+            try:
+                return method(*args, **kwargs)
+            finally:
+                metrics.finish(time.monotonic() - started_at)
+
+        def done(future):
+            if lock is not None:
+                lock.release()
+
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_threads)
+        future = asyncio.get_event_loop().run_in_executor(self._executor, run)
+        # Keep the lock until the method has returned, even if the call
+        # is cancelled (e.g. the client disconnects) in the meantime.
+        future.add_done_callback(done)
+        return await asyncio.shield(future)
+
+    async def _process_action(self, target, obj, threaded_target=False):
+        if obj["action"] == "get_rpc_thread_metrics":
+            # Not subject to the locks, so that the metrics can be
+            # obtained while calls are waiting.
+            return {"status": "ok", "ret": self.get_thread_metrics()}
+        thread_lock = self._get_thread_lock(target, obj, threaded_target)
+        if thread_lock is _not_threaded:
+            noparallel = self._noparallel
+        else:
+            noparallel = None
+        if noparallel is not None:
+            await noparallel.acquire()
         try:
             if obj["action"] == "get_rpc_method_list":
                 members = inspect.getmembers(target, inspect.ismethod)
@@ -522,9 +916,14 @@ class Server(_AsyncioServer):
                     return {"status": "ok", "ret": None}
                 else:
                     method = getattr(target, obj["name"])
-                    ret = method(*obj["args"], **obj["kwargs"])
-                    if inspect.iscoroutine(ret):
-                        ret = await ret
+                    if thread_lock is _not_threaded:
+                        ret = method(*obj["args"], **obj["kwargs"])
+                        if inspect.iscoroutine(ret):
+                            ret = await ret
+                    else:
+                        ret = await self._call_in_thread(
+                            target, method, thread_lock,
+                            obj["args"], obj["kwargs"])
                     return {"status": "ok", "ret": ret}
             else:
                 raise ValueError("Unknown action: {}"
@@ -537,10 +936,11 @@ class Server(_AsyncioServer):
                 "exception": current_exc_packed()
             }
         finally:
-            if self._noparallel is not None:
-                self._noparallel.release()
+            if noparallel is not None:
+                noparallel.release()
 
     async def _handle_connection_cr(self, reader, writer):
+        pipelined = set()
         try:
             line = await reader.readline()
             if line != _init_string:
@@ -548,7 +948,8 @@ class Server(_AsyncioServer):
 
             obj = {
                 "targets": sorted(self.targets.keys()),
-                "description": self.description
+                "description": self.description,
+                "features": _features
             }
             line = pyon.encode(obj) + "\n"
             writer.write(line.encode())
@@ -561,6 +962,7 @@ class Server(_AsyncioServer):
             except KeyError:
                 return
 
+            threaded_target = target_name in self.threaded_targets
             if callable(target):
                 target = target()
 
@@ -574,19 +976,76 @@ class Server(_AsyncioServer):
                 line = await reader.readline()
                 if not line:
                     break
-                reply = await self._process_action(target, pyon.decode(line.decode()))
-                writer.write((pyon.encode(reply) + "\n").encode())
+                obj = pyon.decode(line.decode())
+                if "id" in obj:
+                    if len(pipelined) >= _max_pipelined:
+                        await asyncio.wait(pipelined,
+                                           return_when=asyncio.FIRST_COMPLETED)
+                    task = asyncio.ensure_future(self._process_pipelined(
+                        target, obj, writer, threaded_target))
+                    pipelined.add(task)
+                    task.add_done_callback(pipelined.discard)
+                else:
+                    # Requests without ID are answered in order.
+                    if pipelined:
+                        await asyncio.wait(pipelined)
+                    reply = await self._process_request(target, obj,
+                                                        threaded_target)
+                    writer.write(self._encode_reply(reply))
+            if pipelined:
+                await asyncio.wait(pipelined)
         except (ConnectionResetError, ConnectionAbortedError, BrokenPipeError):
             # May happens on Windows when client disconnects
             pass
         finally:
+            for task in list(pipelined):
+                task.cancel()
+            writer.close()
+
+    async def _process_request(self, target, obj, threaded_target):
+        if obj["action"] == "batch":
+            results = []
+            for call in obj["calls"]:
+                call = dict(call, action="call")
+                reply = await self._process_action(target, call,
+                                                   threaded_target)
+                if reply["status"] != "ok":
+                    return reply
+                results.append(reply["ret"])
+            return {"status": "ok", "ret": results}
+        else:
+            return await self._process_action(target, obj, threaded_target)
+
+    @staticmethod
+    def _encode_reply(reply):
+        try:
+            return (pyon.encode(reply) + "\n").encode()
+        except:
+            # e.g. the return value cannot be serialized
+            failed = {"status": "failed", "exception": current_exc_packed()}
+            if "id" in reply:
+                failed["id"] = reply["id"]
+            return (pyon.encode(failed) + "\n").encode()
+
+    async def _process_pipelined(self, target, obj, writer, threaded_target):
+        try:
+            reply = await self._process_request(target, obj, threaded_target)
+            reply["id"] = obj["id"]
+            writer.write(self._encode_reply(reply))
+        except asyncio.CancelledError:
+            raise
+        except:
+            # The client would wait forever for the reply.
+            logger.error("failed to reply to pipelined RPC request, "
+                         "closing connection", exc_info=True)
             writer.close()
 
     async def wait_terminate(self):
         await self._terminate_request.wait()
 
 
-def simple_server_loop(targets, host, port, description=None):
+def simple_server_loop(targets, host, port, description=None,
+                       threaded_targets=()):
     """Runs a server until an exception is raised (e.g. the user hits Ctrl-C)
     or termination is requested by a client.
 
@@ -594,7 +1053,8 @@ def simple_server_loop(targets, host, port, description=None):
     """
     loop = asyncio.get_event_loop()
     try:
-        server = Server(targets, description, True)
+        server = Server(targets, description, True,
+                        threaded_targets=threaded_targets)
         loop.run_until_complete(server.start(host, port))
         try:
             loop.run_until_complete(server.wait_terminate())
@@ -9,6 +9,8 @@ objects. Its main features are:
 * Those data types are accurately reconstructed (unlike JSON where e.g. tuples
   become lists, and dictionary keys are turned into strings).
 * Supports Numpy arrays.
+* Decoding uses a dedicated parser instead of ``eval``, and is therefore
+  safe to use on untrusted input.
 
 The main rationale for this new custom serializer (instead of using JSON) is
 that JSON does not support Numpy and more generally cannot be extended with
@@ -18,6 +20,10 @@ function call syntax to express special data types.
 
 
 import base64
+import binascii
+import json
+import re
+import ast
 from fractions import Fraction
 from collections import OrderedDict
 import os
@@ -165,41 +171,373 @@ class _Encoder:
         return getattr(self, "encode_" + ty)(x)
 
 
+class _BufferEncoder(_Encoder):
+    def __init__(self, min_size):
+        _Encoder.__init__(self, False)
+        self.min_size = min_size
+        self.buffers = []
+
+    def encode_nparray(self, x):
+        if x.nbytes < self.min_size or x.dtype.hasobject:
+            return _Encoder.encode_nparray(self, x)
+        r = "npbuffer("
+        r += self.encode(x.shape) + ", "
+        r += self.encode(x.dtype.str) + ", "
+        r += self.encode(len(self.buffers))
+        r += ")"
+        self.buffers.append(x.reshape(-1).view(numpy.uint8).data)
+        return r
+
+
 def encode(x, pretty=False):
     """Serializes a Python object and returns the corresponding string in
     Python syntax."""
     return _Encoder(pretty).encode(x)
 
 
+def encode_buffers(x, min_size=0):
+    """Serializes a Python object like ``encode``, but keeps the data of
+    Numpy arrays out of the string.
+
+    Returns a tuple containing the string and a list of buffers (one
+    ``memoryview`` per array) to be passed to ``decode_buffers``.
+
+    Arrays smaller than ``min_size`` bytes are kept in the string."""
+    encoder = _BufferEncoder(min_size)
+    return encoder.encode(x), encoder.buffers
+
+
+def _dtype(dtype):
+    try:
+        return numpy.dtype(dtype)
+    except TypeError:
+        raise ValueError("invalid dtype") from None
+
+
 def _nparray(shape, dtype, data):
-    a = numpy.frombuffer(base64.b64decode(data), dtype=dtype)
-    a = a.copy()
-    return a.reshape(shape)
+    # Check the size before allocating anything, so that a small string
+    # cannot request a huge array.
+    dtype = _dtype(dtype)
+    if isinstance(shape, int):
+        shape = (shape, )
+    nbytes = dtype.itemsize
+    for dim in shape:
+        if type(dim) is not int or dim < 0:
+            raise ValueError("invalid array dimension")
+        nbytes *= dim
+    data = binascii.a2b_base64(data)
+    if len(data) != nbytes:
+        raise ValueError("array data does not match shape and dtype")
+    return numpy.frombuffer(data, dtype=dtype).reshape(shape).copy()
 
 
 def _npscalar(ty, data):
-    return numpy.frombuffer(base64.b64decode(data), dtype=ty)[0]
+    ty = _dtype(ty)
+    data = base64.b64decode(data)
+    if len(data) != ty.itemsize:
+        raise ValueError("scalar data does not match dtype")
+    return numpy.frombuffer(data, dtype=ty)[0]
 
 
-_eval_dict = {
-    "__builtins__": {},
+def _fraction(numerator, denominator=1):
+    # Fraction also parses strings, which can take unbounded time and memory.
+    if type(numerator) is not int or type(denominator) is not int:
+        raise ValueError("Fraction arguments must be integers")
+    if denominator == 0:
+        raise ValueError("zero denominator")
+    return Fraction(numerator, denominator)
 
-    "null": None,
-    "false": False,
-    "true": True,
-    "slice": slice,
 
-    "Fraction": Fraction,
+_functions = {
+    "slice": slice,
+    "Fraction": _fraction,
     "OrderedDict": OrderedDict,
     "nparray": _nparray,
     "npscalar": _npscalar
 }
 
+_constants = {
+    "null": None,
+    "false": False,
+    "true": True,
+    "None": None,
+    "False": False,
+    "True": True
+}
+
+_token_re = re.compile(r"""
+    \s*(?:
+        (?P<number>0[xX][0-9a-fA-F]+|0[oO][0-7]+|0[bB][01]+
+                   |(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?[jJ]?)
+       |(?P<string>[rRbBuU]{0,2}["'])
+       |(?P<name>[A-Za-z_][A-Za-z0-9_]*)
+       |(?P<punct>[-+()\[\]{},:=])
+    )""", re.VERBOSE)
+
+_string_re = {
+    "\"": re.compile(r'"[^"\\\n]*(?:\\.[^"\\\n]*)*"', re.DOTALL),
+    "'": re.compile(r"'[^'\\\n]*(?:\\.[^'\\\n]*)*'", re.DOTALL)
+}
+
+_whitespace_re = re.compile(r"\s*")
+
+_number_types = {int, float, complex}
+
+_json_decoder = json.JSONDecoder()
+
+
+class _Decoder:
+    # Recursive descent parser for the PYON subset of the Python syntax.
+    # Lists and dictionaries that are also valid JSON are handed over to
+    # the (much faster) JSON scanner of the standard library.
+    # Tokens are (kind, text, start, end) tuples.
+    def __init__(self, s, functions):
+        self.s = s
+        self.pos = 0
+        self.functions = functions
+        # JSON and Python differ in the handling of this escape sequence
+        self.json = "\\/" not in s
+        self.peeked_pos = None
+        self.peeked = None
+
+    def error(self, message, pos=None):
+        if pos is None:
+            pos = self.pos
+        return ValueError("{} at position {}".format(message, pos))
+
+    def scan_string(self, start, quote_start):
+        s = self.s
+        quote = s[quote_start]
+        # Fast path for strings without escape sequences, e.g.
+        # base64-encoded array data.
+        end = s.find(quote, quote_start + 1)
+        if (end < 0 or s.find("\\", quote_start, end) >= 0
+                or s.find("\n", quote_start, end) >= 0):
+            m = _string_re[quote].match(s, quote_start)
+            if m is None:
+                raise self.error("invalid string", start)
+            end = m.end() - 1
+        return ("string", s[start:end + 1], start, end + 1)
+
+    def peek(self):
+        if self.peeked_pos == self.pos:
+            return self.peeked
+        m = _token_re.match(self.s, self.pos)
+        if m is None:
+            start = _whitespace_re.match(self.s, self.pos).end()
+            if start != len(self.s):
+                raise self.error("invalid token", start)
+            token = None
+        else:
+            kind = m.lastgroup
+            if kind == "string":
+                token = self.scan_string(m.start(kind), m.end() - 1)
+            else:
+                token = (kind, m.group(kind), m.start(kind), m.end())
+        self.peeked_pos = self.pos
+        self.peeked = token
+        return token
+
+    def next(self):
+        token = self.peek()
+        if token is None:
+            raise self.error("unexpected end of input")
+        self.pos = token[3]
+        return token
+
+    def punct(self):
+        token = self.peek()
+        if token is None or token[0] != "punct":
+            return None
+        return token[1]
+
+    def expect(self, punct):
+        token = self.next()
+        if token[0] != "punct" or token[1] != punct:
+            raise self.error("expected '{}'".format(punct), token[2])
+
+    def decode(self):
+        value = self.value()
+        if self.peek() is not None:
+            raise self.error("trailing data", self.peek()[2])
+        return value
+
+    def value(self):
+        value = self.primary(self.next())
+        if type(value) in _number_types:
+            while True:
+                op = self.punct()
+                if op != "+" and op != "-":
+                    break
+                self.next()
+                operand = self.primary(self.next())
+                if type(operand) not in _number_types:
+                    raise self.error("arithmetic on non-number")
+                if op == "+":
+                    value = value + operand
+                else:
+                    value = value - operand
+        return value
+
+    def primary(self, token):
+        kind, token, start, end = token
+        if kind == "number":
+            if token[-1] in "jJ":
+                return complex(token)
+            elif token[:2] in ("0x", "0X", "0o", "0O", "0b", "0B"):
+                return int(token, 0)
+            elif "." in token or "e" in token or "E" in token:
+                return float(token)
+            else:
+                return int(token)
+        elif kind == "string":
+            if "\\" not in token:
+                if token[0] in "\"'":
+                    return token[1:-1]
+                elif token[0] in "bB" and token[1] in "\"'":
+                    try:
+                        return token[2:-1].encode("ascii")
+                    except UnicodeEncodeError:
+                        pass
+            try:
+                return ast.literal_eval(token)
+            except (SyntaxError, ValueError):
+                raise self.error("invalid string", start) from None
+        elif kind == "name":
+            if self.punct() == "(":
+                self.next()
+                return self.call(token, start)
+            try:
+                return _constants[token]
+            except KeyError:
+                raise self.error("unknown name '{}'".format(token),
+                                 start) from None
+        elif token == "-" or token == "+":
+            operand = self.primary(self.next())
+            if type(operand) not in _number_types:
+                raise self.error("arithmetic on non-number", start)
+            if token == "-":
+                return -operand
+            else:
+                return operand
+        elif token == "(":
+            return self.parenthesized()
+        elif token == "[" or token == "{":
+            if self.json:
+                try:
+                    value, self.pos = _json_decoder.raw_decode(self.s, start)
+                    return value
+                except ValueError:
+                    pass
+            if token == "[":
+                return self.sequence("]")
+            else:
+                return self.dict_or_set()
+        else:
+            raise self.error("unexpected '{}'".format(token), start)
+
+    def sequence(self, end):
+        values = []
+        while True:
+            if self.punct() == end:
+                self.next()
+                return values
+            values.append(self.value())
+            if self.punct() == ",":
+                self.next()
+            else:
+                self.expect(end)
+                return values
+
+    def parenthesized(self):
+        if self.punct() == ")":
+            self.next()
+            return ()
+        value = self.value()
+        if self.punct() == ")":
+            self.next()
+            return value
+        self.expect(",")
+        return (value, ) + tuple(self.sequence(")"))
+
+    def dict_or_set(self):
+        if self.punct() == "}":
+            self.next()
+            return dict()
+        key = self.value()
+        if self.punct() != ":":
+            if self.punct() == ",":
+                self.next()
+                return set([key] + self.sequence("}"))
+            self.expect("}")
+            return {key}
+        r = dict()
+        while True:
+            self.expect(":")
+            r[key] = self.value()
+            if self.punct() == ",":
+                self.next()
+                if self.punct() == "}":
+                    self.next()
+                    return r
+            else:
+                self.expect("}")
+                return r
+            key = self.value()
+
+    def call(self, name, start):
+        try:
+            function = self.functions[name]
+        except KeyError:
+            raise self.error("unknown function '{}'".format(name),
+                             start) from None
+        args = []
+        kwargs = dict()
+        while True:
+            if self.punct() == ")":
+                self.next()
+                break
+            pos = self.pos
+            kind, token, _, _ = self.next()
+            if kind == "name" and self.punct() == "=":
+                self.next()
+                kwargs[token] = self.value()
+            else:
+                self.pos = pos
+                args.append(self.value())
+            if self.punct() == ",":
+                self.next()
+            else:
+                self.expect(")")
+                break
+        try:
+            return function(*args, **kwargs)
+        except (TypeError, IndexError) as e:
+            # e.g. wrong number or types of arguments
+            raise self.error("invalid call to '{}': {}".format(name, e),
+                             start) from None
+
 
 def decode(s):
     """Parses a string in the Python syntax, reconstructs the corresponding
-    object, and returns it."""
-    return eval(s, _eval_dict, {})
+    object, and returns it.
+
+    Only the PYON subset of the Python syntax is accepted and the string is
+    never evaluated, so it is safe to decode untrusted input."""
+    return _Decoder(s, _functions).decode()
+
+
+def decode_buffers(s, buffers):
+    """Parses a string produced by ``encode_buffers`` and reconstructs the
+    corresponding object, taking the data of Numpy arrays from ``buffers``.
+
+    Arrays are created without copying the buffers and are writable if the
+    buffers are."""
+    def npbuffer(shape, dtype, index):
+        return numpy.frombuffer(buffers[index], dtype=dtype).reshape(shape)
+    functions = dict(_functions)
+    functions["npbuffer"] = npbuffer
+    return _Decoder(s, functions).decode()
 
 
 def store_file(filename, x):
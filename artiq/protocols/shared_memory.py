@@ -0,0 +1,148 @@
+"""
+This module passes PYON-serializable objects containing large Numpy arrays
+between processes on the same machine without serializing the array data:
+the data of each array is written once into a memory-mapped file (a
+*segment*), and only the PYON text with small descriptors is sent through
+the regular channel.
+
+The receiving process maps the segments copy-on-write, so that the arrays
+are writable without affecting other processes, and then notifies the
+sender that it no longer needs the files. The sender deletes each segment
+once all its recipients have released it.
+"""
+
+import os
+import mmap
+import tempfile
+
+from artiq.protocols import pyon
+
+
+def _segment_directory():
+    # On Linux, /dev/shm avoids writing the segments to disk.
+    if os.path.isdir("/dev/shm"):
+        return "/dev/shm"
+    else:
+        return tempfile.gettempdir()
+
+
+class SegmentWriter:
+    """Encodes objects for recipients that share the memory of this machine.
+
+    :param min_size: Arrays smaller than this size (in bytes) are encoded
+        into the PYON text as usual.
+    :param directory: Directory where the segments are created. Defaults to
+        ``/dev/shm`` if it exists, and the temporary directory otherwise.
+    """
+    def __init__(self, min_size=65536, directory=None):
+        self.min_size = min_size
+        if directory is None:
+            directory = _segment_directory()
+        self.directory = directory
+        self._prefix = "artiq_shm_{}_".format(os.getpid())
+        self._recipients = dict()
+        self._unlink_failed = set()
+        self._last = None
+
+    def encode(self, obj, recipient, share=False):
+        """Encodes ``obj`` for ``recipient`` (any hashable object identifying
+        the receiving process) and returns a tuple containing the PYON text
+        and the list of segment descriptors, to be passed to
+        ``decode_segments`` by the recipient.
+
+        If ``share`` is true and the same object was the last one encoded
+        with ``share``, the segments written for it are reused. This allows
+        the same object to be sent to several recipients at the cost of
+        writing its data only once; the object must not be modified in the
+        meantime. The object is referenced until all the recipients have
+        released its segments."""
+        if (share and self._last is not None and self._last[0] is obj and
+                all(segment[0] in self._recipients
+                    for segment in self._last[2])):
+            _, s, segments = self._last
+        else:
+            s, buffers = pyon.encode_buffers(obj, self.min_size)
+            segments = [self._write_segment(buffer) for buffer in buffers]
+            if share and segments:
+                self._last = obj, s, segments
+        for path, _ in segments:
+            self._recipients[path].add(recipient)
+        return s, segments
+
+    def _write_segment(self, buffer):
+        # mkstemp creates the file exclusively and readable only by us
+        fd, path = tempfile.mkstemp(prefix=self._prefix, dir=self.directory)
+        with open(fd, "wb") as f:
+            f.write(buffer)
+        self._recipients[path] = set()
+        return path, len(buffer)
+
+    def release(self, recipient, paths):
+        """Records that ``recipient`` has mapped the segments ``paths``,
+        and deletes the segments that are no longer needed."""
+        for path in paths:
+            recipients = self._recipients.get(path)
+            if recipients is None:
+                continue
+            recipients.discard(recipient)
+            if not recipients:
+                del self._recipients[path]
+                self._unlink(path)
+        if (self._last is not None and
+                not any(path in self._recipients
+                        for path, _ in self._last[2])):
+            self._last = None
+        self._retry_unlink()
+
+    def release_all(self, recipient):
+        """Releases all the segments of a recipient, e.g. after it has
+        terminated."""
+        self.release(recipient, [path for path, recipients
+                                 in self._recipients.items()
+                                 if recipient in recipients])
+
+    def close(self):
+        """Deletes all the segments."""
+        for path in list(self._recipients.keys()):
+            self._unlink(path)
+        self._recipients.clear()
+        self._last = None
+        self._retry_unlink()
+
+    def _unlink(self, path):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        except OSError:
+            # On Windows, files cannot be deleted while they are mapped.
+            self._unlink_failed.add(path)
+
+    def _retry_unlink(self):
+        for path in list(self._unlink_failed):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                self._unlink_failed.discard(path)
+            except OSError:
+                pass
+            else:
+                self._unlink_failed.discard(path)
+
+
+def decode_segments(s, segments):
+    """Decodes an object encoded by ``SegmentWriter.encode``, mapping the
+    data of the arrays from the segments without copying it.
+
+    The segments should be released (see ``SegmentWriter.release``)
+    afterwards."""
+    buffers = []
+    for path, size in segments:
+        if not size:
+            # empty files cannot be mapped
+            buffers.append(bytearray())
+            continue
+        with open(path, "rb") as f:
+            buffers.append(mmap.mmap(f.fileno(), size,
+                                     access=mmap.ACCESS_COPY))
+    return pyon.decode_buffers(s, buffers)
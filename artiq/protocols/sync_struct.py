@@ -8,11 +8,20 @@ describing each modification made to the structure (*mods*).
 
 Structures must be PYON serializable and contain only lists, dicts, and
 immutable types. Lists and dicts can be nested arbitrarily.
+
+Subscribers may negotiate a binary framing upon connection, where each
+message is sent as a length-prefixed frame and the data of Numpy arrays is
+carried as raw buffers next to the PYON text instead of being base64-encoded
+into it. Subscribers and publishers that do not support it fall back to
+PYON lines.
 """
 
 import asyncio
+import struct
+import itertools
 from operator import getitem
 from functools import partial
+from collections import OrderedDict
 
 from artiq.monkey_patches import *
 from artiq.protocols import pyon
@@ -20,6 +29,33 @@ from artiq.protocols.asyncio_server import AsyncioServer
 
 
 _init_string = b"ARTIQ sync_struct\n"
+_init_string_binary = b"ARTIQ sync_struct binary\n"
+_binary_ack = b"binary\n"
+
+_frame_header = struct.Struct(">II")
+_buffer_length = struct.Struct(">Q")
+
+
+def _encode_frame(obj):
+    s, buffers = pyon.encode_buffers(obj)
+    s = s.encode()
+    parts = [_frame_header.pack(len(s), len(buffers))]
+    parts += [_buffer_length.pack(len(buffer)) for buffer in buffers]
+    parts.append(s)
+    parts += buffers
+    return b"".join(parts)
+
+
+async def _read_frame(reader):
+    text_length, buffer_count = _frame_header.unpack(
+        await reader.readexactly(_frame_header.size))
+    buffer_lengths = struct.unpack(
+        ">{}Q".format(buffer_count),
+        await reader.readexactly(_buffer_length.size*buffer_count))
+    s = (await reader.readexactly(text_length)).decode()
+    buffers = [bytearray(await reader.readexactly(buffer_length))
+               for buffer_length in buffer_lengths]
+    return pyon.decode_buffers(s, buffers)
 
 
 def process_mod(target, mod):
@@ -52,8 +88,11 @@ class Subscriber:
         from the publisher. The mod is passed as parameter. The function is
         called after the mod has been processed.
         A list of functions may also be used, and they will be called in turn.
+    :param binary: Whether to request the binary framing from the publisher.
+        If the publisher does not support it, PYON lines are used.
     """
-    def __init__(self, notifier_name, target_builder, notify_cb=None):
+    def __init__(self, notifier_name, target_builder, notify_cb=None,
+                 binary=True):
         self.notifier_name = notifier_name
         self.target_builder = target_builder
         if notify_cb is None:
@@ -61,15 +100,41 @@ class Subscriber:
         if not isinstance(notify_cb, list):
             notify_cb = [notify_cb]
         self.notify_cbs = notify_cb
+        self.binary = binary
 
-    async def connect(self, host, port, before_receive_cb=None):
-        self.reader, self.writer = \
+    async def _open_connection(self, host, port, binary):
+        reader, writer = \
             await asyncio.open_connection(host, port, limit=4*1024*1024)
+        try:
+            if binary:
+                writer.write(_init_string_binary)
+            else:
+                writer.write(_init_string)
+            writer.write((self.notifier_name + "\n").encode())
+            if binary:
+                try:
+                    ack = await reader.readline()
+                except ConnectionError:
+                    ack = b""
+                if ack != _binary_ack:
+                    writer.close()
+                    return None
+        except:
+            writer.close()
+            raise
+        return reader, writer
+
+    async def connect(self, host, port, before_receive_cb=None):
+        streams = None
+        if self.binary:
+            streams = await self._open_connection(host, port, True)
+        self.binary_mode = streams is not None
+        if streams is None:
+            streams = await self._open_connection(host, port, False)
+        self.reader, self.writer = streams
         try:
             if before_receive_cb is not None:
                 before_receive_cb()
-            self.writer.write(_init_string)
-            self.writer.write((self.notifier_name + "\n").encode())
             self.receive_task = asyncio.ensure_future(self._receive_cr())
         except:
             self.writer.close()
@@ -92,10 +157,16 @@ class Subscriber:
     async def _receive_cr(self):
         target = None
         while True:
-            line = await self.reader.readline()
-            if not line:
-                return
-            mod = pyon.decode(line.decode())
+            if self.binary_mode:
+                try:
+                    mod = await _read_frame(self.reader)
+                except asyncio.IncompleteReadError:
+                    return
+            else:
+                line = await self.reader.readline()
+                if not line:
+                    return
+                mod = pyon.decode(line.decode())
 
             if mod["action"] == "init":
                 target = self.target_builder(mod["struct"])
@@ -189,17 +260,114 @@ class Notifier:
         return Notifier(item, self.root, self._path + [key])
 
 
+def _encode_line(obj):
+    line = pyon.encode(obj) + "\n"
+    return line.encode()
+
+
+def _coalescing_location(mod):
+    # Returns the location written by a mod that may replace an earlier
+    # mod at the same location, or None.
+    if mod["action"] != "setitem":
+        return None
+    key = mod["key"]
+    if isinstance(key, tuple):
+        if any(isinstance(k, slice) for k in key):
+            return None
+    elif isinstance(key, slice):
+        return None
+    location = (tuple(mod["path"]), key)
+    try:
+        hash(location)
+    except TypeError:
+        return None
+    return location
+
+
+class _Recipient:
+    # Queue of encoded mods for one subscriber.
+    #
+    # A setitem mod replaces an earlier queued setitem mod at the same
+    # location, as long as no mod in between wrote inside that location
+    # or changed the length of a list (which could shift indices).
+    # If the queued mods exceed max_backlog bytes, they are replaced by a
+    # fresh copy of the structure.
+    def __init__(self, binary, max_backlog):
+        self.binary = binary
+        self.max_backlog = max_backlog
+        self.entries = OrderedDict()
+        self.entry_ids = itertools.count()
+        self.coalescable = dict()
+        self.size = 0
+        self.available = asyncio.Event()
+
+    def put(self, data, location, path):
+        for i in range(len(path)):
+            try:
+                self.coalescable.pop((tuple(path[:i]), path[i]), None)
+            except TypeError:
+                pass
+        if location is None:
+            self.coalescable.clear()
+        else:
+            replaced = self.coalescable.pop(location, None)
+            if replaced is not None:
+                self.size -= len(self.entries.pop(replaced))
+
+        entry_id = next(self.entry_ids)
+        self.entries[entry_id] = data
+        self.size += len(data)
+        if location is not None:
+            self.coalescable[location] = entry_id
+        self.available.set()
+
+    def overflow(self):
+        return self.max_backlog is not None and self.size > self.max_backlog
+
+    def resync(self, data):
+        self.entries.clear()
+        self.coalescable.clear()
+        # the initial structure is not counted in the backlog
+        self.entries[next(self.entry_ids)] = data
+        self.size = 0
+        self.available.set()
+
+    def take(self):
+        entries = list(self.entries.values())
+        self.entries.clear()
+        self.coalescable.clear()
+        self.size = 0
+        self.available.clear()
+        return entries
+
+
 class Publisher(AsyncioServer):
     """A network server that publish changes to structures encapsulated in
     ``Notifiers``.
 
+    Mods are queued separately for each subscriber. If ``coalesce_window``
+    is set, a mod that sets an item replaces a queued mod that set the same
+    item and has not been sent yet, so that subscribers that cannot keep up
+    receive fewer, more recent mods instead of the complete history.
+    Otherwise, every mod is sent.
+
     :param notifiers: A dictionary containing the notifiers to associate with
         the ``Publisher``. The keys of the dictionary are the names of the
         notifiers to be used with ``Subscriber``.
+    :param coalesce_window: Time (in seconds) to wait after a mod is
+        published before sending it to a subscriber, during which further
+        mods can be merged with it. This also limits the rate at which
+        mods are sent to each subscriber. If zero, mods are not merged.
+    :param max_backlog: Maximum size (in bytes) of the encoded mods queued
+        for a subscriber. When it is exceeded, the queued mods are discarded
+        and the subscriber is sent a fresh copy of the structure instead.
+        If ``None``, the queue is unbounded.
     """
-    def __init__(self, notifiers):
+    def __init__(self, notifiers, coalesce_window=0, max_backlog=None):
         AsyncioServer.__init__(self)
         self.notifiers = notifiers
+        self.coalesce_window = coalesce_window
+        self.max_backlog = max_backlog
         self._recipients = {k: set() for k in notifiers.keys()}
         self._notifier_names = {id(v): k for k, v in notifiers.items()}
 
@@ -209,7 +377,11 @@ class Publisher(AsyncioServer):
     async def _handle_connection_cr(self, reader, writer):
         try:
             line = await reader.readline()
-            if line != _init_string:
+            if line == _init_string:
+                binary = False
+            elif line == _init_string_binary:
+                binary = True
+            else:
                 return
 
             line = await reader.readline()
@@ -223,19 +395,24 @@ class Publisher(AsyncioServer):
                 return
 
             obj = {"action": "init", "struct": notifier.read}
-            line = pyon.encode(obj) + "\n"
-            writer.write(line.encode())
+            if binary:
+                writer.write(_binary_ack)
+                writer.write(_encode_frame(obj))
+            else:
+                writer.write(_encode_line(obj))
 
-            queue = asyncio.Queue()
-            self._recipients[notifier_name].add(queue)
+            recipient = _Recipient(binary, self.max_backlog)
+            self._recipients[notifier_name].add(recipient)
             try:
                 while True:
-                    line = await queue.get()
-                    writer.write(line)
+                    await recipient.available.wait()
+                    if self.coalesce_window:
+                        await asyncio.sleep(self.coalesce_window)
+                    writer.writelines(recipient.take())
                     # raise exception on connection error
                     await writer.drain()
             finally:
-                self._recipients[notifier_name].remove(queue)
+                self._recipients[notifier_name].remove(recipient)
         except (ConnectionResetError, ConnectionAbortedError, BrokenPipeError):
             # subscribers disconnecting are a normal occurence
             pass
@@ -243,8 +420,30 @@ class Publisher(AsyncioServer):
             writer.close()
 
     def publish(self, notifier, mod):
-        line = pyon.encode(mod) + "\n"
-        line = line.encode()
         notifier_name = self._notifier_names[id(notifier)]
-        for recipient in self._recipients[notifier_name]:
-            recipient.put_nowait(line)
+        recipients = self._recipients[notifier_name]
+        if not recipients:
+            return
+
+        if self.coalesce_window:
+            location = _coalescing_location(mod)
+        else:
+            location = None
+        path = mod["path"]
+        line = None
+        frame = None
+        for recipient in recipients:
+            if recipient.binary:
+                if frame is None:
+                    frame = _encode_frame(mod)
+                recipient.put(frame, location, path)
+            else:
+                if line is None:
+                    line = _encode_line(mod)
+                recipient.put(line, location, path)
+            if recipient.overflow():
+                obj = {"action": "init", "struct": notifier.read}
+                if recipient.binary:
+                    recipient.resync(_encode_frame(obj))
+                else:
+                    recipient.resync(_encode_line(obj))
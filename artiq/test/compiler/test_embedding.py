@@ -0,0 +1,81 @@
+import unittest
+
+from artiq.language.core import kernel
+from artiq.compiler import types, builtins
+from artiq.compiler.embedding import Stitcher, ParseCache
+
+
+class MockDeviceManager:
+    def __init__(self, core):
+        self.core = core
+
+    def get(self, name):
+        assert name == "core"
+        return self.core
+
+
+class Kernels:
+    @kernel
+    def add(self, x):
+        return x + 1
+
+    @kernel
+    def run_int(self):
+        return self.add(1)
+
+    @kernel
+    def run_float(self):
+        return self.add(1.0)
+
+
+class ParseCacheCase(unittest.TestCase):
+    def setUp(self):
+        self.core = object()
+        self.dmgr = MockDeviceManager(self.core)
+        self.kernels = Kernels()
+
+    def stitch(self, function, parse_cache):
+        stitcher = Stitcher(core=self.core, dmgr=self.dmgr,
+                            parse_cache=parse_cache)
+        stitcher.stitch_call(function, (), {})
+        stitcher.finalize()
+        return stitcher
+
+    def function(self, stitcher, name):
+        # function names are mangled with the module and instance type names
+        nodes = [node for node in stitcher.typedtree.body
+                 if hasattr(node, "signature_type") and
+                    ".Kernels.{}".format(name) in node.name]
+        self.assertEqual(len(nodes), 1)
+        return nodes[0]
+
+    def test_reuse(self):
+        cache = ParseCache()
+        stitcher_int = self.stitch(self.kernels.run_int, cache)
+        self.assertEqual((cache.hits, cache.misses), (0, 2))
+        stitcher_float = self.stitch(self.kernels.run_float, cache)
+        self.assertEqual((cache.hits, cache.misses), (1, 3))
+
+        # types inferred by an earlier kernel do not leak into later ones
+        add_int = self.function(stitcher_int, "add")
+        add_float = self.function(stitcher_float, "add")
+        self.assertIsNot(add_int, add_float)
+        self.assertTrue(builtins.is_int(add_int.signature_type.find().ret))
+        self.assertTrue(builtins.is_float(add_float.signature_type.find().ret))
+
+        stitcher_again = self.stitch(self.kernels.run_int, cache)
+        self.assertEqual((cache.hits, cache.misses), (3, 3))
+        self.assertEqual(
+            types.TypePrinter().name(
+                self.function(stitcher_again, "run_int").signature_type),
+            types.TypePrinter().name(
+                self.function(stitcher_int, "run_int").signature_type))
+
+    def test_bounded(self):
+        cache = ParseCache(max_entries=1)
+        self.stitch(self.kernels.run_int, cache)
+        self.assertEqual(len(cache.entries), 1)
+        cache = ParseCache(max_entries=0)
+        self.stitch(self.kernels.run_int, cache)
+        self.stitch(self.kernels.run_int, cache)
+        self.assertEqual((cache.hits, cache.misses), (0, 4))
@@ -0,0 +1,62 @@
+import os
+import tempfile
+import unittest
+
+from artiq.compiler.library_cache import LibraryCache
+
+
+class LibraryCacheCase(unittest.TestCase):
+    def test_key(self):
+        cache = LibraryCache()
+        self.assertEqual(cache.key("a", b"b"), cache.key("a", b"b"))
+        self.assertNotEqual(cache.key("a", "b"), cache.key("ab"))
+
+    def test_hit_miss(self):
+        cache = LibraryCache()
+        key = cache.key("x")
+        self.assertIsNone(cache.get(key))
+        cache.put(key, b"library")
+        self.assertEqual(cache.get(key), b"library")
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_lru(self):
+        cache = LibraryCache(max_entries=2)
+        cache.put("a", b"1")
+        cache.put("b", b"2")
+        cache.get("a")
+        cache.put("c", b"3")
+        self.assertEqual(cache.get("a"), b"1")
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.evictions, 1)
+
+    def test_size_cap(self):
+        cache = LibraryCache(max_size=10)
+        cache.put("a", b"x"*6)
+        cache.put("b", b"x"*6)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.size, 6)
+        cache.put("c", b"x"*11)
+        self.assertIsNone(cache.get("c"))
+
+    def test_directory(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = LibraryCache(directory)
+            key = cache.key("x")
+            cache.put(key, b"library")
+
+            other = LibraryCache(directory)
+            self.assertEqual(other.get(key), b"library")
+            self.assertEqual(other.stats()["entries"], 1)
+
+            other.clear()
+            self.assertIsNone(LibraryCache(directory).get(key))
+
+    def test_directory_trim(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = LibraryCache(directory, max_size=10)
+            cache.put(cache.key("a"), b"x"*6)
+            os.utime(cache._path(cache.key("a")), (0, 0))
+            cache.put(cache.key("b"), b"x"*6)
+            cache.entries.clear()
+            self.assertIsNone(cache.get(cache.key("a")))
+            self.assertEqual(cache.get(cache.key("b")), b"x"*6)
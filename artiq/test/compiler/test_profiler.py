@@ -0,0 +1,68 @@
+import unittest
+import json
+
+from artiq.compiler.module import Source, Module
+from artiq.compiler.profiler import Profiler
+
+
+source = """
+def f(x):
+    return x + 1
+
+def g():
+    for i in range(10):
+        f(i)
+"""
+
+
+class ProfilerCase(unittest.TestCase):
+    def compile(self, profiler):
+        with profiler.context("kernel"):
+            Module(Source.from_string(source), profiler=profiler)
+
+    def test_records(self):
+        profiler = Profiler()
+        self.compile(profiler)
+
+        passes = [record["stack"][-1] for record in profiler.records]
+        self.assertEqual(passes[0], "CastMonomorphizer")
+        self.assertIn("Inferencer", passes)
+        self.assertIn("ARTIQIRGenerator", passes)
+        self.assertEqual(passes[-1], "LocalAccessValidator")
+        for record in profiler.records:
+            self.assertEqual(record["stack"][0], "kernel")
+            self.assertGreaterEqual(record["time"], 0)
+            self.assertIsNone(record["allocated"])
+
+        inferencer, = [record for record in profiler.records
+                       if record["stack"][-1] == "Inferencer"]
+        self.assertEqual(set(inferencer["functions"]), {"f", "g"})
+        self.assertGreater(inferencer["functions"]["g"]["size"],
+                           inferencer["functions"]["f"]["size"])
+
+        dce, = [record for record in profiler.records
+                if record["stack"][-1] == "DeadCodeEliminator"]
+        self.assertIn("input.f", dce["functions"])
+        for function in dce["functions"].values():
+            self.assertGreater(function["size"], 0)
+            self.assertGreaterEqual(function["time"], 0)
+
+    def test_allocations(self):
+        profiler = Profiler(allocations=True)
+        self.compile(profiler)
+        for record in profiler.records:
+            self.assertIsInstance(record["allocated"], int)
+
+    def test_output(self):
+        profiler = Profiler()
+        self.compile(profiler)
+
+        self.assertEqual(len(json.loads(profiler.to_json())["passes"]),
+                         len(profiler.records))
+
+        folded = profiler.to_folded().splitlines()
+        self.assertIn("kernel;Inferencer", [line.rsplit(" ", 1)[0] for line in folded])
+        self.assertIn("kernel;DeadCodeEliminator;input.f",
+                      [line.rsplit(" ", 1)[0] for line in folded])
+        for line in folded:
+            self.assertGreaterEqual(int(line.rsplit(" ", 1)[1]), 0)
@@ -0,0 +1,33 @@
+import unittest
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+
+from artiq.compiler.targets import NativeTarget
+
+
+def _function(index):
+    return """
+define i32 @f{index}(i32 %x) {{
+  %y = mul i32 %x, {index}
+  ret i32 %y
+}}
+""".format(index=index)
+
+
+class TargetCase(unittest.TestCase):
+    def test_pickle(self):
+        target = NativeTarget()
+        unpickled = pickle.loads(pickle.dumps(target))
+        self.assertEqual(unpickled.triple, target.triple)
+        self.assertEqual(unpickled.data_layout, target.data_layout)
+        self.assertEqual(unpickled.features, target.features)
+        self.assertIsNot(unpickled.llcontext, target.llcontext)
+
+    def test_compile_objects_parallel(self):
+        target = NativeTarget()
+        llirs = [_function(index) for index in range(4)]
+        serial = target.compile_objects(llirs)
+        with ProcessPoolExecutor(2) as executor:
+            parallel = target.compile_objects(llirs, executor)
+        self.assertEqual(len(parallel), len(llirs))
+        self.assertEqual(parallel, serial)
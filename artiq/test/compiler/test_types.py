@@ -0,0 +1,53 @@
+import unittest
+
+from artiq.compiler import types, builtins
+
+
+def depth(typ):
+    result = 0
+    while typ.parent is not typ:
+        typ = typ.parent
+        result += 1
+    return result
+
+
+class UnificationCase(unittest.TestCase):
+    def test_unify_chain(self):
+        tvars = [types.TVar() for _ in range(100000)]
+        for a, b in zip(tvars, tvars[1:]):
+            a.unify(b)
+        root = tvars[0].find()
+        self.assertTrue(all(tvar.find() is root for tvar in tvars))
+
+        tvars[-1].unify(builtins.TInt32())
+        self.assertTrue(builtins.is_int(tvars[0], types.TValue(32)))
+
+    def test_unify_rank(self):
+        # Repeatedly merging sets of equal size makes a tree of logarithmic
+        # depth when unifying by rank.
+        sets = [[types.TVar()] for _ in range(1024)]
+        while len(sets) > 1:
+            merged = []
+            for a, b in zip(sets[::2], sets[1::2]):
+                a[-1].unify(b[-1])
+                merged.append(a + b)
+            sets = merged
+        self.assertLessEqual(max(depth(tvar) for tvar in sets[0]), 10)
+
+    def test_unify_bound(self):
+        a, b, c = types.TVar(), types.TVar(), types.TVar()
+        a.unify(builtins.TList(b))
+        c.unify(a)
+        c.unify(builtins.TList(builtins.TFloat()))
+        self.assertEqual(a.find(), builtins.TList(builtins.TFloat()))
+        self.assertTrue(builtins.is_float(b))
+        with self.assertRaises(types.UnificationError):
+            a.unify(builtins.TBool())
+
+    def test_unify_self(self):
+        a, b = types.TVar(), types.TVar()
+        a.unify(b)
+        b.unify(a)
+        a.unify(a)
+        self.assertIs(a.find(), b.find())
+        self.assertTrue(types.is_var(a))
@@ -0,0 +1,217 @@
+import io
+import os
+import random
+import struct
+import tempfile
+import time
+import unittest
+
+import numpy
+
+from artiq.protocols.analyzer import MessageType, ExceptionType
+from artiq.coredevice.analyzer import (decode_dump, decode_dumps,
+                                       decode_message, decoded_dump_to_vcd,
+                                       decoded_dumps_to_vcd, DecodedDump,
+                                       DecodedMessages,
+                                       OutputMessage, InputMessage,
+                                       ExceptionMessage, StoppedMessage,
+                                       VCDManager, get_message_time,
+                                       create_channel_handlers,
+                                       get_vcd_log_channels, LogHandler)
+
+
+artiq_benchmark = os.getenv("ARTIQ_BENCHMARK")
+
+
+def encode_message(message_type, channel, data=0, address=0,
+                   rtio_counter=0, timestamp=0):
+    return struct.pack(">QIQQI", data, address, rtio_counter, timestamp,
+                       (channel << 2) | message_type.value)
+
+
+def encode_dump(messages, log_channel=2, dds_onehot_sel=0):
+    payload = b"".join(messages)
+    return struct.pack(">IQbbb", len(payload), len(payload), 0,
+                       log_channel, dds_onehot_sel) + payload
+
+
+def make_messages():
+    messages = []
+    for i in range(100):
+        messages.append(encode_message(
+            MessageType.output, i % 3, data=i % 2, address=0,
+            rtio_counter=1000 + 10*i, timestamp=2000 + 30*(99 - i)))
+        messages.append(encode_message(
+            MessageType.input, 1, data=i, rtio_counter=1000 + 10*i,
+            timestamp=2000 + 7*i))
+    messages.append(encode_message(
+        MessageType.exception, 4,
+        address=ExceptionType.o_underflow_reset.value, rtio_counter=5000))
+    messages.append(encode_message(MessageType.stopped, 0,
+                                   rtio_counter=6000))
+    return messages
+
+
+def make_ordered_messages(seed, n=500):
+    # Messages of each channel are in timestamp order, but the channels
+    # are interleaved arbitrarily and have coinciding timestamps.
+    rng = random.Random(seed)
+    timestamps = [10**6*seed + 1000]*4
+    rtio_counter = 10**6*seed
+    messages = []
+    log = "a\x1Ehello\x1Dbb\x1Eworld!\x1D"
+    log_words = [log[i:i+4].ljust(4, "\x00") for i in range(0, len(log), 4)]
+    for word in log_words:
+        rtio_counter += 3
+        timestamps[2] += 5
+        data = sum(ord(c) << (24 - 8*i) for i, c in enumerate(word))
+        messages.append(encode_message(
+            MessageType.output, 2, data=data,
+            rtio_counter=rtio_counter, timestamp=timestamps[2]))
+    for i in range(n):
+        channel = rng.choice([0, 1, 1, 3])
+        rtio_counter += rng.randrange(5)
+        timestamps[channel] += 10*rng.randrange(3)
+        if rng.random() < 0.01:
+            messages.append(encode_message(
+                MessageType.exception, channel,
+                address=ExceptionType.o_underflow_reset.value,
+                rtio_counter=rtio_counter))
+        elif channel == 1 and rng.random() < 0.5:
+            messages.append(encode_message(
+                MessageType.input, channel, data=rng.randrange(2),
+                rtio_counter=rtio_counter, timestamp=timestamps[channel]))
+        else:
+            messages.append(encode_message(
+                MessageType.output, channel, data=rng.randrange(2),
+                address=rng.randrange(2), rtio_counter=rtio_counter,
+                timestamp=timestamps[channel]))
+    messages.append(encode_message(MessageType.stopped, 0,
+                                   rtio_counter=rtio_counter + 1))
+    return messages
+
+
+devices = {
+    "core": {
+        "type": "local",
+        "module": "artiq.coredevice.core",
+        "class": "Core",
+        "arguments": {"ref_period": 1e-9}
+    },
+    "ttl0": {
+        "type": "local",
+        "module": "artiq.coredevice.ttl",
+        "class": "TTLOut",
+        "arguments": {"channel": 0}
+    },
+    "ttl1": {
+        "type": "local",
+        "module": "artiq.coredevice.ttl",
+        "class": "TTLInOut",
+        "arguments": {"channel": 1}
+    }
+}
+
+
+def reference_vcd(devices, dumps):
+    # Straightforward conversion of the messages sorted in memory.
+    f = io.StringIO()
+    vcd_manager = VCDManager(f)
+    vcd_manager.set_timescale_ps(1000)
+    messages = []
+    for dump in dumps:
+        messages += list(dump.messages)[:-1]
+    messages = sorted(messages, key=get_message_time)
+    channel_handlers = create_channel_handlers(
+        vcd_manager, devices, 1e-9, 3e9, False)
+    vcd_log_channels = get_vcd_log_channels(
+        2, DecodedMessages.from_messages(messages))
+    channel_handlers[2] = LogHandler(vcd_manager, vcd_log_channels)
+    slack = vcd_manager.get_channel("rtio_slack", 64)
+    vcd_manager.set_time(0)
+    start_time = get_message_time(messages[0])
+    for message in messages:
+        if message.channel in channel_handlers:
+            vcd_manager.set_time(get_message_time(message) - start_time)
+            channel_handlers[message.channel].process_message(message)
+            if isinstance(message, OutputMessage):
+                slack.set_value_double(
+                    (message.timestamp - message.rtio_counter)*1e-9)
+    vcd_manager.flush()
+    return f.getvalue()
+
+
+class AnalyzerDecodeCase(unittest.TestCase):
+    def test_decode_dump(self):
+        messages = make_messages()
+        dump = decode_dump(encode_dump(messages))
+        self.assertEqual(len(dump.messages), len(messages))
+        self.assertEqual(list(dump.messages),
+                         [decode_message(m) for m in messages])
+        self.assertIsInstance(dump.messages[-1], StoppedMessage)
+        self.assertIsInstance(dump.messages[-2], ExceptionMessage)
+        self.assertEqual(dump.messages[-2].exception_type,
+                         ExceptionType.o_underflow_reset)
+        self.assertEqual(list(dump.messages[10:20]),
+                         [decode_message(m) for m in messages[10:20]])
+        self.assertEqual(int(dump.messages.channel[1]), 1)
+
+    def test_vcd(self):
+        messages = make_messages()
+        dump = decode_dump(encode_dump(messages))
+        list_dump = DecodedDump(dump.log_channel, dump.dds_onehot_sel,
+                                list(dump.messages))
+        vcds = []
+        for d in dump, list_dump:
+            f = io.StringIO()
+            decoded_dump_to_vcd(f, devices, d)
+            vcds.append(f.getvalue())
+        self.assertEqual(vcds[0], vcds[1])
+        self.assertEqual(vcds[0], reference_vcd(devices, [dump]))
+        self.assertIn("$var wire 1 ! ttl/ttl0 $end", vcds[0])
+        self.assertIn("#0\n", vcds[0])
+
+    def test_vcd_streaming(self):
+        data = b"".join(encode_dump(make_ordered_messages(seed))
+                        for seed in range(3))
+        dumps = decode_dumps(data)
+        self.assertEqual(len(dumps), 3)
+        reference = reference_vcd(devices, dumps)
+        self.assertIn("log/bb", reference)
+        for chunk_size in 1, 7, 65536:
+            f = io.StringIO()
+            decoded_dumps_to_vcd(f, devices, dumps, flush_interval=0,
+                                 chunk_size=chunk_size)
+            self.assertEqual(f.getvalue(), reference)
+
+    @unittest.skipUnless(artiq_benchmark, "no ARTIQ_BENCHMARK")
+    def test_benchmark_vcd(self):
+        n = 10**7
+        rng = numpy.random.RandomState(0)
+        channel = rng.randint(0, 4, n)
+        message_type = numpy.where(channel == 1, rng.randint(0, 2, n), 0)
+        raw = numpy.empty(n, dtype=[("data", ">u8"), ("address", ">u4"),
+                                    ("rtio_counter", ">u8"),
+                                    ("timestamp", ">u8"),
+                                    ("type_channel", ">u4")])
+        raw["data"] = rng.randint(0, 2, n)
+        raw["address"] = 0
+        raw["rtio_counter"] = numpy.arange(n)*8
+        raw["timestamp"] = numpy.arange(n)*8 + rng.randint(0, 1000, n)*8
+        for i in range(4):
+            # keep the messages of each channel in order
+            selected = channel == i
+            raw["timestamp"][selected] = numpy.sort(raw["timestamp"][selected])
+        raw["type_channel"] = (channel << 2) | message_type
+        payload = raw.tobytes() + encode_message(MessageType.stopped, 0,
+                                                 rtio_counter=8*n)
+        data = struct.pack(">IQbbb", len(payload), len(payload), 0,
+                           2, 0) + payload
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with open(os.path.join(tmpdir, "dump.vcd"), "w") as f:
+                t0 = time.monotonic()
+                decoded_dump_to_vcd(f, devices, decode_dump(data))
+                t1 = time.monotonic()
+        print("{} messages to VCD: {:.1f} s ({:.0f} messages/s)"
+              .format(n, t1 - t0, n/(t1 - t0)))
@@ -1,5 +1,7 @@
 # Copyright (C) 2014, 2015 Robert Jordens <jordens@gmail.com>
 
+import os
+import time
 import unittest
 
 import numpy as np
@@ -7,6 +9,9 @@ import numpy as np
 from artiq.wavesynth import coefficients, compute_samples
 
 
+artiq_benchmark = os.getenv("ARTIQ_BENCHMARK")
+
+
 class TestSplineCoef(unittest.TestCase):
     def setUp(self):
         self.x = np.arange(5.)
@@ -41,6 +46,65 @@ class TestSplineCoef(unittest.TestCase):
         y = s.trigger()[0]
         np.testing.assert_almost_equal(y[::scale], self.y[0, :-1])
 
+    def test_batch(self):
+        scales = [.01, .02, -.05, .01]
+        segments = self.s.get_segments(start=0.5, stop=3.7, scales=scales)
+        for scale, segment in zip(scales, segments):
+            coefficients.segment_coefficients.clear()
+            self.assertEqual(list(segment), list(self.s.get_segment(
+                start=0.5, stop=3.7, scale=scale)))
+
+    def test_cache(self):
+        coefficients.segment_coefficients.clear()
+        s = coefficients.SplineSource(self.x, self.y.copy(), order=4)
+        self.assertIs(s.spline, self.s.spline)
+        durations, coef = s.get_coefficients(start=1.5, stop=3.2, scale=.01)
+        self.assertIs(s.get_coefficients(start=1.5, stop=3.2, scale=.01)[1],
+                      coef)
+        self.assertIs(self.s.get_coefficients(start=1.5, stop=3.2,
+                                              scale=.01)[1], coef)
+        self.assertIsNot(s.get_coefficients(start=1.5, stop=3.2,
+                                            scale=.02)[1], coef)
+        self.assertFalse(coef.flags.writeable)
+        d = list(s.get_segment(start=1.5, stop=3.2, scale=.01))
+        d[0]["trigger"] = True
+        self.assertEqual(list(s.get_segment(start=1.5, stop=3.2, scale=.01)),
+                         self.test_get_segment())
+
+        t = coefficients.SplineSource(self.x, self.y + 1, order=4)
+        self.assertIsNot(t.spline, self.s.spline)
+
+    def test_cache_bounded(self):
+        memo = coefficients.segment_coefficients
+        for i in range(memo.size + 10):
+            self.s.get_coefficients(start=0, stop=4, scale=1/(i + 1))
+        self.assertEqual(len(memo.entries), memo.size)
+
+    @unittest.skipUnless(artiq_benchmark, "no ARTIQ_BENCHMARK")
+    def test_benchmark(self):
+        x = np.arange(200.)
+        y = np.sin(2*np.pi*x/50)*np.arange(1, 9)[:, None]
+        scales = [1/(i + 100) for i in range(20)]
+        coefficients.spline_fits.clear()
+        coefficients.segment_coefficients.clear()
+        t0 = time.monotonic()
+        for scale in scales:
+            s = coefficients.SplineSource(x, y, order=4)
+            s.get_coefficients(start=10, stop=190, scale=scale)
+        t1 = time.monotonic()
+        coefficients.spline_fits.clear()
+        coefficients.segment_coefficients.clear()
+        s = coefficients.SplineSource(x, y, order=4)
+        s.get_coefficients_batch(start=10, stop=190, scales=scales)
+        t2 = time.monotonic()
+        for scale in scales:
+            s = coefficients.SplineSource(x, y, order=4)
+            s.get_coefficients(start=10, stop=190, scale=scale)
+        t3 = time.monotonic()
+        print("{} scales: individual {:.1f} ms, batch {:.1f} ms, "
+              "cached {:.1f} ms".format(len(scales), (t1 - t0)*1e3,
+                                        (t2 - t1)*1e3, (t3 - t2)*1e3))
+
     @unittest.skip("manual/visual test")
     def test_plot(self):
         import matplotlib.pyplot as plt
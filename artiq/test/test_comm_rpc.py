@@ -0,0 +1,149 @@
+import os
+import struct
+import time
+import unittest
+
+import numpy
+
+from artiq.coredevice.comm_generic import CommGeneric, RPCReturnValueError
+
+
+artiq_benchmark = os.getenv("ARTIQ_BENCHMARK")
+
+
+class LoopbackComm(CommGeneric):
+    def __init__(self, data=b""):
+        super().__init__()
+        self.data = data
+        self.position = 0
+        self.written = bytearray()
+        self.reads = 0
+        self.writes = 0
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    def read(self, length):
+        self.reads += 1
+        chunk = self.data[self.position:self.position+length]
+        if len(chunk) != length:
+            raise ConnectionResetError("Connection closed")
+        self.position += length
+        return chunk
+
+    def write(self, data):
+        self.writes += 1
+        self.written += data
+
+
+_scalar_formats = {"b": ">B", "i": ">l", "I": ">q", "f": ">d"}
+
+
+def encode_list(tag, elements, list_tag="l"):
+    # Encoding used by the runtime when sending RPC arguments:
+    # each element is preceded by its tag.
+    r = list_tag.encode() + struct.pack(">l", len(elements))
+    for element in elements:
+        r += tag.encode() + struct.pack(_scalar_formats[tag], element)
+    return r
+
+
+def sent_bytes(tags, value):
+    comm = LoopbackComm()
+    comm._send_rpc_value(bytearray(tags), value, value, None)
+    return bytes(comm.written), comm.writes
+
+
+class RPCMarshallingCase(unittest.TestCase):
+    def test_receive_list(self):
+        for tag, elements, host_type in [
+                ("b", [True, False, True], bool),
+                ("i", [1, -2, 2**31-1], numpy.int32),
+                ("I", [1, -2, 2**40], numpy.int64),
+                ("f", [1.5, -2.0, 1e300], float)]:
+            comm = LoopbackComm(encode_list(tag, elements))
+            value = comm._receive_rpc_value(None)
+            self.assertEqual(value, elements)
+            self.assertIsInstance(value, list)
+            for element in value:
+                self.assertIs(type(element), host_type)
+            self.assertEqual(comm.reads, 4)
+
+    def test_receive_array(self):
+        for tag, elements, dtype in [
+                ("b", [True, False], numpy.bool_),
+                ("i", [1, -2], numpy.int32),
+                ("I", [1, 2**40], numpy.int64),
+                ("f", [0.5, -1.0], numpy.float64)]:
+            comm = LoopbackComm(encode_list(tag, elements, "a"))
+            value = comm._receive_rpc_value(None)
+            self.assertEqual(value.dtype, dtype)
+            self.assertEqual(value.tolist(), elements)
+
+    def test_receive_nested(self):
+        data = b"l" + struct.pack(">l", 2) + \
+            encode_list("i", [1, 2]) + encode_list("i", [])
+        comm = LoopbackComm(data + b"n")
+        self.assertEqual(comm._receive_rpc_value(None), [[1, 2], []])
+        self.assertIsNone(comm._receive_rpc_value(None))
+
+    def test_receive_inhomogeneous(self):
+        data = b"l" + struct.pack(">l", 2) + b"i" + struct.pack(">l", 1) + \
+            b"f" + struct.pack(">d", 1.0)
+        with self.assertRaises(IOError):
+            LoopbackComm(data)._receive_rpc_value(None)
+
+    def test_send(self):
+        for tags, value, expected in [
+                (b"lb", [True, False], [1, 0]),
+                (b"li", [1, numpy.int32(-2), True], [1, -2, 1]),
+                (b"lI", [1, 2**40, numpy.int64(-3)], [1, 2**40, -3]),
+                (b"lf", [0.5, numpy.float64(1.5)], [0.5, 1.5]),
+                (b"ai", numpy.array([1, 2, 3]), [1, 2, 3]),
+                (b"af", numpy.linspace(0, 1, 5), numpy.linspace(0, 1, 5)),
+                (b"af", [0.25], [0.25])]:
+            tag = chr(tags[1])
+            data, writes = sent_bytes(tags, value)
+            self.assertEqual(data, struct.pack(">l", len(expected)) +
+                b"".join(struct.pack(_scalar_formats[tag], element)
+                         for element in expected))
+            self.assertEqual(writes, 2)
+
+    def test_send_nested(self):
+        data, _ = sent_bytes(b"t\x02lis", ([1, 2], "x"))
+        self.assertEqual(data, struct.pack(">lll", 2, 1, 2) +
+                               struct.pack(">l", 1) + b"x")
+        data, _ = sent_bytes(b"t\x02lt\x02iii", ([(1, 2)], 3))
+        self.assertEqual(data, struct.pack(">llll", 1, 1, 2, 3))
+
+    def test_send_type_mismatch(self):
+        for tags, value in [
+                (b"li", [1, 2.0]),
+                (b"li", [2**31-1]),
+                (b"li", numpy.array([1.0])),
+                (b"lI", [2**70]),
+                (b"lb", [1]),
+                (b"lf", [1]),
+                (b"af", numpy.zeros((2, 2))),
+                (b"li", numpy.array([1]))]:
+            with self.assertRaises(RPCReturnValueError):
+                sent_bytes(tags, value)
+
+    @unittest.skipUnless(artiq_benchmark, "no ARTIQ_BENCHMARK")
+    def test_benchmark(self):
+        n = 10000
+        for tag, elements in [("i", list(range(n))),
+                              ("f", numpy.linspace(0, 1, n).tolist())]:
+            data = encode_list(tag, elements, "a")
+            t0 = time.monotonic()
+            for _ in range(100):
+                LoopbackComm(data)._receive_rpc_value(None)
+            t1 = time.monotonic()
+            for _ in range(100):
+                sent_bytes(b"l" + tag.encode(), elements)
+            t2 = time.monotonic()
+            print("{}-element {} array: receive {:.0f} us, send {:.0f} us"
+                  .format(n, tag, (t1 - t0)*1e4, (t2 - t1)*1e4))
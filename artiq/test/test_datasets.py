@@ -0,0 +1,102 @@
+import os
+import tempfile
+import unittest
+
+import h5py
+import numpy as np
+
+from artiq.master.worker_db import DatasetManager, HDF5DatasetWriter
+
+
+class MockDatasetDB:
+    def __init__(self):
+        self.data = dict()
+
+    def get(self, key):
+        return self.data[key][1]
+
+    def update(self, mod):
+        pass
+
+
+class HDF5WriterCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tmpdir.name, "results.h5")
+        self.dataset_mgr = DatasetManager(MockDatasetDB())
+        self.dataset_mgr.hdf5_writer = HDF5DatasetWriter(self.filename)
+
+    def tearDown(self):
+        self.dataset_mgr.hdf5_writer.close()
+        self.tmpdir.cleanup()
+
+    def _check(self, datasets):
+        # compare with the non-incremental output
+        with h5py.File(self.filename, "r") as f, \
+                h5py.File("reference.h5", "w", "core",
+                          backing_store=False) as reference:
+            self.dataset_mgr.write_hdf5(reference)
+            self.assertEqual(set(f["datasets"].keys()), set(datasets))
+            self.assertEqual(set(reference["datasets"].keys()), set(datasets))
+            for key in datasets:
+                value = np.asarray(f["datasets"][key][()])
+                expected = np.asarray(reference["datasets"][key][()])
+                self.assertEqual(value.dtype, expected.dtype, key)
+                np.testing.assert_array_equal(value, expected, key)
+
+    def test_datasets(self):
+        mgr = self.dataset_mgr
+        mgr.set("scalar", 42)
+        mgr.set("string", "abc")
+        mgr.set("array", np.zeros((4, 3)))
+        mgr.mutate("array", ((1, 3), (0, 2)), np.ones((2, 2)))
+        mgr.set("list", [1, 2, 3], broadcast=True)
+        mgr.mutate("list", 0, 10)
+        for i in range(100):
+            mgr.append_to("list", i)
+        mgr.set("float_list", [])
+        mgr.append_to("float_list", 1)
+        mgr.hdf5_writer.flush()
+        mgr.append_to("float_list", 1.5)
+        mgr.mutate("float_list", 0, 0.5)
+        mgr.set("empty", [])
+        mgr.set("ignored", 1)
+        mgr.set("ignored", 2, save=False, broadcast=True)
+        self.assertEqual(mgr.local["list"][:4], [10, 2, 3, 0])
+
+        with mgr.hdf5_writer.finish(mgr.local, mgr.archive) as f:
+            self.assertIsNotNone(f["datasets"]["list"].chunks)
+            self.assertEqual(len(f["datasets"]["list"]), 103)
+        self._check(["scalar", "string", "array", "list", "float_list",
+                     "empty"])
+
+    def test_modified_in_place(self):
+        mgr = self.dataset_mgr
+        mgr.set("array", np.zeros(4))
+        mgr.set("list", [0, 1])
+        mgr.hdf5_writer.flush()
+        mgr.local["array"][:] = 7
+        mgr.local["list"].append(2)
+        with mgr.hdf5_writer.finish(mgr.local, mgr.archive) as f:
+            pass
+        with h5py.File(self.filename, "r") as f:
+            self.assertEqual(f["datasets"]["array"][()].tolist(), [7.0] * 4)
+            self.assertEqual(f["datasets"]["list"][()].tolist(), [0, 1, 2])
+        self._check(["array", "list"])
+
+    def test_interrupted(self):
+        mgr = self.dataset_mgr
+        mgr.hdf5_writer.flush_interval = 0
+        mgr.set("list", [0.0])
+        mgr.append_to("list", 1.0)
+        mgr.append_to("list", 2.0)
+        # e.g. the worker terminating with an exception
+        mgr.hdf5_writer.close()
+        with h5py.File(self.filename, "r") as f:
+            self.assertEqual(f["datasets"]["list"][()].tolist(),
+                             [0.0, 1.0, 2.0])
+            self.assertNotIn("archive", f)
+
+    def test_no_datasets(self):
+        self.dataset_mgr.hdf5_writer.close()
+        self.assertFalse(os.path.exists(self.filename))
@@ -0,0 +1,115 @@
+import unittest
+import asyncio
+import threading
+import time
+
+from artiq.protocols import pc_rpc
+from artiq.master.worker_db import DeviceManager, ClientPool
+
+
+test_address = "::1"
+test_port = 7777
+
+
+class MockDeviceDB:
+    def __init__(self, data):
+        self.data = data
+
+    def get(self, key):
+        return self.data[key]
+
+    def get_device_db(self):
+        return self.data
+
+
+class Target:
+    def echo(self, x):
+        return x
+
+
+class ClientPoolCase(unittest.TestCase):
+    def setUp(self):
+        self.connections = 0
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever)
+        self.thread.start()
+        self.start_server()
+
+        ddb = MockDeviceDB({
+            "ctl": {"type": "controller",
+                    "host": test_address, "port": test_port},
+            "ctl_alias": "ctl",
+            "ctl_aux": {"type": "controller_aux_target",
+                        "controller": "ctl", "target_name": "target"},
+            "ctl_best_effort": {"type": "controller", "best_effort": True,
+                                "host": test_address, "port": test_port}
+        })
+        self.pool = ClientPool()
+        self.device_mgr = DeviceManager(ddb, client_pool=self.pool)
+
+    def tearDown(self):
+        self.device_mgr.close_devices()
+        self.pool.close()
+        self.stop_server()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+    def _target(self):
+        # called by the server for each connection
+        self.connections += 1
+        return Target()
+
+    def start_server(self):
+        self.server = pc_rpc.Server({"target": self._target})
+        asyncio.run_coroutine_threadsafe(
+            self.server.start(test_address, test_port), self.loop).result()
+
+    def stop_server(self):
+        asyncio.run_coroutine_threadsafe(
+            self.server.stop(), self.loop).result()
+
+    def test_reuse(self):
+        ctl = self.device_mgr.get("ctl")
+        self.assertEqual(ctl.echo(1), 1)
+        self.device_mgr.close_devices()
+        self.assertIs(self.device_mgr.get("ctl"), ctl)
+        self.assertEqual(ctl.echo(2), 2)
+        # devices of the same controller need their own connections
+        # while the first one is in use
+        ctl_alias = self.device_mgr.get("ctl_alias")
+        ctl_aux = self.device_mgr.get("ctl_aux")
+        self.assertEqual(len({ctl, ctl_alias, ctl_aux}), 3)
+        self.assertEqual(self.connections, 3)
+        self.device_mgr.close_devices()
+        self.device_mgr.get("ctl")
+        self.device_mgr.get("ctl_alias")
+        self.device_mgr.get("ctl_aux")
+        self.assertEqual(self.connections, 3)
+
+    def test_best_effort(self):
+        ctl = self.device_mgr.get("ctl_best_effort")
+        self.assertIsInstance(ctl, pc_rpc.BestEffortClient)
+        self.device_mgr.close_devices()
+        self.assertIsNot(self.device_mgr.get("ctl_best_effort"), ctl)
+
+    def test_closed(self):
+        ctl = self.device_mgr.get("ctl")
+        self.device_mgr.close_devices()
+        self.stop_server()
+        self.start_server()
+        # wait for the client to see the connection closed by the server
+        for i in range(100):
+            if not ctl.check_rpc_connection():
+                break
+            time.sleep(0.01)
+        new_ctl = self.device_mgr.get("ctl")
+        self.assertIsNot(new_ctl, ctl)
+        self.assertEqual(new_ctl.echo(1), 1)
+
+    def test_idle(self):
+        self.pool.max_idle = 0
+        ctl = self.device_mgr.get("ctl")
+        self.device_mgr.close_devices()
+        self.assertIsNot(self.device_mgr.get("ctl"), ctl)
+        self.assertEqual(self.connections, 2)
@@ -1,4 +1,5 @@
 import unittest
+import os
 import sys
 import subprocess
 import asyncio
@@ -9,6 +10,8 @@ import numpy as np
 from artiq.protocols import pc_rpc, fire_and_forget
 
 
+artiq_benchmark = os.getenv("ARTIQ_BENCHMARK")
+
 test_address = "::1"
 test_port = 7777
 test_object = [5, 2.1, None, True, False,
@@ -47,18 +50,54 @@ class RPCCase(unittest.TestCase):
             self.assertEqual(test_object, test_object_back)
             with self.assertRaises(AttributeError):
                 remote.non_existing_method
+            self._blocking_batch(remote)
             remote.terminate()
         finally:
             remote.close_rpc()
 
+    def _blocking_batch(self, remote):
+        with remote.batch_rpc() as batch:
+            batch.echo(1)
+            batch.async_echo(test_object)
+        self.assertEqual(batch.rpc_results, [1, test_object])
+        with remote.batch_rpc() as batch:
+            pass
+        self.assertEqual(batch.rpc_results, [])
+        with self.assertRaises(ValueError):
+            with remote.batch_rpc() as batch:
+                batch.fail()
+                batch.echo(2)
+        self.assertIsNone(batch.rpc_results)
+        with self.assertRaises(AttributeError):
+            batch.non_existing_method
+
     def test_blocking_echo(self):
         self._run_server_and_test(self._blocking_echo, "test")
 
     def test_blocking_echo_autotarget(self):
         self._run_server_and_test(self._blocking_echo, pc_rpc.AutoTarget)
 
-    async def _asyncio_echo(self, target):
-        remote = pc_rpc.AsyncioClient()
+    def _best_effort_batch(self):
+        # BestEffortClient does not report connection failures
+        for attempt in range(100):
+            time.sleep(.2)
+            try:
+                pc_rpc.Client(test_address, test_port, "test").close_rpc()
+            except ConnectionRefusedError:
+                pass
+            else:
+                break
+        remote = pc_rpc.BestEffortClient(test_address, test_port, "test")
+        try:
+            self._blocking_batch(remote)
+            remote.terminate()
+        finally:
+            remote.close_rpc()
+
+    def test_best_effort_batch(self):
+        self._run_server_and_test(self._best_effort_batch)
+
+    async def _asyncio_connect(self, remote, target):
         for attempt in range(100):
             await asyncio.sleep(.2)
             try:
@@ -67,6 +106,10 @@ class RPCCase(unittest.TestCase):
                 pass
             else:
                 break
+
+    async def _asyncio_echo(self, target, pipelined=False):
+        remote = pc_rpc.AsyncioClient(pipelined=pipelined)
+        await self._asyncio_connect(remote, target)
         try:
             test_object_back = await remote.echo(test_object)
             self.assertEqual(test_object, test_object_back)
@@ -74,24 +117,240 @@ class RPCCase(unittest.TestCase):
             self.assertEqual(test_object, test_object_back)
             with self.assertRaises(AttributeError):
                 await remote.non_existing_method
+            async with remote.batch_rpc() as batch:
+                batch.echo(1)
+                batch.async_echo(test_object)
+            self.assertEqual(batch.rpc_results, [1, test_object])
+            with self.assertRaises(ValueError):
+                async with remote.batch_rpc() as batch:
+                    batch.fail()
+                    batch.echo(2)
+            self.assertIsNone(batch.rpc_results)
             await remote.terminate()
         finally:
             remote.close_rpc()
 
-    def _loop_asyncio_echo(self, target):
+    def _loop_asyncio(self, coro):
         loop = asyncio.new_event_loop()
         asyncio.set_event_loop(loop)
         try:
-            loop.run_until_complete(self._asyncio_echo(target))
+            loop.run_until_complete(coro)
         finally:
             loop.close()
 
+    def _loop_asyncio_echo(self, target, pipelined=False):
+        self._loop_asyncio(self._asyncio_echo(target, pipelined))
+
     def test_asyncio_echo(self):
         self._run_server_and_test(self._loop_asyncio_echo, "test")
 
     def test_asyncio_echo_autotarget(self):
         self._run_server_and_test(self._loop_asyncio_echo, pc_rpc.AutoTarget)
 
+    def test_asyncio_echo_pipelined(self):
+        self._run_server_and_test(self._loop_asyncio_echo, "test", True)
+
+    async def _asyncio_pipelined(self):
+        remote = pc_rpc.AsyncioClient(pipelined=True)
+        await self._asyncio_connect(remote, "test")
+        try:
+            calls = [remote.async_echo(i) if i % 2 else remote.echo(i)
+                     for i in range(100)]
+            calls.append(remote.fail())
+            results = await asyncio.gather(*calls, return_exceptions=True)
+            self.assertEqual(results[:100], list(range(100)))
+            self.assertIsInstance(results[100], ValueError)
+            await remote.terminate()
+        finally:
+            remote.close_rpc()
+
+    def test_asyncio_pipelined(self):
+        self._run_server_and_test(self._loop_asyncio,
+                                  self._asyncio_pipelined())
+
+    async def _asyncio_benchmark(self):
+        n = 2000
+        for pipelined in False, True:
+            remote = pc_rpc.AsyncioClient(pipelined=pipelined)
+            await self._asyncio_connect(remote, "test")
+            try:
+                t0 = time.monotonic()
+                await asyncio.gather(*[remote.echo(i) for i in range(n)])
+                t1 = time.monotonic()
+                print("{} {} calls: {:.0f} calls/s".format(
+                    n, "pipelined" if pipelined else "sequential",
+                    n/(t1 - t0)))
+                if pipelined:
+                    t0 = time.monotonic()
+                    async with remote.batch_rpc() as batch:
+                        for i in range(n):
+                            batch.echo(i)
+                    t1 = time.monotonic()
+                    print("{} batched calls: {:.0f} calls/s".format(
+                        n, n/(t1 - t0)))
+                    await remote.terminate()
+            finally:
+                remote.close_rpc()
+
+    @unittest.skipUnless(artiq_benchmark, "no ARTIQ_BENCHMARK")
+    def test_asyncio_benchmark(self):
+        self._run_server_and_test(self._loop_asyncio,
+                                  self._asyncio_benchmark())
+
+
+class Blocking:
+    def __init__(self):
+        self.running = 0
+        self.max_running = 0
+
+    def _sleep(self, t):
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        time.sleep(t)
+        self.running -= 1
+        return t
+
+    @pc_rpc.run_in_thread()
+    def sleep(self, t):
+        return self._sleep(t)
+
+    @pc_rpc.run_in_thread(lock=None)
+    def sleep_unlocked(self, t):
+        return self._sleep(t)
+
+    def echo(self, x):
+        return x
+
+
+class ThreadedServerCase(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def _run(self, test, **kwargs):
+        async def run():
+            self.target = Blocking()
+            self.server = pc_rpc.Server({"blocking": self.target}, **kwargs)
+            await self.server.start(test_address, test_port)
+            try:
+                remotes = []
+                for i in range(3):
+                    remote = pc_rpc.AsyncioClient()
+                    await remote.connect_rpc(test_address, test_port,
+                                             "blocking")
+                    remotes.append(remote)
+                try:
+                    await test(*remotes)
+                finally:
+                    for remote in remotes:
+                        remote.close_rpc()
+            finally:
+                await self.server.stop()
+        self.loop.run_until_complete(run())
+
+    async def _gather_sleeps(self, sleep, echo):
+        done = []
+        async def call(coro, name):
+            await coro
+            done.append(name)
+        await asyncio.gather(call(sleep[0](0.2), "sleep"),
+                             call(sleep[1](0.2), "sleep"),
+                             call(echo(1), "echo"))
+        self.assertEqual(done[0], "echo")
+
+    def test_serialized(self):
+        async def test(a, b, c):
+            await self._gather_sleeps([a.sleep, b.sleep], c.echo)
+            self.assertEqual(self.target.max_running, 1)
+            metrics = self.server.get_thread_metrics()["Blocking.sleep"]
+            self.assertEqual(metrics["calls"], 2)
+            self.assertEqual(metrics["queued"], 0)
+            self.assertEqual(metrics["running"], 0)
+            self.assertGreater(metrics["max_wait"], 0.1)
+            self.assertGreater(metrics["mean_time"], 0.1)
+            self.assertNotIn("Blocking.echo", self.server.get_thread_metrics())
+            self.assertEqual(await c.get_rpc_thread_metrics(),
+                             self.server.get_thread_metrics())
+        self._run(test)
+
+    def test_unlocked(self):
+        async def test(a, b, c):
+            await self._gather_sleeps([a.sleep_unlocked, b.sleep_unlocked],
+                                      c.echo)
+            self.assertEqual(self.target.max_running, 2)
+        self._run(test)
+
+    def test_threaded_target(self):
+        async def test(a, b, c):
+            await asyncio.gather(a._sleep(0.1), b._sleep(0.1), c._sleep(0.1))
+            self.assertEqual(self.target.max_running, 1)
+            metrics = self.server.get_thread_metrics()["Blocking._sleep"]
+            self.assertEqual(metrics["calls"], 3)
+        self._run(test, threaded_targets={"blocking"})
+
+    def test_coroutine(self):
+        with self.assertRaises(TypeError):
+            class Target:
+                @pc_rpc.run_in_thread()
+                async def f(self):
+                    pass
+
+
+class PipelinedCase(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        self.loop.close()
+
+    async def _server_closed(self):
+        server = pc_rpc.Server({"test": Echo()})
+        await server.start(test_address, test_port)
+        remote = pc_rpc.AsyncioClient(pipelined=True)
+        try:
+            await remote.connect_rpc(test_address, test_port, "test")
+            self.assertEqual(await remote.echo(1), 1)
+            await server.stop()
+            # wait for the client to see the connection closed
+            for i in range(100):
+                try:
+                    await asyncio.wait_for(remote.echo(2), 1.0)
+                except ConnectionError:
+                    break
+                await asyncio.sleep(0.01)
+            else:
+                self.fail("call did not fail")
+            with self.assertRaises(ConnectionError):
+                await asyncio.wait_for(remote.echo(3), 1.0)
+        finally:
+            remote.close_rpc()
+
+    def test_server_closed(self):
+        self.loop.run_until_complete(self._server_closed())
+
+    async def _unserializable(self):
+        server = pc_rpc.Server({"test": Echo()})
+        await server.start(test_address, test_port)
+        try:
+            for pipelined in False, True:
+                remote = pc_rpc.AsyncioClient(pipelined=pipelined)
+                await remote.connect_rpc(test_address, test_port, "test")
+                try:
+                    with self.assertRaises(TypeError):
+                        await asyncio.wait_for(remote.unserializable(), 1.0)
+                    self.assertEqual(await remote.echo(1), 1)
+                finally:
+                    remote.close_rpc()
+        finally:
+            await server.stop()
+
+    def test_unserializable(self):
+        self.loop.run_until_complete(self._unserializable())
+
 
 class FireAndForgetCase(unittest.TestCase):
     def _set_ok(self):
@@ -115,6 +374,12 @@ class Echo:
         await asyncio.sleep(0.01)
         return x
 
+    def fail(self):
+        raise ValueError
+
+    def unserializable(self):
+        return object()
+
 
 def run_server():
     loop = asyncio.new_event_loop()
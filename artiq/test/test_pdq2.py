@@ -3,12 +3,113 @@
 import unittest
 import os
 import io
+import copy
+import struct
+import time
 
-from artiq.devices.pdq2.driver import Pdq2
+import numpy as np
+
+from artiq.devices.pdq2.driver import Pdq2, Segment
+from artiq.devices.pdq2.mediator import CompoundPDQ2
 from artiq.wavesynth.compute_samples import Synthesizer
 
 
 pdq2_gateware = os.getenv("ARTIQ_PDQ2_GATEWARE")
+artiq_benchmark = os.getenv("ARTIQ_BENCHMARK")
+
+
+def random_lines(n, seed=0):
+    rng = np.random.RandomState(seed)
+    duration = rng.randint(1, 1 << 16, n)
+    amplitude = rng.uniform(-1, 1, (n, 4))*[9, 1e-3, 1e-8, 1e-13]
+    # exercise compression of the zero high order coefficients
+    amplitude[rng.randint(4, size=n)[:, None] <= np.arange(4)] = 0
+    phase = rng.uniform(-.5, .5, (n, 3))*[1, 1e-2, 1e-7]
+    trigger = rng.randint(2, size=n).astype(bool)
+    return duration, amplitude, phase, trigger
+
+
+def random_program_lines(n, seed=0):
+    duration, amplitude, phase, trigger = random_lines(n, seed)
+    rng = np.random.RandomState(seed)
+    lines = []
+    for i in range(n):
+        bias_count = rng.randint(5) if i % 7 else 1
+        if rng.randint(2):
+            mixed = {"bias": {"amplitude": [.1]}}
+        else:
+            mixed = {"dds": {"amplitude": amplitude[i].tolist()}}
+        lines.append({
+            "duration": int(duration[i]),
+            "trigger": bool(trigger[i]),
+            "dac_divider": 1 << rng.randint(3),
+            "channel_data": [
+                {"bias": {"amplitude": amplitude[i, :bias_count].tolist()},
+                 "silence": bool(rng.randint(2))},
+                {"dds": {"amplitude": amplitude[i].tolist(),
+                         "phase": phase[i].tolist(),
+                         "clear": bool(rng.randint(2))}},
+                mixed,
+            ]})
+    return lines
+
+
+def program_segments_by_line(segments, data):
+    # reference for Pdq2.program_segments, appending the lines one by one
+    for line in data:
+        shift = int(np.log2(line.get("dac_divider", 1)))
+        for segment, channel_data in zip(segments, line["channel_data"]):
+            channel_data = dict(channel_data)
+            silence = channel_data.pop("silence", False)
+            for target, target_data in channel_data.items():
+                getattr(segment, target)(
+                    shift=shift, duration=line["duration"],
+                    trigger=line.get("trigger", False), silence=silence,
+                    **target_data)
+
+
+class TestSegment(unittest.TestCase):
+    def test_bias_lines(self):
+        duration, amplitude, phase, trigger = random_lines(1000)
+        ref = Segment()
+        for d, a, t in zip(duration, amplitude, trigger):
+            a = list(a)
+            while len(a) > 1 and not a[-1]:
+                a.pop()
+            ref.bias(amplitude=a, duration=int(d), trigger=bool(t))
+        segment = Segment()
+        segment.bias_lines(duration, amplitude, trigger=trigger)
+        self.assertEqual(segment.data, ref.data)
+
+    def test_dds_lines(self):
+        duration, amplitude, phase, trigger = random_lines(1000)
+        ref = Segment()
+        for d, a, p in zip(duration, amplitude, phase):
+            ref.dds(amplitude=list(a), phase=list(p), duration=int(d),
+                    shift=1, clear=True)
+        segment = Segment()
+        segment.dds_lines(duration, amplitude, phase, shift=1, clear=True)
+        self.assertEqual(segment.data, ref.data)
+
+    def test_range(self):
+        with self.assertRaises(struct.error):
+            Segment().bias_lines([1], [[20.]])
+        with self.assertRaises(struct.error):
+            Segment().bias_lines([1 << 16], [[0.]])
+
+    @unittest.skipUnless(artiq_benchmark, "no ARTIQ_BENCHMARK")
+    def test_benchmark(self):
+        n = 100000
+        duration, amplitude, phase, trigger = random_lines(n)
+        t0 = time.monotonic()
+        segment = Segment()
+        for d, a in zip(duration.tolist(), amplitude.tolist()):
+            segment.bias(amplitude=a, duration=d)
+        t1 = time.monotonic()
+        Segment().bias_lines(duration, amplitude, compress=False)
+        t2 = time.monotonic()
+        print("{} bias lines: {:.0f} ms line by line, {:.0f} ms columnar"
+              .format(n, (t1 - t0)*1e3, (t2 - t1)*1e3))
 
 
 class TestPdq2(unittest.TestCase):
@@ -16,6 +117,15 @@ class TestPdq2(unittest.TestCase):
         self.dev = Pdq2(dev=io.BytesIO())
         self.synth = Synthesizer(3, _test_program)
 
+    def test_program_segments(self):
+        for data in _test_program + [random_program_lines(200)]:
+            segments = [Segment() for i in range(3)]
+            ref = [Segment() for i in range(3)]
+            self.dev.program_segments(segments, data)
+            program_segments_by_line(ref, data)
+            self.assertEqual([s.data for s in segments],
+                             [s.data for s in ref])
+
     def test_reset(self):
         self.dev.cmd("RESET", True)
         buf = self.dev.dev.getvalue()
@@ -34,6 +144,82 @@ class TestPdq2(unittest.TestCase):
         # self.dev.cmd("TRIGGER", True)
         return self.dev.dev.getvalue()
 
+    def _record_writes(self):
+        writes = []
+        write_mem = self.dev.write_mem
+        def record(channel, data, start_addr=0):
+            writes.append((channel, start_addr, len(data)//2))
+            write_mem(channel, data, start_addr)
+        self.dev.write_mem = record
+        return writes
+
+    def test_program_diff(self):
+        writes = self._record_writes()
+        self.dev.program(_test_program)
+        full = [bytes(memory) for memory in self.dev.memory]
+        self.assertEqual(len(writes), self.dev.num_channels)
+        digest = self.dev.get_program_digest()
+        self.assertIsNotNone(digest)
+
+        del writes[:]
+        self.dev.program(_test_program)
+        self.assertEqual(writes, [])
+        self.assertEqual(self.dev.get_program_digest(), digest)
+
+        program = copy.deepcopy(_test_program)
+        program[0][1]["channel_data"][0]["bias"]["amplitude"][0] = .3
+        program[0][2]["duration"] = 30
+        self.dev.program(program)
+        self.assertNotEqual(self.dev.get_program_digest(), digest)
+        # one line on channel 0, and the durations of the last line
+        self.assertEqual([w[0] for w in writes], [0, 0, 1, 2])
+        self.assertLess(sum(w[2] for w in writes), 20)
+
+        # the memories are the same as after a full write
+        memory = [bytes(m) for m in self.dev.memory]
+        self.dev.invalidate_memory()
+        self.dev.program(program)
+        self.assertEqual([bytes(m) for m in self.dev.memory], memory)
+        self.assertNotEqual(memory, full)
+
+        del writes[:]
+        self.dev.cmd("RESET", True)
+        self.dev.program(program)
+        self.assertEqual(len(writes), self.dev.num_channels)
+
+    def test_invalidate(self):
+        self.dev.program(_test_program)
+        dmgr = {"core": None, "pdq2": self.dev, "trigger": None,
+                "frame0": None, "frame1": None, "frame2": None}
+        compound = CompoundPDQ2(dmgr, ["pdq2"], "trigger",
+                                ["frame0", "frame1", "frame2"])
+        compound.invalidate()
+        self.assertIsNone(self.dev.get_program_digest())
+        self.assertEqual(self.dev.memory, [None]*self.dev.num_channels)
+
+        self.dev.program(_test_program)
+        self.dev.close()
+        self.assertIsNone(self.dev.get_program_digest())
+
+    def test_write_mem_error(self):
+        self.dev.program(_test_program)
+        self.assertIsNotNone(self.dev.memory[0])
+        write = self.dev.write
+        def fail(data):
+            raise IOError
+        self.dev.write = fail
+        with self.assertRaises(IOError):
+            self.dev.write_mem(0, b"\x00\x00", 1)
+        self.assertIsNone(self.dev.memory[0])
+        self.assertIsNone(self.dev.get_program_digest())
+
+        # the next program rewrites the memory of the channel completely
+        self.dev.write = write
+        writes = self._record_writes()
+        self.dev.program(_test_program)
+        self.assertEqual(writes[0][:2], (0, 0))
+        self.assertEqual(writes[0][2], len(self.dev.memory[0])//2)
+
     def test_synth(self):
         s = self.synth
         s.select(0)
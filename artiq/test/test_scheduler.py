@@ -3,10 +3,15 @@ import logging
 import asyncio
 import sys
 import os
-from time import time, sleep
+import random
+from time import time, sleep, monotonic
 
 from artiq.experiment import *
-from artiq.master.scheduler import Scheduler
+from artiq.master.scheduler import Scheduler, Pipeline, Deleter, RunStatus
+from artiq.protocols.sync_struct import Notifier
+
+
+artiq_benchmark = os.getenv("ARTIQ_BENCHMARK")
 
 
 class EmptyExperiment(EnvExperiment):
@@ -82,8 +87,14 @@ class SchedulerCase(unittest.TestCase):
         asyncio.set_event_loop(self.loop)
 
     def test_steps(self):
+        self._test_steps(Scheduler(_RIDCounter(0), dict(), None))
+
+    def test_steps_worker_pool(self):
+        self._test_steps(Scheduler(_RIDCounter(0), dict(), None,
+                                   worker_pool_size=1))
+
+    def _test_steps(self, scheduler):
         loop = self.loop
-        scheduler = Scheduler(_RIDCounter(0), dict(), None)
         expid = _get_expid("EmptyExperiment")
 
         expect = _get_basic_steps(1, expid)
@@ -219,5 +230,80 @@ class SchedulerCase(unittest.TestCase):
         loop.run_until_complete(done.wait())
         loop.run_until_complete(scheduler.stop())
 
+    def _get_pipeline(self):
+        # stages are not started, runs only change status when told to
+        return Pipeline(_RIDCounter(0), Deleter(dict()), dict(),
+                        Notifier(dict()), None)
+
+    def test_priority_index(self):
+        loop = self.loop
+        pipeline = self._get_pipeline()
+        pool = pipeline.pool
+        expid = _get_expid("EmptyExperiment")
+        rng = random.Random(0)
+        now = time()
+        for i in range(200):
+            due_date = rng.choice([None, now - 100, now + 1000 + i])
+            pool.submit(expid, rng.randrange(4), due_date, False, "main")
+
+        def reference(status, now=None):
+            runs = [r for r in pool.runs.values() if r.status == status]
+            if status == RunStatus.pending:
+                runs = [r for r in runs
+                        if r.due_date is None or r.due_date < now]
+            if runs:
+                return max(runs, key=lambda r: r.priority_key())
+            else:
+                return None
+
+        for _ in range(1000):
+            now = time()
+            for status in (RunStatus.pending, RunStatus.prepare_done,
+                           RunStatus.run_done):
+                self.assertIs(pool.top(status, now), reference(status, now))
+            run = rng.choice(list(pool.runs.values()))
+            action = rng.randrange(3)
+            if action == 0:
+                run.status = rng.choice([RunStatus.pending,
+                                         RunStatus.prepare_done,
+                                         RunStatus.run_done])
+            elif action == 1:
+                loop.run_until_complete(pool.delete(run.rid))
+            else:
+                pool.submit(expid, rng.randrange(4), None, False, "main")
+        run = pipeline._prepare._get_run()
+        if isinstance(run, float):
+            self.assertIsNone(pool.top(RunStatus.pending))
+            self.assertLessEqual(run, pool.next_due_date() - now)
+
+    @unittest.skipUnless(artiq_benchmark, "no ARTIQ_BENCHMARK")
+    def test_benchmark_submit(self):
+        loop = self.loop
+        pipeline = self._get_pipeline()
+        expid = _get_expid("EmptyExperiment")
+        n = 50000
+        rng = random.Random(0)
+        now = time()
+
+        t0 = monotonic()
+        for i in range(n):
+            due_date = None if i % 2 else now + rng.uniform(-1, 1)
+            pipeline.pool.submit(expid, rng.randrange(10), due_date, False,
+                                 "main")
+        t1 = monotonic()
+        for _ in range(n):
+            run = pipeline._prepare._get_run()
+            if isinstance(run, float):
+                run = pipeline.pool.top(RunStatus.pending, now + 2)
+            run.status = RunStatus.prepare_done
+            run = pipeline._run._get_run()
+            run.status = RunStatus.run_done
+            run = pipeline._analyze._get_run()
+            run.status = RunStatus.deleting
+            loop.run_until_complete(pipeline.pool.delete(run.rid))
+        t2 = monotonic()
+        print("{} runs: submit {:.1f} us/run, schedule {:.1f} us/run"
+              .format(n, (t1 - t0)*1e6/n, (t2 - t1)*1e6/n))
+
     def tearDown(self):
         self.loop.close()
@@ -1,3 +1,5 @@
+import os
+import time
 import unittest
 import json
 from fractions import Fraction
@@ -7,6 +9,9 @@ import numpy as np
 from artiq.protocols import pyon
 
 
+artiq_benchmark = os.getenv("ARTIQ_BENCHMARK")
+
+
 _pyon_test_object = {
     (1, 2): [(3, 4.2), (2, )],
     "slice": slice(3),
@@ -37,6 +42,66 @@ class PYON(unittest.TestCase):
                 with self.subTest(enc=enc, k=k, v=orig[k]):
                     np.testing.assert_equal(result[k], orig[k])
 
+    def test_encdec_buffers(self):
+        orig = dict(_pyon_test_object)
+        orig["array"] = np.arange(12).reshape(3, 4).T
+        orig["empty"] = np.zeros((0, 3))
+        s, buffers = pyon.encode_buffers(orig)
+        self.assertEqual(len(buffers), 3)
+        result = pyon.decode_buffers(s, [bytearray(b) for b in buffers])
+        for k in orig:
+            with self.subTest(k=k):
+                np.testing.assert_equal(result[k], orig[k])
+        result["array"][0, 0] = 1
+
+    def test_decode_untrusted(self):
+        for s in ("__import__('os')", "x", "(1).__class__", "[1 2]",
+                  "\"a\" + \"b\"", "{1: 2 3: 4}", "(1, ", "'\\N{foo}'",
+                  "b'\\x4'",
+                  "nparray((1000000000000,), \"<f8\", \"\")",
+                  "nparray((-1, 1), \"<f8\", \"\")",
+                  "nparray((2,), \"<f8\", \"AAAAAAAAAAA=\")",
+                  "nparray((2,), \"foo\", \"\")",
+                  "nparray((\"a\",), \"<f8\", \"\")",
+                  "npscalar(\"foo\", \"\")", "npscalar(\"<f8\", \"\")",
+                  "Fraction(\"1e3000000\")", "Fraction(1.5)",
+                  "Fraction(1, 0)", "Fraction(1, 2, 3)", "slice()"):
+            with self.subTest(s=s):
+                with self.assertRaises(ValueError):
+                    pyon.decode(s)
+
+    def test_decode_python(self):
+        for s in ("(-0-1j)", "1e+100j", "-(1.5)", "'a\\/b'", "{\"a\\/b\": [1]}",
+                  "b'\\x00'", "{1, 2}", "{}", "(1, )", "()", "[1, 2, ]",
+                  "slice(None, 3, None)", "Fraction(3, 4)", "True", "None",
+                  "{\"a\": [(1, 2), {\"b\": null}], 3: \"\\t\"}", "0x10"):
+            with self.subTest(s=s):
+                self.assertEqual(pyon.decode(s), eval(s, dict(pyon._functions),
+                                                      dict(pyon._constants)))
+
+    @unittest.skipUnless(artiq_benchmark, "no ARTIQ_BENCHMARK")
+    def test_benchmark_decode(self):
+        eval_dict = dict(pyon._functions)
+        eval_dict.update(pyon._constants)
+        eval_dict["__builtins__"] = {}
+        objects = {
+            "array": {"x": np.random.rand(1000000)},
+            "list": {"x": np.random.rand(100000).tolist()},
+            "scalars": {"x{}".format(i): (i, i*0.5, "y", None)
+                        for i in range(10000)},
+            "dataset_db": {"x{}".format(i): (True, np.random.rand(100))
+                           for i in range(1000)}
+        }
+        for name, obj in sorted(objects.items()):
+            s = pyon.encode(obj, True)
+            for decoder, decode in (("eval", lambda: eval(s, eval_dict, {})),
+                                    ("pyon", lambda: pyon.decode(s))):
+                t0 = time.perf_counter()
+                decode()
+                t = time.perf_counter() - t0
+                print("{} {}: {:.1f} MB/s".format(name, decoder,
+                                                  len(s)/t/1e6))
+
 
 _json_test_object = {
     "a": "b",
@@ -0,0 +1,81 @@
+import unittest
+import os
+import tempfile
+
+import numpy as np
+
+from artiq.protocols.shared_memory import SegmentWriter, decode_segments
+
+
+class SharedMemoryCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.writer = SegmentWriter(min_size=1024,
+                                    directory=self.directory.name)
+
+    def tearDown(self):
+        self.writer.close()
+        self.assertEqual(os.listdir(self.directory.name), [])
+        self.directory.cleanup()
+
+    def test_roundtrip(self):
+        obj = {"action": "setitem", "key": "x", "path": [],
+               "value": (True, np.arange(1000, dtype=np.float64)),
+               "small": np.arange(10)}
+        s, segments = self.writer.encode(obj, "applet")
+        self.assertEqual(len(segments), 1)
+        self.assertEqual(segments[0][1], 8000)
+        self.assertEqual(os.stat(segments[0][0]).st_mode & 0o777, 0o600)
+
+        decoded = decode_segments(s, segments)
+        self.assertEqual(decoded["key"], "x")
+        np.testing.assert_array_equal(decoded["value"][1], obj["value"][1])
+        np.testing.assert_array_equal(decoded["small"], obj["small"])
+
+        # the mapping is private to the recipient
+        decoded["value"][1][0] = 42
+        self.assertEqual(decode_segments(s, segments)["value"][1][0], 0)
+
+        self.writer.release("applet", [path for path, _ in segments])
+        self.assertEqual(os.listdir(self.directory.name), [])
+        # data stays mapped after the segment is deleted
+        self.assertEqual(decoded["value"][1][999], 999)
+
+    def test_no_segments(self):
+        s, segments = self.writer.encode({"x": np.arange(10)}, "applet")
+        self.assertEqual(segments, [])
+        np.testing.assert_array_equal(decode_segments(s, segments)["x"],
+                                      np.arange(10))
+
+    def test_share(self):
+        obj = {"value": np.zeros(1000)}
+        s1, segments1 = self.writer.encode(obj, "applet1", share=True)
+        s2, segments2 = self.writer.encode(obj, "applet2", share=True)
+        self.assertEqual((s1, segments1), (s2, segments2))
+        paths = [path for path, _ in segments1]
+
+        self.writer.release("applet1", paths)
+        self.assertEqual(len(os.listdir(self.directory.name)), 1)
+        self.assertIsNotNone(self.writer._last)
+        self.writer.release("applet2", paths)
+        self.assertEqual(os.listdir(self.directory.name), [])
+        # the object is not kept alive after its segments are released
+        self.assertIsNone(self.writer._last)
+
+        # released segments are not reused
+        s3, segments3 = self.writer.encode(obj, "applet1", share=True)
+        self.assertNotEqual(segments3, segments1)
+        np.testing.assert_array_equal(decode_segments(s3, segments3)["value"],
+                                      obj["value"])
+
+        # unshared objects always get new segments
+        _, segments4 = self.writer.encode(obj, "applet2")
+        self.assertNotEqual(segments4, segments3)
+
+    def test_release_all(self):
+        self.writer.encode({"value": np.zeros(1000)}, "applet1", share=True)
+        self.writer.encode({"value": np.zeros(1000)}, "applet2", share=True)
+        self.writer.release_all("applet1")
+        self.assertEqual(len(os.listdir(self.directory.name)), 1)
+        self.writer.release_all("applet2")
+        self.assertEqual(os.listdir(self.directory.name), [])
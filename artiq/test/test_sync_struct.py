@@ -46,16 +46,17 @@ class SyncStructCase(unittest.TestCase):
         self.loop = asyncio.new_event_loop()
         asyncio.set_event_loop(self.loop)
 
-    async def _do_test_recv(self):
+    async def _do_test_recv(self, binary, **kwargs):
         self.receiving_done = asyncio.Event()
 
         test_dict = sync_struct.Notifier(dict())
-        publisher = sync_struct.Publisher({"test": test_dict})
+        publisher = sync_struct.Publisher({"test": test_dict}, **kwargs)
         await publisher.start(test_address, test_port)
 
         subscriber = sync_struct.Subscriber("test", self.init_test_dict,
-                                            self.notify)
+                                            self.notify, binary=binary)
         await subscriber.connect(test_address, test_port)
+        self.assertEqual(subscriber.binary_mode, binary)
 
         write_test_data(test_dict)
         await self.receiving_done.wait()
@@ -66,7 +67,81 @@ class SyncStructCase(unittest.TestCase):
         self.assertEqual(self.received_dict, test_dict.read)
 
     def test_recv(self):
-        self.loop.run_until_complete(self._do_test_recv())
+        self.loop.run_until_complete(self._do_test_recv(False))
+
+    def test_recv_binary(self):
+        self.loop.run_until_complete(self._do_test_recv(True))
+
+    def test_recv_coalesce(self):
+        self.loop.run_until_complete(self._do_test_recv(
+            False, coalesce_window=0.1))
+
+    def test_recv_resync(self):
+        self.loop.run_until_complete(self._do_test_recv(
+            True, coalesce_window=0.1, max_backlog=100))
+
+    async def _do_test_coalesce(self):
+        self.receiving_done = asyncio.Event()
+        mods = []
+
+        test_dict = sync_struct.Notifier(dict())
+        publisher = sync_struct.Publisher({"test": test_dict},
+                                          coalesce_window=0.1)
+        await publisher.start(test_address, test_port)
+
+        subscriber = sync_struct.Subscriber(
+            "test", self.init_test_dict, [mods.append, self.notify])
+        await subscriber.connect(test_address, test_port)
+
+        test_dict["array"] = np.zeros(10)
+        for i in range(1000):
+            test_dict["x"] = i
+            test_dict["array"][i % 10] = i
+        test_dict["list"] = [1, 2]
+        test_dict["list"][-1] = 3
+        test_dict["list"].append(4)
+        test_dict["list"][-1] = 5
+        test_dict["finished"] = True
+        await self.receiving_done.wait()
+
+        await subscriber.close()
+        await publisher.stop()
+
+        self.assertEqual(self.received_dict["x"], 999)
+        np.testing.assert_equal(self.received_dict["array"],
+                                test_dict.read["array"])
+        self.assertEqual(self.received_dict["list"], [1, 3, 5])
+        self.assertLess(len(mods), 20)
+
+    def test_coalesce(self):
+        self.loop.run_until_complete(self._do_test_coalesce())
+
+    async def _do_test_no_coalesce(self):
+        self.receiving_done = asyncio.Event()
+        mods = []
+
+        test_dict = sync_struct.Notifier(dict())
+        publisher = sync_struct.Publisher({"test": test_dict})
+        await publisher.start(test_address, test_port)
+
+        subscriber = sync_struct.Subscriber(
+            "test", self.init_test_dict, [mods.append, self.notify])
+        await subscriber.connect(test_address, test_port)
+
+        for i in range(100):
+            test_dict["x"] = i
+        test_dict["finished"] = True
+        await self.receiving_done.wait()
+
+        await subscriber.close()
+        await publisher.stop()
+
+        self.assertEqual([mod["value"] for mod in mods
+                          if mod["action"] == "setitem" and mod["key"] == "x"],
+                         list(range(100)))
+
+    def test_no_coalesce(self):
+        self.loop.run_until_complete(self._do_test_no_coalesce())
 
     def tearDown(self):
         self.loop.close()
@@ -1,10 +1,38 @@
 # Copyright (C) 2014, 2015 Robert Jordens <jordens@gmail.com>
 
+import os
+import time
 import unittest
 
+import numpy as np
+
 from artiq.wavesynth import compute_samples
 
 
+artiq_benchmark = os.getenv("ARTIQ_BENCHMARK")
+
+
+def random_program(nchannels, nlines, max_duration, seed=0):
+    rng = np.random.RandomState(seed)
+    scale = np.array([1., 1e-3, 1e-6, 1e-9])
+    frame = []
+    for i in range(nlines):
+        channel_data = []
+        for j in range(nchannels):
+            n, m, k = rng.randint(1, 5, 3)
+            channel_data.append({
+                "bias": {"amplitude": list(rng.normal(size=n)*scale[:n])},
+                "dds": {"amplitude": list(rng.normal(size=m)*scale[:m]),
+                        "phase": list(rng.uniform(size=k)*scale[:k]),
+                        "clear": bool(rng.randint(2))},
+                "silence": not rng.randint(4)
+            })
+        frame.append({"duration": int(rng.randint(max_duration)),
+                      "channel_data": channel_data,
+                      "trigger": i % 50 == 0})
+    return [frame]
+
+
 class TestSynthesizer(unittest.TestCase):
     program = [
         [
@@ -119,6 +147,48 @@ class TestSynthesizer(unittest.TestCase):
     def test_run(self):
         x, y = self.drive()
 
+    def test_vectorized(self):
+        x, y = self.drive()
+        self.dev = compute_samples.Synthesizer(1, self.program,
+                                               vectorized=False)
+        x, y_ref = self.drive()
+        np.testing.assert_allclose(y, y_ref, rtol=0, atol=1e-9)
+
+    def _trigger_all(self, dev):
+        dev.select(0)
+        r = []
+        while dev.line_iter is not None:
+            r.append(dev.trigger())
+        return np.concatenate(r, axis=1)
+
+    def test_vectorized_random(self):
+        program = random_program(4, 200, 1000)
+        y = self._trigger_all(compute_samples.Synthesizer(4, program))
+        y_ref = self._trigger_all(
+            compute_samples.Synthesizer(4, program, vectorized=False))
+        np.testing.assert_allclose(y, y_ref, rtol=0, atol=1e-9)
+
+        # bias only: exact
+        for line in program[0]:
+            for channel_data in line["channel_data"]:
+                del channel_data["dds"]
+        y = self._trigger_all(compute_samples.Synthesizer(4, program))
+        y_ref = self._trigger_all(
+            compute_samples.Synthesizer(4, program, vectorized=False))
+        np.testing.assert_array_equal(y, y_ref)
+
+    @unittest.skipUnless(artiq_benchmark, "no ARTIQ_BENCHMARK")
+    def test_benchmark(self):
+        # 8 channels, 10 ms at 100 MHz
+        program = random_program(8, 1000, 2000)
+        for vectorized in True, False:
+            dev = compute_samples.Synthesizer(8, program, vectorized)
+            t0 = time.monotonic()
+            y = self._trigger_all(dev)
+            t1 = time.monotonic()
+            print("{} samples x {} channels, vectorized={}: {:.2f} s".format(
+                y.shape[1], y.shape[0], vectorized, t1 - t0))
+
     @unittest.skip("manual/visual test")
     def test_plot(self):
         from matplotlib import pyplot as plt
@@ -3,6 +3,7 @@ import logging
 import asyncio
 import sys
 import os
+import tempfile
 from time import sleep
 
 from artiq.experiment import *
@@ -63,16 +64,62 @@ async def _call_worker(worker, expid):
         await worker.close()
 
 
-def _run_experiment(class_name):
-    expid = {
+def _get_expid(class_name):
+    return {
         "log_level": logging.WARNING,
         "file": sys.modules[__name__].__file__,
         "class_name": class_name,
         "arguments": dict()
     }
+
+
+def _run_experiment(class_name):
     loop = asyncio.get_event_loop()
     worker = Worker({})
-    loop.run_until_complete(_call_worker(worker, expid))
+    loop.run_until_complete(_call_worker(worker, _get_expid(class_name)))
+
+
+_helper_experiment = """
+import os
+import sys
+
+from artiq.experiment import *
+
+# the helper is outside of the directory of the experiment
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "lib"))
+import worker_test_helper
+sys.path.pop(0)
+
+
+class HelperExperiment(EnvExperiment):
+    def build(self):
+        pass
+
+    def run(self):
+        with open(os.path.join(os.path.dirname(__file__), "..", "value"),
+                  "w") as f:
+            f.write(str(worker_test_helper.value))
+"""
+
+
+async def _pooled_run(pool, class_name, wd=None, expid=None):
+    # Returns the PID of the worker process that ran the experiment.
+    while not pool._idle:
+        await asyncio.sleep(0.01)
+    worker = Worker({}, pool=pool)
+    if expid is None:
+        expid = _get_expid(class_name)
+    try:
+        await worker.build(0, "main", wd, expid, 0)
+        pid = worker.ipc.process.pid
+        await worker.prepare()
+        await worker.run()
+        await worker.analyze()
+    except WorkerInternalException:
+        pid = None
+    finally:
+        await worker.close()
+    return pid
 
 
 class WorkerCase(unittest.TestCase):
@@ -105,5 +152,53 @@ class WorkerCase(unittest.TestCase):
         with self.assertRaises(WorkerWatchdogTimeout):
             _run_experiment("WatchdogTimeoutInBuild")
 
+    def test_pool(self):
+        pool = WorkerPool(size=1, max_runs=2)
+        pool.start()
+        try:
+            pids = [self.loop.run_until_complete(
+                        _pooled_run(pool, "SimpleExperiment"))
+                    for _ in range(3)]
+            # recycled after a run, replaced after max_runs
+            self.assertEqual(pids[0], pids[1])
+            self.assertNotEqual(pids[1], pids[2])
+
+            with self.assertLogs():
+                self.loop.run_until_complete(
+                    _pooled_run(pool, "ExceptionTermination"))
+            pid = self.loop.run_until_complete(
+                _pooled_run(pool, "SimpleExperiment"))
+            self.assertNotIn(pid, pids)
+        finally:
+            self.loop.run_until_complete(pool.close())
+
+    def test_pool_reimport(self):
+        pool = WorkerPool(size=1, max_runs=2)
+        pool.start()
+        with tempfile.TemporaryDirectory() as wd:
+            os.mkdir(os.path.join(wd, "experiments"))
+            os.mkdir(os.path.join(wd, "lib"))
+            with open(os.path.join(wd, "experiments", "helper.py"), "w") as f:
+                f.write(_helper_experiment)
+            expid = {
+                "log_level": logging.WARNING,
+                "file": os.path.join("experiments", "helper.py"),
+                "class_name": "HelperExperiment",
+                "arguments": dict()
+            }
+            try:
+                pids = []
+                for value in 1, 22:
+                    with open(os.path.join(wd, "lib",
+                                           "worker_test_helper.py"), "w") as f:
+                        f.write("value = {}\n".format(value))
+                    pids.append(self.loop.run_until_complete(
+                        _pooled_run(pool, None, wd, expid)))
+                    with open(os.path.join(wd, "value")) as f:
+                        self.assertEqual(f.read(), str(value))
+                self.assertEqual(pids[0], pids[1])
+            finally:
+                self.loop.run_until_complete(pool.close())
+
     def tearDown(self):
         self.loop.close()
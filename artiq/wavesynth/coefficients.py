@@ -1,9 +1,50 @@
 # Copyright (C) 2014, 2015 Robert Jordens <jordens@gmail.com>
 
+import hashlib
+from collections import OrderedDict
+
 import numpy as np
 from scipy.interpolate import splrep, splev, spalde
 
 
+class _Memo:
+    """Least recently used cache of at most `size` values."""
+    def __init__(self, size):
+        self.size = size
+        self.entries = OrderedDict()
+
+    def get(self, key, compute):
+        try:
+            self.entries.move_to_end(key)
+            return self.entries[key]
+        except KeyError:
+            pass
+        value = compute()
+        if self.size > 0:
+            self.entries[key] = value
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        self.entries.clear()
+
+
+# Spline fits, by digest of the data.
+spline_fits = _Memo(32)
+# Coefficient tables of segments, by spline data digest and sampling.
+segment_coefficients = _Memo(256)
+
+
+def _digest(*arrays):
+    h = hashlib.sha1()
+    for a in arrays:
+        a = np.ascontiguousarray(a)
+        h.update(str((a.dtype.str, a.shape)).encode())
+        h.update(a.data)
+    return h.hexdigest()
+
+
 class UnivariateMultiSpline:
     """Multidimensional wrapper around `scipy.interpolate.sp*` functions.
     `scipy.inteprolate.splprep` is limited to 12 dimensions.
@@ -131,19 +172,64 @@ class CoefficientSource:
         :param scale: see `scale_x()`.
         :param cutoff: coefficient cutoff towards zero to compress data.
         """
-        x = self.crop_x(start, stop)
-        x_sample, durations = self.scale_x(x, scale)
-        coefficients = self(x_sample)
-        if len(x_sample) == 1 and start == stop:
-            coefficients = coefficients[:1]
-        # rescale coefficients accordingly
-        coefficients *= (scale*np.sign(durations))**np.arange(
-            coefficients.shape[0])[:, None, None]
-        if cutoff:
-            coefficients[np.fabs(coefficients) < cutoff] = 0
-        return build_segment(np.fabs(durations), coefficients, target=target,
+        durations, coefficients = self.get_coefficients(
+            start, stop, scale, cutoff=cutoff)
+        return build_segment(durations, coefficients, target=target,
                              variable=variable)
 
+    def get_coefficients(self, start, stop, scale, *, cutoff=1e-12):
+        """Sample and scale the coefficients of a segment.
+
+        See `get_segment()` for arguments.
+
+        :return: `durations`, the line durations, and `coefficients`, the
+            coefficients of the lines (see `build_segment()`).
+        """
+        return self.get_coefficients_batch(start, stop, [scale],
+                                           cutoff=cutoff)[0]
+
+    def get_coefficients_batch(self, start, stop, scales, *, cutoff=1e-12):
+        """Sample and scale the coefficients of segments with several
+        scales at once.
+
+        The source is sampled only once at the union of the sample
+        positions of all scales.
+
+        :return: List of `(durations, coefficients)` for each scale (see
+            `get_coefficients()`).
+        """
+        x = self.crop_x(start, stop)
+        samples = [self.scale_x(x, scale) for scale in scales]
+        x_all, inverse = np.unique(np.concatenate([x for x, _ in samples]),
+                                   return_inverse=True)
+        coefficients_all = self(x_all)
+        r = []
+        i = 0
+        for scale, (x_sample, durations) in zip(scales, samples):
+            coefficients = coefficients_all[
+                :, :, inverse[i:i + len(x_sample)]]
+            i += len(x_sample)
+            if len(x_sample) == 1 and start == stop:
+                coefficients = coefficients[:1]
+            # rescale coefficients accordingly
+            coefficients *= (scale*np.sign(durations))**np.arange(
+                coefficients.shape[0])[:, None, None]
+            if cutoff:
+                coefficients[np.fabs(coefficients) < cutoff] = 0
+            r.append((np.fabs(durations), coefficients))
+        return r
+
+    def get_segments(self, start, stop, scales, *, cutoff=1e-12,
+                     target="bias", variable="amplitude"):
+        """Build wavesynth segments for several scales at once.
+
+        See `get_segment()` and `get_coefficients_batch()`.
+        """
+        return [build_segment(durations, coefficients, target=target,
+                              variable=variable)
+                for durations, coefficients in self.get_coefficients_batch(
+                    start, stop, scales, cutoff=cutoff)]
+
     def extend_segment(self, segment, *args, **kwargs):
         """Extend a wavesynth segment.
 
@@ -171,7 +257,10 @@ class SplineSource(CoefficientSource):
             self.y = pad_const(self.y, order, axis=1)
 
         assert self.y.shape[1] == self.x.shape[0]
-        self.spline = UnivariateMultiSpline(self.x, self.y, order=order)
+        self.digest = _digest(self.x, self.y, np.array(order))
+        self.spline = spline_fits.get(
+            self.digest,
+            lambda: UnivariateMultiSpline(self.x, self.y, order=order))
 
     def crop_x(self, start, stop):
         ia, ib = np.searchsorted(self.x, (start, stop))
@@ -214,6 +303,28 @@ class SplineSource(CoefficientSource):
     def __call__(self, x):
         return self.spline(x)
 
+    def get_coefficients_batch(self, start, stop, scales, *, cutoff=1e-12):
+        """See `CoefficientSource.get_coefficients_batch()`.
+
+        The results are cached, by spline data and sampling, in
+        `segment_coefficients`. They must not be modified.
+        """
+        r = dict()
+        for scale in scales:
+            key = self.digest, start, stop, scale, cutoff
+            if key in segment_coefficients.entries:
+                r[scale] = segment_coefficients.get(key, None)
+        missing = [scale for scale in scales if scale not in r]
+        if missing:
+            batch = super().get_coefficients_batch(start, stop, missing,
+                                                   cutoff=cutoff)
+            for scale, value in zip(missing, batch):
+                for a in value:
+                    a.flags.writeable = False
+                key = self.digest, start, stop, scale, cutoff
+                r[scale] = segment_coefficients.get(key, lambda: value)
+        return [r[scale] for scale in scales]
+
 
 def discrete_compensate(c):
     """Compensate spline coefficients for discrete accumulators
@@ -4,6 +4,8 @@
 from copy import copy
 from math import cos, pi
 
+import numpy as np
+
 from artiq.wavesynth.coefficients import discrete_compensate
 
 
@@ -74,13 +76,117 @@ class Channel:
         self.silence = s
 
 
+class Channels:
+    """Sample-by-sample reference evaluation of the lines of all channels."""
+    def __init__(self, nchannels):
+        self.channels = [Channel() for _ in range(nchannels)]
+
+    def line(self, line):
+        for channel, channel_data in zip(self.channels,
+                                         line["channel_data"]):
+            channel.set_silence(channel_data.get("silence", False))
+            if "bias" in channel_data:
+                channel.bias.set_coefficients(
+                    channel_data["bias"]["amplitude"])
+            if "dds" in channel_data:
+                channel.dds.amplitude.set_coefficients(
+                    channel_data["dds"]["amplitude"])
+                if "phase" in channel_data["dds"]:
+                    channel.dds.phase.set_coefficients(
+                        channel_data["dds"]["phase"])
+                if channel_data["dds"].get("clear", False):
+                    channel.dds.phase.clear()
+
+        return [[channel.next() for i in range(line["duration"])]
+                for channel in self.channels]
+
+
+def _compensated(c, order=4):
+    c = list(c)
+    discrete_compensate(c)
+    return c + [0.]*(order - len(c))
+
+
+def _accumulate(c, n):
+    # Evaluates the accumulator chains c (one per row) for n steps, as
+    # Spline.next() does: c[i] += c[i + 1] at each step.
+    # Returns the n values of c[:, 0] and the state after n steps.
+    state = c.copy()
+    acc = np.broadcast_to(c[:, -1:], (c.shape[0], n + 1))
+    for i in reversed(range(c.shape[1] - 1)):
+        prev = np.empty((c.shape[0], n + 1))
+        prev[:, 0] = c[:, i]
+        prev[:, 1:] = acc[:, :n]
+        acc = np.cumsum(prev, axis=1, out=prev)
+        state[:, i] = acc[:, n]
+    return acc[:, :n], state
+
+
+class ChannelArray:
+    """Vectorized evaluation of the lines of all channels.
+
+    Each line is evaluated for all channels at once, with the accumulators
+    of the splines expanded into cumulative sums. Bias and amplitude match
+    :class:`Channels` exactly. The phase accumulators are only wrapped
+    into [0, 1) at the end of each line instead of at every step, which
+    causes rounding differences of the order of ``duration*2**-52`` turns
+    in the phase."""
+    def __init__(self, nchannels, order=4):
+        # bias, DDS amplitude and DDS phase accumulators of each channel
+        self.c = np.zeros((3, nchannels, order))
+        self.phase_offset = np.zeros(nchannels)
+        self.silence = np.zeros(nchannels, bool)
+        self.v = np.zeros(nchannels)
+
+    def line(self, line):
+        bias, amplitude, phase = self.c
+        order = self.c.shape[2]
+        for i, channel_data in enumerate(line["channel_data"][:len(self.v)]):
+            self.silence[i] = channel_data.get("silence", False)
+            if "bias" in channel_data:
+                bias[i] = _compensated(
+                    channel_data["bias"]["amplitude"] or [0.], order)
+            if "dds" in channel_data:
+                amplitude[i] = _compensated(
+                    channel_data["dds"]["amplitude"] or [0.], order)
+                if "phase" in channel_data["dds"]:
+                    c = channel_data["dds"]["phase"] or [0.]
+                    self.phase_offset[i] = c[0]
+                    phase[i, 1:] = _compensated(c[1:], order - 1)
+                if channel_data["dds"].get("clear", False):
+                    phase[i, 0] = 0.
+
+        n = line["duration"]
+        shape = self.c.shape
+        samples, state = _accumulate(self.c.reshape(-1, order), n)
+        self.c = state.reshape(shape)
+        self.c[2, :, :-1] %= 1.
+        bias, amplitude, phase = samples.reshape(shape[:2] + (n,))
+        v = bias + amplitude*np.cos(
+            2*pi*(phase + self.phase_offset[:, None]))
+
+        v[self.silence] = self.v[self.silence, None]
+        if n:
+            self.v = v[:, -1].copy()
+        return v
+
+
 class TriggerError(Exception):
     pass
 
 
 class Synthesizer:
-    def __init__(self, nchannels, program):
-        self.channels = [Channel() for _ in range(nchannels)]
+    """Computes the samples generated by a wavesynth program.
+
+    :param vectorized: evaluate the lines with :class:`ChannelArray`
+        instead of sample by sample with :class:`Channels`.
+    """
+    def __init__(self, nchannels, program, vectorized=True):
+        if vectorized:
+            self.channels = ChannelArray(nchannels)
+        else:
+            self.channels = Channels(nchannels)
+        self.nchannels = nchannels
         self.program = program
         # line_iter is None: "wait for segment selection" state
         # otherwise: iterator on the current position in the frame
@@ -92,6 +198,11 @@ class Synthesizer:
         self.line_iter = iter(self.program[selection])
         self.line = next(self.line_iter)
 
+    def _samples(self, r):
+        return np.concatenate(
+            [np.reshape(ri, (self.nchannels, -1)) for ri in r],
+            axis=1).tolist()
+
     def trigger(self):
         if self.line_iter is None:
             raise TriggerError("no frame selected")
@@ -100,34 +211,17 @@ class Synthesizer:
         if not line.get("trigger", False):
             raise TriggerError("segment is not triggered")
 
-        r = [[] for _ in self.channels]
+        r = []
         while True:
-            for channel, channel_data in zip(self.channels,
-                                             line["channel_data"]):
-                channel.set_silence(channel_data.get("silence", False))
-                if "bias" in channel_data:
-                    channel.bias.set_coefficients(
-                        channel_data["bias"]["amplitude"])
-                if "dds" in channel_data:
-                    channel.dds.amplitude.set_coefficients(
-                        channel_data["dds"]["amplitude"])
-                    if "phase" in channel_data["dds"]:
-                        channel.dds.phase.set_coefficients(
-                            channel_data["dds"]["phase"])
-                    if channel_data["dds"].get("clear", False):
-                        channel.dds.phase.clear()
-
             if line.get("dac_divider", 1) != 1:
                 raise NotImplementedError
 
-            for channel, rc in zip(self.channels, r):
-                for i in range(line["duration"]):
-                    rc.append(channel.next())
+            r.append(self.channels.line(line))
 
             try:
                 self.line = line = next(self.line_iter)
                 if line.get("trigger", False):
-                    return r
+                    return self._samples(r)
             except StopIteration:
                 self.line_iter = None
-                return r
+                return self._samples(r)